@@ -0,0 +1,220 @@
+"""
+Benchmark suite for the dash server, run against a synthetic log directory.
+
+Each benchmark runs in a fresh process so that the peak RSS we report belongs
+to that benchmark alone. We report p50/p99 latency in milliseconds and the
+peak resident set size in MB.
+
+Usage
+-----
+
+    python -m dash_server_specs.create_large_logdir --root ~/ml-dash-bench --runs 200 --steps 10000
+    python -m dash_server_specs.benchmarks --root ~/ml-dash-bench --runs 200 --bench-out bench.json
+
+The benchmarks take the shape of the logdir (`--users`, `--projects`, `--runs`) from
+the same `LogdirSpec` flags as `create_large_logdir`, so pass the ones it was written with.
+
+Pass `--bench-baseline bench.json` to compare against an earlier run. Benchmarks
+that got slower than the tolerance are reported, and the script exits non-zero.
+"""
+import asyncio
+import json
+import sys
+import time
+from os.path import expanduser, join
+
+from params_proto import ParamsProto, Proto, Flag
+
+from dash_server_specs.create_large_logdir import LogdirSpec, metric_names
+
+
+class BenchArgs(ParamsProto):
+    """Options for the benchmark runner."""
+    repeat = Proto(20, help="number of timed calls per benchmark")
+    warmup = Proto(2, help="number of untimed calls before timing")
+    k = Proto(100, help="number of points to request from the series benchmarks")
+    only = Proto(None, dtype=str, help="comma-separated list of benchmarks to run")
+    isolate = Proto(True, help="run each benchmark in its own process, for per-benchmark peak RSS")
+    bench_out = Proto(None, dtype=str, help="write the results to this json file")
+    bench_baseline = Proto(None, dtype=str, help="json results to compare against")
+    tolerance = Proto(0.2, help="allowed p50 slow-down against the baseline, as a fraction")
+    verbose = Flag("keep the server's own stdout logging")
+
+
+def project_id():
+    return "/user_000/project_000"
+
+
+def sweep_id():
+    return join(project_id(), "sweep")
+
+
+def run_id(i=0):
+    return join(sweep_id(), f"run_{i:05d}")
+
+
+def bench_find_experiments():
+    from ml_dash.schema.experiments import find_experiments
+    return lambda: find_experiments(cwd=project_id(), stop=LogdirSpec.runs)
+
+
+def bench_get_series():
+    from ml_dash.schema.files.series import get_series
+    metrics_files = [join(run_id(i), "metrics.pkl")
+                     for i in range(min(LogdirSpec.runs, 20))]
+    y_key = metric_names(LogdirSpec.metric_keys)[0]
+
+    def fn():
+        series = get_series(metrics_files=metrics_files, k=BenchArgs.k, x_key="step", y_key=y_key)
+        return series.resolve_y_mean(None)
+
+    return fn
+
+
+def bench_parameters():
+    from ml_dash.schema.files.parameters import Parameters
+    parameters = Parameters(id=join(run_id(), "parameters.pkl"))
+    return lambda: parameters.resolve_flat(None)
+
+
+def bench_list_directory():
+    from ml_dash.schema.directories import get_directory
+    directory = get_directory(sweep_id())
+
+    def fn():
+        directory.resolve_directories(None)
+        directory.resolve_files(None)
+
+    return fn
+
+
+def bench_get_path_records():
+    from types import SimpleNamespace
+    from ml_dash.file_handlers import get_path
+    request = SimpleNamespace(args={"records": "1", "reservoir": "200"})
+    file_path = join(run_id(), "metrics.pkl")[1:]
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(get_path(request, file_path))
+
+
+BENCHMARKS = dict(
+    find_experiments=bench_find_experiments,
+    get_series=bench_get_series,
+    parameters=bench_parameters,
+    list_directory=bench_list_directory,
+    get_path_records=bench_get_path_records,
+)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    i = min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)
+    return values[i]
+
+
+def peak_rss_mb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # note: ru_maxrss is in bytes on macOS, and in kilobytes on linux.
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def run_benchmark(name, root, repeat=None, warmup=None):
+    """
+    times one benchmark in the current process.
+
+    :param name: key in BENCHMARKS
+    :param root: the logdir the server reads from
+    :return: dict with p50_ms, p99_ms and peak_rss_mb
+    """
+    import contextlib, io
+    from ml_dash.config import Args
+
+    repeat = BenchArgs.repeat if repeat is None else repeat
+    warmup = BenchArgs.warmup if warmup is None else warmup
+
+    # note: the server logs every file it globs. Silence it so we time the work, not the terminal.
+    quiet = contextlib.nullcontext() if BenchArgs.verbose else contextlib.redirect_stdout(io.StringIO())
+    logdir, Args.logdir = Args.logdir, expanduser(root)
+    try:
+        with quiet:
+            fn = BENCHMARKS[name]()
+            for _ in range(warmup):
+                fn()
+            latencies = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                latencies.append((time.perf_counter() - t0) * 1000)
+    finally:
+        Args.logdir = logdir
+
+    return dict(name=name,
+                runs=LogdirSpec.runs,
+                repeat=repeat,
+                p50_ms=percentile(latencies, 50),
+                p99_ms=percentile(latencies, 99),
+                peak_rss_mb=peak_rss_mb())
+
+
+def _run_isolated(name, root, spec, bench_args):
+    # note: hand the parsed command line over, rather than counting on the new process to parse it again.
+    LogdirSpec._update(spec)
+    BenchArgs._update(bench_args)
+    return run_benchmark(name, root)
+
+
+def run_all(root=None, names=None):
+    root = root or LogdirSpec.root
+    names = names or [*BENCHMARKS.keys()]
+    results = []
+    for name in names:
+        if BenchArgs.isolate:
+            from multiprocessing import get_context
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                results.append(pool.submit(_run_isolated, name, root, vars(LogdirSpec), vars(BenchArgs)).result())
+        else:
+            results.append(run_benchmark(name, root))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """returns the list of benchmarks whose p50 got slower than the tolerance."""
+    previous = {r['name']: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(r['name'])
+        if old and old['p50_ms'] and r['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            regressions.append(dict(name=r['name'], p50_ms=r['p50_ms'], baseline_p50_ms=old['p50_ms']))
+    return regressions
+
+
+def report(results):
+    lines = [f"{'benchmark':<20} {'n':>5} {'p50 (ms)':>10} {'p99 (ms)':>10} {'peak RSS (MB)':>14}"]
+    for r in results:
+        lines.append(f"{r['name']:<20} {r['repeat']:>5} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} "
+                     f"{r['peak_rss_mb']:>14.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from termcolor import cprint
+
+    names = BenchArgs.only.split(',') if BenchArgs.only else None
+    results = run_all(names=names)
+    print(report(results))
+
+    if BenchArgs.bench_out:
+        with open(BenchArgs.bench_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if BenchArgs.bench_baseline:
+        with open(BenchArgs.bench_baseline, 'r') as f:
+            regressions = compare(results, json.load(f), BenchArgs.tolerance)
+        for r in regressions:
+            cprint(f"regression in {r['name']}: p50 {r['baseline_p50_ms']:.2f}ms -> {r['p50_ms']:.2f}ms", "red")
+        if regressions:
+            sys.exit(1)
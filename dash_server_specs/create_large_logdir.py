@@ -0,0 +1,145 @@
+"""
+Deterministic generator for large, ml_logger-format log directories.
+
+`create_experiments.py` only makes a handful of tiny runs. This script writes
+the same on-disk layout (pickled `parameters.pkl` and `metrics.pkl` record
+streams, figures and a text log) directly, without going through the logging
+client, so that we can produce trees with 100k runs or 1M-step metrics files
+for the benchmark suite in `dash_server_specs.benchmarks`.
+
+Usage
+-----
+
+    python -m dash_server_specs.create_large_logdir --root ~/ml-dash-bench --runs 1000 --steps 10000
+
+The same spec always produces byte-identical files.
+"""
+import os
+import pickle
+from os.path import expanduser, join
+
+import numpy as np
+from params_proto import ParamsProto, Proto, Flag
+
+
+class LogdirSpec(ParamsProto):
+    """Shape of the synthetic log directory."""
+    root = Proto(expanduser('~/ml-dash-bench'), help="the directory to write the runs into")
+    users = Proto(2, help="number of users")
+    projects = Proto(2, help="number of projects per user")
+    runs = Proto(8, help="number of runs per project")
+    steps = Proto(100, help="number of metric records per run")
+    metric_keys = Proto(3, help="number of metric keys per record, besides `step`")
+    figures = Proto(2, help="number of figure files per run")
+    seed = Proto(0, help="the random seed. The same seed gives identical files.")
+    clean = Flag("remove the root directory before writing")
+
+
+LEARNING_RATES = [1e-2, 3e-3, 1e-3, 3e-4]
+# the number of metric records that are pickled and written at once.
+BATCH_SIZE = 10_000
+SEEDS = [100, 200, 300, 400, 500]
+
+# a minimal 1x1 PNG, so that the figure files are real images.
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360000002000100e221bc330000000049454e44ae426082")
+
+
+def run_prefix(user, project, run):
+    return join(f"user_{user:03d}", f"project_{project:03d}", "sweep", f"run_{run:05d}")
+
+
+def metric_names(n):
+    return ["loss", "success_rate", *[f"metric_{i:02d}" for i in range(max(n - 2, 0))]][:n]
+
+
+def run_parameters(run, seed):
+    return dict(Args=dict(lr=LEARNING_RATES[run % len(LEARNING_RATES)],
+                          seed=SEEDS[(run // len(LEARNING_RATES)) % len(SEEDS)],
+                          env_id="GoalMassDiscreteIdLess-v0",
+                          batch_size=32,
+                          run_id=run),
+                Meta=dict(generator="create_large_logdir", spec_seed=seed))
+
+
+def write_run(path, run, rng, spec=LogdirSpec):
+    """
+    write one run in the ml_logger on-disk format.
+
+    :param path: the absolute path to the run directory
+    :param run: the index of the run inside its project
+    :param rng: a seeded numpy random generator
+    :param spec: the logdir spec
+    :return: None
+    """
+    os.makedirs(join(path, "figures"), exist_ok=True)
+
+    with open(join(path, "parameters.pkl"), "wb") as f:
+        pickle.dump(run_parameters(run, spec.seed), f)
+
+    keys = metric_names(spec.metric_keys)
+    steps = np.arange(spec.steps)
+    columns = {"step": steps}
+    for i, k in enumerate(keys):
+        noise = rng.standard_normal(spec.steps)
+        columns[k] = np.exp(-steps / (1 + spec.steps * (0.1 + 0.1 * i))) + 0.05 * noise
+    columns["__timestamp"] = 1.6e9 + np.cumsum(rng.uniform(0.05, 0.15, spec.steps))
+
+    # note: `tolist` makes python ints and floats, as the logging client writes them.
+    names = list(columns)
+    with open(join(path, "metrics.pkl"), "wb") as f:
+        for start in range(0, spec.steps, BATCH_SIZE):
+            rows = zip(*[v[start:start + BATCH_SIZE].tolist() for v in columns.values()])
+            f.write(b"".join(pickle.dumps(dict(zip(names, row))) for row in rows))
+
+    for i in range(spec.figures):
+        with open(join(path, "figures", f"step_{i:04d}.png"), "wb") as f:
+            f.write(PNG_BYTES)
+
+    with open(join(path, "outputs.log"), "w") as f:
+        for i in range(0, spec.steps, max(spec.steps // 100, 1)):
+            f.write(f"step {i}: loss {columns[keys[0]][i]:.6f}\n" if keys else f"step {i}\n")
+
+
+def create_logdir(spec=LogdirSpec, show_progress=False):
+    """
+    write the complete tree described by the spec.
+
+    :param spec: the logdir spec
+    :param show_progress: show a tqdm progress bar
+    :return: the list of run prefixes, relative to `spec.root`
+    """
+    root = expanduser(spec.root)
+    if spec.clean:
+        import shutil
+        shutil.rmtree(root, ignore_errors=True)
+
+    prefixes = [run_prefix(u, p, r)
+                for u in range(spec.users)
+                for p in range(spec.projects)
+                for r in range(spec.runs)]
+
+    _ = prefixes
+    if show_progress:
+        from tqdm import tqdm
+        _ = tqdm(prefixes, desc="@create_logdir")
+
+    for i, prefix in enumerate(_):
+        # note: seed each run by its index, so that runs don't depend on the order they are written in.
+        rng = np.random.default_rng([spec.seed, i])
+        write_run(join(root, prefix), i % spec.runs, rng, spec)
+
+    for u in range(spec.users):
+        for p in range(spec.projects):
+            with open(join(root, f"user_{u:03d}", f"project_{p:03d}", "README.md"), "w") as f:
+                f.write(f"# Project {p:03d}\n\nsynthetic runs for benchmarking.\n")
+
+    return prefixes
+
+
+if __name__ == "__main__":
+    from termcolor import cprint
+
+    prefixes = create_logdir(show_progress=True)
+    cprint(f"wrote {len(prefixes)} runs to {LogdirSpec.root}", "green")
@@ -0,0 +1,57 @@
+import filecmp
+from os.path import join
+
+import pytest
+
+from dash_server_specs.create_large_logdir import LogdirSpec, create_logdir, run_prefix
+
+
+@pytest.fixture(autouse=True)
+def restore_specs():
+    """the specs are global, so put them back for the tests that come after."""
+    from ml_dash.config import Args
+    spec, logdir = vars(LogdirSpec).copy(), Args.logdir
+    yield
+    LogdirSpec._update(spec)
+    Args.logdir = logdir
+
+
+def test_create_logdir_is_deterministic(tmp_path):
+    LogdirSpec._update(users=1, projects=1, runs=3, steps=20, metric_keys=3, figures=1, seed=0)
+    for name in ["a", "b"]:
+        LogdirSpec.root = str(tmp_path / name)
+        prefixes = create_logdir()
+
+    assert len(prefixes) == 3
+    for prefix in prefixes:
+        for file in ["parameters.pkl", "metrics.pkl", "outputs.log"]:
+            assert filecmp.cmp(tmp_path / "a" / prefix / file, tmp_path / "b" / prefix / file, shallow=False)
+
+
+def test_benchmarks_run(tmp_path):
+    from ml_logger.helpers import load_pickle_as_dataframe
+    from dash_server_specs.benchmarks import BENCHMARKS, run_benchmark
+
+    LogdirSpec._update(root=str(tmp_path), users=1, projects=1, runs=4, steps=50, metric_keys=2, figures=1)
+    create_logdir()
+    df = load_pickle_as_dataframe(join(tmp_path, run_prefix(0, 0, 1), "metrics.pkl"))
+    assert list(df.keys()) == ["step", "loss", "success_rate", "__timestamp"]
+    assert len(df) == 50
+
+    for name in BENCHMARKS:
+        r = run_benchmark(name, str(tmp_path), repeat=3, warmup=0)
+        assert r['p50_ms'] <= r['p99_ms']
+        assert r['peak_rss_mb'] > 0
+
+
+def test_benchmarks_cli(tmp_path):
+    """the flags of the command line reach the benchmarks, which run in processes of their own."""
+    import json, subprocess, sys
+    LogdirSpec._update(root=str(tmp_path / "logdir"), users=1, projects=1, runs=3, steps=20, metric_keys=2, figures=1)
+    create_logdir()
+    subprocess.run([sys.executable, "-m", "dash_server_specs.benchmarks", "--root", str(tmp_path / "logdir"),
+                    "--runs", "3", "--only", "find_experiments", "--repeat", "2", "--warmup", "0",
+                    "--bench-out", str(tmp_path / "bench.json")], check=True, capture_output=True)
+    with open(tmp_path / "bench.json") as f:
+        [result] = json.load(f)
+    assert result['name'] == "find_experiments" and result['runs'] == 3 and result['repeat'] == 2
@@ -505,3 +505,1224 @@ def test_node(log_dir):
     else:
         print(">>")
         show(r['data'])
+
+
+def test_query_cost():
+    from ml_dash.query_budget import estimate_cost
+
+    small = estimate_cost("""
+        query AppQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, k: 10, yKey: "sine") { xData yMean }
+        }
+    """, variables=dict(metricsFiles=["/a/metrics.pkl"] * 3))
+    large = estimate_cost("""
+        query AppQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, yKey: "sine") { xData yMean }
+        }
+    """, variables=dict(metricsFiles=["/a/metrics.pkl"] * 300))
+    assert small < large
+
+    root_glob = estimate_cost('{ glob(cwd: "/", query: "**/*") { id name } }')
+    experiment_glob = estimate_cost('{ glob(cwd: "/a/b/c/d", query: "**/*", stop: 10) { id name } }')
+    assert experiment_glob < root_glob
+
+
+def test_query_budget(log_dir):
+    from ml_dash.config import Args
+    from ml_dash.server import app
+    Args.logdir = log_dir
+
+    _, r = app.test_client.post('/graphql', json=dict(query='{ glob(cwd: "/", query: "**/*") { id name } }'))
+    assert r.status == 400
+    assert "exceeds the budget" in r.json['errors'][0]['message']
+
+    _, r = app.test_client.post('/graphql', json=dict(
+        query='{ glob(cwd: "/episodeyang/cpc-belief/mdp/experiment_00", query: "figures/*.png") { id name } }'))
+    assert r.status == 200
+    assert r.json['data']['glob']
+
+
+def test_query_deadline(log_dir):
+    from ml_dash.config import Args
+    from ml_dash.query_budget import deadline
+    Args.logdir = log_dir
+    client = Client(schema)
+    query = """
+        query AppQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, k: 10, xKey: "epoch", yKey: "sine") { xData yMean }
+        }
+    """
+    variables = dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"])
+    with deadline(1e-9):
+        r = client.execute(query, variables=variables)
+    assert "deadline" in r['errors'][0]['message']
+
+    with deadline(60):
+        r = client.execute(query, variables=variables)
+    assert 'errors' not in r
+
+
+def test_response_cache(log_dir):
+    import os
+    from ml_dash.config import Args
+    from ml_dash.server import app
+    from ml_dash.response_cache import get_cache
+    Args.logdir = log_dir
+    cache = get_cache()
+    cache.clear()
+
+    query = """
+        query LineChartsQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, k: 10, xKey: "epoch", yKey: "sine") { xData yMean }
+        }
+    """
+    path = "/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"
+    body = dict(query=query, variables=dict(metricsFiles=[path]))
+
+    _, r = app.test_client.post('/graphql', json=body)
+    hits = cache.hits
+    # whitespace does not change the normalized query.
+    _, cached = app.test_client.post('/graphql', json=dict(body, query=" ".join(query.split())))
+    assert cache.hits == hits + 1
+    assert cached.json == r.json
+
+    os.utime(os.path.join(log_dir, path[1:]))
+    _, r = app.test_client.post('/graphql', json=body)
+    assert cache.hits == hits + 1, "touching the metrics file should invalidate the entry"
+    assert r.json['data']['series']['xData']
+
+    # note: data that has an `errors` key is still cached.
+    aliased = dict(body, query=query.replace("series(", "errors: series("))
+    _, r = app.test_client.post('/graphql', json=aliased)
+    assert 'errors' not in r.json and r.json['data']['errors']['xData']
+    hits = cache.hits
+    app.test_client.post('/graphql', json=aliased)
+    assert cache.hits == hits + 1
+
+
+def test_response_compression(log_dir):
+    import gzip, os
+    from ml_dash.config import Args, CompressionArgs
+    from ml_dash.server import app
+    from ml_dash.response_cache import get_cache
+    Args.logdir = log_dir
+    get_cache().clear()
+
+    body = dict(query="""
+        query LineChartsQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine") { xData yMean yCount }
+        }
+    """, variables=dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"]))
+
+    min_size, CompressionArgs.compress_min_size = CompressionArgs.compress_min_size, 100
+    _, r = app.test_client.post('/graphql', json=body, headers={'Accept-Encoding': 'gzip'})
+    CompressionArgs.compress_min_size = min_size
+    assert r.headers['content-encoding'] == 'gzip'
+    assert len(r.json['data']['series']['xData']) == 51
+
+    _, r = app.test_client.post('/graphql', json=body, headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in r.headers
+
+    path = os.path.join(log_dir, "episodeyang/cpc-belief/precompressed.json")
+    with open(path, 'w') as f:
+        f.write('{"hey": 1}')
+    with open(path + ".gz", 'wb') as f:
+        f.write(gzip.compress(b'{"hey": "from gzip"}'))
+    try:
+        _, r = app.test_client.get('/files/episodeyang/cpc-belief/precompressed.json',
+                                   headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['content-encoding'] == 'gzip'
+        assert r.json == {"hey": "from gzip"}
+
+        # note: the range of a partial response is in the bytes of the file, so it is not compressed.
+        with open(path, 'w') as f:
+            f.write(" " * 10_000)
+        _, r = app.test_client.get('/files/episodeyang/cpc-belief/precompressed.json',
+                                   headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-4999'})
+        assert r.status == 206 and 'content-encoding' not in r.headers and len(r.body) == 5000
+    finally:
+        os.remove(path)
+        os.remove(path + ".gz")
+
+
+def test_series_binary(log_dir):
+    import json, struct
+    import numpy as np
+    from ml_dash.config import Args
+    from ml_dash.server import app
+    Args.logdir = log_dir
+
+    _, r = app.test_client.post('/series', json=dict(
+        metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"],
+        k=10, xKey="epoch", yKeys=["sine", "slow_sine"], stats=["mean", "count"], dtype="float32"))
+    assert r.status == 200
+    payload = r.content
+    assert payload[:4] == b"MLDS"
+    version, _, header_len = struct.unpack('<HHI', payload[4:12])
+    header = json.loads(payload[12:12 + header_len])
+    assert version == 1 and header['dtype'] == 'float32'
+    assert [(b['key'], b['stat']) for b in header['buffers']] == \
+           [("__x", None), ("sine", "mean"), ("sine", "count"), ("slow_sine", "mean"), ("slow_sine", "count")]
+
+    client = Client(schema)
+    expected = client.execute("""
+        query AppQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, k: 10, xKey: "epoch", yKeys: ["sine", "slow_sine"]) { xData yMean }
+        }
+    """, variables=dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"]))['data']['series']
+    for b in header['buffers']:
+        assert b['offset'] % 8 == 0
+        values = np.frombuffer(payload, dtype='<f4', count=b['length'], offset=b['offset'])
+        if b['key'] == "__x":
+            assert np.allclose(values, expected['xData'])
+        elif b['stat'] == "mean":
+            assert np.allclose(values, expected['yMean'][b['key']])
+
+    _, r = app.test_client.post('/series', json=dict(metricsFiles=["/a/metrics.pkl"], yKey="sine", stats=["mode"]))
+    assert r.status == 400
+    for args in [dict(dtype="int8"), dict(stats="mean"), dict(stats=1)]:
+        _, r = app.test_client.post('/series', json=dict(metricsFiles=["/a/metrics.pkl"], yKey="sine", **args))
+        assert r.status == 400, args
+
+
+def test_shared_cache(log_dir, tmp_path):
+    import os
+    import numpy as np
+    from ml_dash import shared_cache
+    from ml_dash.config import Args, SharedCacheArgs
+    from ml_dash.schema.files.file_helpers import read_dataframe
+    Args.logdir = log_dir
+    path = os.path.join(log_dir, "episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl")
+
+    expected = read_dataframe(path)
+    SharedCacheArgs.shared_cache_dir = str(tmp_path / "shm")
+    try:
+        published = read_dataframe(path)
+        assert len(shared_cache.entries()) == 1
+        df = read_dataframe(path)
+        assert isinstance(df['sine'].to_numpy().base, np.memmap), "cache hits should map the published columns"
+        assert df.equals(expected) and published.equals(expected)
+
+        shared_cache.evict(max_bytes=0)
+        assert not shared_cache.entries()
+        assert read_dataframe(path).equals(expected)
+
+        # note: the cache can not be written, which should not fail the read.
+        (tmp_path / "not_a_dir").write_text("")
+        SharedCacheArgs.shared_cache_dir = str(tmp_path / "not_a_dir" / "shm")
+        assert shared_cache.publish(path, expected) is False
+        assert read_dataframe(path).equals(expected)
+    finally:
+        SharedCacheArgs.shared_cache_dir = None
+
+
+def test_lazy_imports():
+    import subprocess, sys
+    from ml_dash.startup import import_times, warm_up
+
+    heavy = ["pandas", "ruamel.yaml", "ml_logger", "tqdm"]
+    loaded = subprocess.check_output([sys.executable, "-c", f"""
+import sys, ml_dash.server
+print(",".join(m for m in {heavy} if m in sys.modules))
+"""], universal_newlines=True).strip()
+    assert not loaded, f"{loaded} should not be imported when the server module loads."
+
+    assert any(name == "ml_dash.server" for name, *_ in import_times())
+    timings = warm_up(["json", "not_a_module"])
+    assert timings["json"] >= 0 and timings["not_a_module"] is None
+
+
+def share_and_sleep(name, seconds):
+    """a pool task that makes its result block, and then hangs."""
+    import time
+    import numpy as np
+    from ml_dash.process_pool import share
+    share([np.zeros(16)], name)[0].close()
+    time.sleep(seconds)
+
+
+def test_process_pool(log_dir):
+    import time
+    from ml_dash import process_pool
+    from ml_dash.config import Args, PoolArgs
+    from ml_dash.server import app
+    Args.logdir = log_dir
+
+    query = """
+        query AppQuery ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, k: 10, xKey: "epoch", yKeys: ["sine", "slow_sine"]) { xData yMean y95pc }
+        }
+    """
+    variables = dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl",
+                                   "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl"])
+    client = Client(schema)
+    expected = client.execute(query, variables=variables)['data']['series']
+
+    PoolArgs.processes, PoolArgs.pool_min_rows = 1, 0
+    try:
+        assert client.execute(query, variables=variables)['data']['series'] == expected
+        _, r = app.test_client.post('/graphql', json=dict(query=query, variables=variables))
+        assert r.json['data']['series'] == expected
+
+        with pytest.raises(process_pool.PoolTimeoutError):
+            process_pool.run(time.sleep, 10, timeout=0.5)
+        assert process_pool.run(sum, [1, 2]) == 3, "the pool should come back after a timeout"
+
+        # note: the result block of a killed task is unlinked.
+        name = process_pool.block_name()
+        process_pool.run(share_and_sleep, name, 0)
+        with pytest.raises(process_pool.PoolTimeoutError):
+            process_pool.run(share_and_sleep, name, 10, timeout=1, result=name)
+        with pytest.raises(FileNotFoundError):
+            from multiprocessing.shared_memory import SharedMemory
+            SharedMemory(name)
+
+        # note: a request that runs out of time leaves the pool to the other requests.
+        from ml_dash.query_budget import QueryDeadlineError, deadline
+        pool, name = process_pool.get_pool(), process_pool.block_name()
+        with deadline(0.5), pytest.raises(QueryDeadlineError):
+            process_pool.run(share_and_sleep, name, 1, result=name)
+        assert process_pool.get_pool() is pool
+        assert process_pool.run(sum, [1, 2]) == 3
+        time.sleep(1)
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name)
+
+        # note: only the first task that the broken pool fails re-creates it.
+        process_pool.reset_pool()
+        assert process_pool.reset_pool(pool) == [] and process_pool.get_pool() is not pool
+
+        process_pool.get_pool().submit(time.sleep, 10)
+        t0 = time.time()
+        process_pool.reset_pool()
+        assert time.time() - t0 < 1, "the reset should not wait for the pool to shut down"
+    finally:
+        process_pool.reset_pool()
+        PoolArgs.processes, PoolArgs.pool_min_rows = 0, 100_000
+
+
+def test_concurrent_find_files(log_dir):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from ml_dash.schema.files.file_helpers import find_files
+
+    owd = os.getcwd()
+    roots = [os.path.join(log_dir, "episodeyang/cpc-belief"), os.path.join(log_dir, "episodeyang")]
+    expected = [[f['path'] for f in find_files(root, "**/*.pkl")] for root in roots]
+    assert all(expected)
+    assert [f['path'] for f in find_files(roots[1], "**/*.pkl", threads=4)] == expected[1], \
+        "walking the directories in parallel should not change the order"
+
+    def find(i):
+        return [f['path'] for f in find_files(roots[i % 2], "**/*.pkl", threads=2)]
+
+    with ThreadPoolExecutor(8) as executor:
+        for i, paths in enumerate(executor.map(find, range(32))):
+            assert paths == expected[i % 2]
+    assert os.getcwd() == owd
+
+
+def test_find_files_stop(tmp_path):
+    from ml_dash.response_cache import record
+    from ml_dash.schema.files.file_helpers import find_files
+
+    for i in range(20):
+        for j in range(5):
+            (tmp_path / f"sweep_{i:02d}" / f"run_{j}").mkdir(parents=True)
+            (tmp_path / f"sweep_{i:02d}" / f"run_{j}" / "parameters.pkl").write_bytes(b"")
+    everything = [f['path'] for f in find_files(str(tmp_path), "**/parameters.pkl", threads=4)]
+    assert len(everything) == 100
+
+    # note: the directories that the walk lists are tracked, which tells us how far it went.
+    with record() as deps:
+        files = [f['path'] for f in find_files(str(tmp_path), "**/parameters.pkl", stop=3, threads=4)]
+    assert files == everything[:3]
+    assert len(deps) < 60, "the walk should stop soon after the first few matches"
+
+    # note: a stopped walk lists no more directories, even where nothing matches.
+    import threading
+    from ml_dash import storage
+    for i in range(50):
+        (tmp_path / "sweep_20" / f"empty_{i}").mkdir(parents=True)
+    stopped = threading.Event()
+    with record() as deps, storage.stop_on(stopped):
+        files = storage.glob(str(tmp_path), "**/parameters.pkl")
+        next(files)
+        stopped.set()
+        assert list(files) == [] and len(deps) < 10
+
+    # note: like the serial glob, the parallel one does not follow symlinks to directories.
+    (tmp_path / "link").symlink_to(tmp_path / "sweep_00")
+    (tmp_path / "sweep_01" / "link").symlink_to(tmp_path / "sweep_02")
+    assert [f['path'] for f in find_files(str(tmp_path), "**/parameters.pkl", threads=4)] == \
+           [f['path'] for f in find_files(str(tmp_path), "**/parameters.pkl")]
+
+
+def test_series_groups(log_dir):
+    from ml_dash.config import Args, QueryArgs
+    from ml_dash.server import app
+    Args.logdir = log_dir
+
+    query = """
+        query SeriesGroups ($filter: GenericScalar) {
+            seriesGroups(cwd: "/episodeyang", groupBy: ["Args.lr"], filter: $filter, stop: 100,
+                         xKey: "epoch", yKey: "sine", k: 10) {
+                key label experiments series { label xData yMean yCount }
+            }
+        }
+    """
+    client = Client(schema)
+    groups = client.execute(query)['data']['seriesGroups']
+    assert [g['key'] for g in groups] == [{"Args.lr": 0.001}, {"Args.lr": 0.01}]
+    assert groups[0]['label'] == groups[0]['series']['label'] == "Args.lr=0.001"
+    assert sorted(groups[0]['experiments']) == ["/episodeyang/cpc-belief/mdp/experiment_01",
+                                                "/episodeyang/playground/mdp/experiment_01"]
+
+    expected = client.execute("""
+        query Series ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", k: 10) { xData yMean yCount }
+        }
+    """, variables=dict(metricsFiles=[e + "/metrics.pkl" for e in groups[0]['experiments']]))['data']['series']
+    assert groups[0]['series']['yMean'] == expected['yMean']
+
+    filtered = client.execute(query, variables=dict(filter={"Args.lr": [0.01]}))['data']['seriesGroups']
+    assert filtered == groups[1:]
+
+    # note: a recursive glob from the user directory is over the default budget.
+    max_cost, QueryArgs.max_query_cost = QueryArgs.max_query_cost, 0
+    try:
+        _, r = app.test_client.post('/graphql', json=dict(query=query))
+    finally:
+        QueryArgs.max_query_cost = max_cost
+    assert r.json['data']['seriesGroups'] == groups
+
+
+def test_series_smoothing(log_dir):
+    import numpy as np
+    from ml_dash.config import Args
+    from ml_dash.schema.files.file_helpers import read_dataframe
+    Args.logdir = log_dir
+
+    metrics_file = "/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"
+    query = """
+        query Series ($metricsFiles: [String]!, $smoothing: GenericScalar) {
+            series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", smoothing: $smoothing) { xData yMean window }
+        }
+    """
+    client = Client(schema)
+
+    def series(smoothing):
+        r = client.execute(query, variables=dict(metricsFiles=[metrics_file], smoothing=smoothing))
+        assert 'errors' not in r, r['errors']
+        return r['data']['series']
+
+    raw = series(None)
+    assert series({"window": 1})['yMean'] == raw['yMean']
+
+    df = read_dataframe(log_dir + metrics_file)[['epoch', 'sine']].dropna()
+    windowed = series({"window": 5})
+    assert windowed['window'] == 5
+    assert np.allclose(windowed['yMean'], df['sine'].rolling(5, min_periods=1).mean())
+
+    y, ema = df['sine'].to_numpy(), []
+    for v in y:
+        ema.append(v if not ema else 0.3 * v + 0.7 * ema[-1])
+    assert np.allclose(series({"ema": 0.3})['yMean'], ema)
+
+    r = client.execute(query, variables=dict(metricsFiles=[metrics_file], smoothing={"ema": 2}))
+    assert "should be in (0, 1]" in r['errors'][0]['message']
+
+
+def test_series_interpolation(log_dir):
+    import numpy as np
+    import pandas as pd
+    from ml_dash.config import Args
+    from ml_dash.schema.files.series import interpolate
+    Args.logdir = log_dir
+
+    # note: two runs that log at different steps.
+    runs = [pd.DataFrame(dict(step=[0, 10, 20], loss=[0., 1., 2.])),
+            pd.DataFrame(dict(step=[5, 15, 25], loss=[10., 11., 12.]))]
+    linear = interpolate(runs, "step", ["loss"], k=6)
+    assert linear[0]['step'].tolist() == [0, 5, 10, 15, 20, 25]
+    assert np.allclose(linear[0]['loss'], [0, .5, 1, 1.5, 2, np.nan], equal_nan=True)
+    assert np.allclose(linear[1]['loss'], [np.nan, 10, 10.5, 11, 11.5, 12], equal_nan=True)
+    previous = interpolate(runs, "step", ["loss"], k=6, kind="previous")
+    assert np.allclose(previous[0]['loss'], [0, 0, 1, 1, 2, np.nan], equal_nan=True)
+
+    r = Client(schema).execute("""
+        query Series ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", k: 20, interpolation: "linear") {
+                xData yMean yCount
+            }
+        }
+    """, variables=dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl",
+                                      "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl"]))
+    assert 'errors' not in r, r['errors']
+    series = r['data']['series']
+    assert len(series['xData']) == 20 and set(series['yCount']) == {2}
+    assert series['xData'][0] == 0 and series['xData'][-1] == 50, "xData should be the grid, not the row numbers"
+
+
+def test_approximate_series(log_dir):
+    import numpy as np
+    from ml_dash import sketches
+    from ml_dash.config import Args
+    from ml_dash.schema.files.series import get_sketch_cache
+    Args.logdir = log_dir
+
+    rng = np.random.default_rng(0)
+    runs = [(np.arange(10_000, dtype=float), rng.normal(size=10_000) + i) for i in range(8)]
+    edges = np.linspace(0, 9_999, 11)
+    stats = sketches.merge([sketches.sketch_run(x, y, bins=256, points=32) for x, y in runs], edges)
+    x, y = np.concatenate([x for x, _ in runs]), np.concatenate([y for _, y in runs])
+    bins = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, 9)
+    assert stats['count'].sum() == len(y)
+    for b in range(10):
+        exact = y[bins == b]
+        # note: a fine bin that straddles an edge goes to the bin of its center.
+        assert abs(stats['mean'][b] - exact.mean()) < 0.02
+        assert abs(stats['std'][b] - exact.std(ddof=1)) < 0.02
+        for stat, q in sketches.PERCENTILES.items():
+            rank = (exact < stats[stat][b]).mean()
+            assert abs(rank - q) < 0.02, (b, stat, rank)
+
+    query = """
+        query Series ($metricsFiles: [String]!) {
+            series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", k: 10, approximate: true) {
+                xData yMean yCount y95pc
+            }
+        }
+    """
+    variables = dict(metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl",
+                                   "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl"])
+    cache = get_sketch_cache()
+    cache.clear()
+    client = Client(schema)
+    r = client.execute(query, variables=variables)
+    assert 'errors' not in r, r['errors']
+    series = r['data']['series']
+    assert len(series['xData']) == 10 and sum(series['yCount']) == 102
+
+    hits = cache.hits
+    assert client.execute(query, variables=variables)['data']['series'] == series
+    assert cache.hits == hits + 2, "the second query should merge the cached sketches"
+
+
+def test_record_stream(tmp_path):
+    import pickle
+    from ml_dash import record_stream
+
+    path = str(tmp_path / "metrics.pkl")
+    with open(path, 'wb') as f:
+        for i in range(10_000):
+            pickle.dump(dict(step=i, value=i * 0.5), f, protocol=4)
+        # note: unframed records are decoded to be skipped.
+        for i in range(10_000, 10_010):
+            pickle.dump(dict(step=i, value=i * 0.5), f, protocol=2)
+
+    with open(path, 'rb') as f:
+        count = 0
+        while record_stream.skip_record(f):
+            count += 1
+    assert count == 10_010
+
+    sample = record_stream.sample_records(path, 100, seed=42)
+    assert len(sample) == 100
+    steps = [r['step'] for r in sample]
+    assert steps == sorted(steps) and len(set(steps)) == 100, "the sample is in file order"
+    assert record_stream.sample_records(path, 100, seed=42) == sample
+    assert steps[-1] > 5_000, "the sample should cover the whole file"
+
+    df = record_stream.load_sample_as_dataframe(path, 20_000)
+    assert len(df) == 10_010 and list(df['step']) == list(range(10_010))
+
+
+def test_metrics_keys(log_dir, tmp_path):
+    import pickle
+    from ml_dash import metrics_index
+    from ml_dash.config import Args, IndexArgs
+    Args.logdir = log_dir
+    IndexArgs.metrics_index_dir = str(tmp_path / "index")
+    metrics_index.clear()
+
+    query = """
+        query Keys ($id: ID!, $metricsFiles: [String]!) {
+            metrics (id: $id) { keys keySchema }
+            metricsKeys (metricsFiles: $metricsFiles)
+        }
+    """
+    variables = dict(id=to_global_id("Metrics", "/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"),
+                     metricsFiles=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl",
+                                   "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl",
+                                   "/episodeyang/cpc-belief/mdp/missing/metrics.pkl"])
+    r = Client(schema).execute(query, variables=variables)
+    assert 'errors' not in r, r['errors']
+    metrics = r['data']['metrics']
+    assert metrics['keys'] == ['epoch', 'sine', 'slow_sine']
+    assert metrics['keySchema']['epoch']['first'] == 0 and metrics['keySchema']['epoch']['last'] == 50
+    assert metrics['keySchema']['sine']['dtype'] == 'float64'
+    assert r['data']['metricsKeys']['sine'] == dict(dtype='float64', count=102, runs=2)
+
+    # note: appending only decodes the new records.
+    path = tmp_path / "metrics.pkl"
+    with open(path, 'wb') as f:
+        for i in range(10):
+            pickle.dump(dict(step=i, loss=1. / (i + 1)), f)
+    assert metrics_index.get_keys(str(path)) == ['step', 'loss']
+    with open(path, 'ab') as f:
+        pickle.dump(dict(step=10, accuracy="n/a"), f)
+        # note: a half-written record is left for the next read.
+        f.write(pickle.dumps(dict(step=11))[:5])
+    metrics_index.clear()
+    index = metrics_index.get_index(str(path))
+    assert index['rows'] == 11 and index['keys']['step']['last'] == 10
+    assert index['keys']['accuracy'] == dict(dtype='str', count=1, first="n/a", last="n/a", first_row=10, last_row=10)
+
+    # note: a rewritten file is indexed from the start.
+    with open(path, 'wb') as f:
+        pickle.dump(dict(epoch=0), f)
+    assert metrics_index.get_keys(str(path)) == ['epoch']
+
+
+def test_metrics_summary(log_dir, tmp_path):
+    from ml_logger.helpers import load_pickle_as_dataframe
+    from ml_dash import metrics_index
+    from ml_dash.config import Args, IndexArgs
+    Args.logdir = log_dir
+    IndexArgs.metrics_index_dir = str(tmp_path / "index")
+    metrics_index.clear()
+
+    query = """
+        query Summary ($id: ID!) {
+            metrics (id: $id) { summary (keys: ["sine", "slow_sine"]) }
+        }
+    """
+    path = "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl"
+    r = Client(schema).execute(query, variables=dict(id=to_global_id("Metrics", path)))
+    assert 'errors' not in r, r['errors']
+    summary = r['data']['metrics']['summary']
+    assert list(summary) == ['sine', 'slow_sine']
+
+    df = load_pickle_as_dataframe(log_dir + path)
+    for key, stats in summary.items():
+        column = df[key].dropna()
+        assert stats['count'] == len(column)
+        assert stats['last'] == column.iloc[-1]
+        assert stats['min'] == column.min() and stats['argmin'] == column.idxmin()
+        assert stats['max'] == column.max() and stats['argmax'] == column.idxmax()
+
+
+
+def test_metrics_index_safety(tmp_path):
+    import json
+    import pickle
+    from ml_dash import metrics_index
+    from ml_dash.config import IndexArgs
+    path = tmp_path / "metrics.pkl"
+    with open(path, 'wb') as f:
+        for value in [1., float('inf'), -float('inf'), float('nan'), 2.]:
+            pickle.dump(dict(loss=value), f)
+
+    IndexArgs.metrics_index_dir = str(tmp_path / "index")
+    metrics_index.clear()
+    summary = metrics_index.get_summary(str(path))
+    json.dumps(summary, allow_nan=False)
+    assert summary['loss'] == dict(count=4, last=2., min=1., max=2., argmin=0, argmax=4)
+    assert (tmp_path / "index").stat().st_mode & 0o777 == 0o700
+    assert len(list((tmp_path / "index").iterdir())) == 1
+
+    # note: a directory that others can write to could hold planted indices.
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    IndexArgs.metrics_index_dir = str(shared)
+    metrics_index.clear()
+    assert metrics_index.get_summary(str(path))['loss']['count'] == 4
+    assert list(shared.iterdir()) == []
+
+def test_top_experiments(log_dir, tmp_path):
+    from glob import glob
+    from ml_logger.helpers import load_pickle_as_dataframe
+    from ml_dash import metrics_index
+    from ml_dash.config import Args, IndexArgs
+    Args.logdir = log_dir
+    IndexArgs.metrics_index_dir = str(tmp_path / "index")
+    metrics_index.clear()
+
+    query = """
+        query Top ($agg: String, $ascending: Boolean, $filter: GenericScalar) {
+            topExperiments(cwd: "/episodeyang", key: "sine", agg: $agg, k: 3, n: 5,
+                           ascending: $ascending, filter: $filter) {
+                rank path value experiment { name }
+            }
+        }
+    """
+    files = sorted(glob(log_dir + "/episodeyang/**/metrics.pkl", recursive=True))
+    dfs = {f[len(log_dir):-len("/metrics.pkl")]: load_pickle_as_dataframe(f)['sine'].dropna() for f in files}
+    expected = dict(last=lambda s: s.iloc[-1], max=lambda s: s.max(), min=lambda s: s.min(),
+                    mean_last_n=lambda s: s.tail(5).mean())
+
+    client = Client(schema)
+    for agg, fn in expected.items():
+        for ascending in [False, True]:
+            r = client.execute(query, variables=dict(agg=agg, ascending=ascending))
+            assert 'errors' not in r, r['errors']
+            top = r['data']['topExperiments']
+            assert [t['rank'] for t in top] == [1, 2, 3]
+            values = sorted((fn(s) for s in dfs.values()), reverse=not ascending)[:3]
+            assert [t['value'] for t in top] == pytest.approx(values)
+            for t in top:
+                assert t['value'] == pytest.approx(fn(dfs[t['path']]))
+                assert t['experiment']['name'] == t['path'].split('/')[-1]
+
+    r = client.execute(query, variables=dict(agg="max", filter={"Args.lr": 0.01}))
+    assert 'errors' not in r, r['errors']
+    assert len(r['data']['topExperiments']) == len(files) // 2
+
+
+def test_deletion_job(log_dir, tmp_path, monkeypatch):
+    import os, time
+    from ml_dash import deletion_jobs
+    from ml_dash.config import Args, DeletionArgs
+    from ml_dash.server import app
+    monkeypatch.setattr(DeletionArgs, "deletion_jobs_dir", str(tmp_path / "jobs"))
+
+    def make_tree(root):
+        for i in range(5):
+            for j in range(20):
+                os.makedirs(root / f"run_{i}" / f"step_{j}")
+                (root / f"run_{i}" / f"step_{j}" / "metrics.pkl").write_bytes(b"x")
+        (root / "README.md").write_text("sweep")
+        return 5 * (20 * 2 + 1) + 1 + 1
+
+    Args.logdir = str(tmp_path)
+    try:
+        total = make_tree(tmp_path / "sweep")
+        query = """
+            mutation Delete ($id: ID!) {
+                deleteDirectory (input: {id: $id, clientMutationId: "delete"}) { ok job { id status } }
+            }
+        """
+        client = Client(schema)
+        r = client.execute(query, variables=dict(id=to_global_id("Directory", "/sweep")))
+        assert 'errors' not in r, r['errors']
+        assert r['data']['deleteDirectory']['ok']
+        job_id = r['data']['deleteDirectory']['job']['id']
+
+        progress = """
+            query Progress ($id: String!) {
+                deletionJob (id: $id) { path status deleted progress errors }
+            }
+        """
+        for _ in range(100):
+            job = client.execute(progress, variables=dict(id=job_id))['data']['deletionJob']
+            if job['status'] not in [deletion_jobs.QUEUED, deletion_jobs.RUNNING]:
+                break
+            time.sleep(0.05)
+        assert job == dict(path="/sweep", status="done", deleted=total, progress=1., errors=[])
+        assert not (tmp_path / "sweep").exists()
+
+        # note: the other workers read the state that the worker of the job saved.
+        deletion_jobs._jobs.clear()
+        assert client.execute(progress, variables=dict(id=job_id))['data']['deletionJob'] == job
+        _, r = app.test_client.get(f'/deletions/{job_id}')
+        assert r.status == 200 and r.json['status'] == "done" and r.json['path'] == "/sweep"
+        assert app.test_client.get('/deletions/..%2Fjobs')[1].status == 404
+
+        missing = client.execute(query, variables=dict(id=to_global_id("Directory", "/sweep")))
+        assert missing['data']['deleteDirectory'] == dict(ok=False, job=None)
+
+        # note: a cancelled job stops before deleting anything else.
+        make_tree(tmp_path / "kept")
+        job = deletion_jobs.Job(str(tmp_path / "kept"))
+        job.cancel()
+        deletion_jobs.run(job)
+        assert job.status == deletion_jobs.CANCELLED and job.deleted == 0
+        assert (tmp_path / "kept" / "run_0" / "step_0" / "metrics.pkl").exists()
+
+        # note: a job can be cancelled from another worker.
+        job = deletion_jobs.Job(str(tmp_path / "kept"))
+        job.save()
+        assert deletion_jobs.cancel(job.id).status == deletion_jobs.QUEUED
+        deletion_jobs.run(job)
+        assert job.status == deletion_jobs.CANCELLED and job.deleted == 0
+        assert deletion_jobs.get_job(job.id).status == deletion_jobs.CANCELLED
+    finally:
+        Args.logdir = log_dir
+
+
+def test_dashboard(log_dir, monkeypatch):
+    import os
+    from ml_dash.config import Args
+    from ml_dash.schema.files import file_helpers
+    Args.logdir = log_dir
+
+    loads = []
+    _read_dataframe = file_helpers._read_dataframe
+    monkeypatch.setattr(file_helpers, "_read_dataframe", lambda path, k=None: loads.append(path) or _read_dataframe(path, k))
+
+    root = os.path.join(log_dir, "episodeyang/cpc-belief/mdp")
+    files = {
+        "sine.chart.yml": """
+            name: sine
+            series:
+              - metricFiles: [experiment_00/metrics.pkl, experiment_01/metrics.pkl]
+                xKey: epoch
+                yKey: sine
+                k: 10
+              - metricFiles: [experiment_00/metrics.pkl]
+                prefix: episodeyang/cpc-belief/mdp
+                xKey: epoch
+                yKey: slow_sine
+                xAlign: start
+        """,
+        "experiment_00/local.chart.yml": """
+            - {type: series, x_key: epoch, y_key: sine, k: 5}
+            - {type: video, filePath: videos/q_0000.mp4}
+            - {type: series, x_key: epoch, y_key: missing_key}
+        """,
+        "default.dashcfg": """
+            experiments: [experiment_00, experiment_01]
+            charts:
+              - {name: shorthand, x_key: epoch, y_key: sine, k: 10}
+        """,
+    }
+    for name, text in files.items():
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(text)
+    try:
+        query = """
+            query Dashboard ($path: String!) {
+                dashboard (path: $path) {
+                    charts { file index name type errors series { yKey xData yMean } }
+                }
+            }
+        """
+        r = Client(schema).execute(query, variables=dict(path="/episodeyang/cpc-belief/mdp"))
+        assert 'errors' not in r, r['errors']
+        charts = {(c['file'].split('/mdp/')[1], c['index']): c for c in r['data']['dashboard']['charts']}
+        assert sorted(charts) == [('default.dashcfg', 0), ('experiment_00/local.chart.yml', 0),
+                                  ('experiment_00/local.chart.yml', 1), ('experiment_00/local.chart.yml', 2),
+                                  ('sine.chart.yml', 0)]
+
+        sine = charts['sine.chart.yml', 0]
+        assert sine['name'] == 'sine' and not sine['errors']
+        assert [s['yKey'] for s in sine['series']] == ['sine', 'slow_sine']
+        assert len(sine['series'][0]['xData']) == 10
+        assert charts['default.dashcfg', 0]['series'] == sine['series'][:1]
+        assert len(charts['experiment_00/local.chart.yml', 0]['series'][0]['xData']) == 5
+        assert charts['experiment_00/local.chart.yml', 1]['series'] == []
+        assert charts['experiment_00/local.chart.yml', 2]['errors'], "a missing key is an error of its chart"
+
+        # note: every series shares the two metrics files.
+        assert len(loads) == 2
+    finally:
+        for name in files:
+            os.remove(os.path.join(root, name))
+
+
+def test_mounts(log_dir, tmp_path):
+    import os, pickle
+    from ml_dash import mounts
+    from ml_dash.config import Args, MountArgs
+    from ml_dash.schema.experiments import find_experiments
+
+    def make_experiment(root, path, seed):
+        os.makedirs(os.path.join(root, path))
+        with open(os.path.join(root, path, "parameters.pkl"), 'wb') as f:
+            pickle.dump(dict(Args=dict(seed=seed)), f)
+        with open(os.path.join(root, path, "metrics.pkl"), 'wb') as f:
+            for i in range(10):
+                pickle.dump(dict(step=i, loss=seed + i), f)
+
+    a, b, c = [str(tmp_path / name) for name in "abc"]
+    make_experiment(a, "alice/sweep/run_0", 0)
+    make_experiment(b, "alice/sweep/run_1", 1)
+    make_experiment(c, "bob/sweep/run_2", 2)
+
+    MountArgs.mounts = f"/={a},{b};/team-x={c}"
+    try:
+        assert mounts.resolve("/alice/sweep/run_1/metrics.pkl") == os.path.join(b, "alice/sweep/run_1/metrics.pkl")
+        assert mounts.resolve("/team-x/bob/sweep") == os.path.join(c, "bob/sweep")
+        assert mounts.to_virtual(os.path.join(c, "bob")) == "/team-x/bob"
+
+        query = """
+            query Mounts {
+                users { username }
+                user (username: "alice") { projects { edges { node { name } } } }
+                glob (cwd: "/", query: "**/metrics.pkl") { path }
+                series (metricsFiles: ["/alice/sweep/run_1/metrics.pkl", "/team-x/bob/sweep/run_2/metrics.pkl"],
+                        xKey: "step", yKey: "loss", k: 1) { yCount }
+            }
+        """
+        r = Client(schema).execute(query)
+        assert 'errors' not in r, r['errors']
+        assert sorted(u['username'] for u in r['data']['users']) == ["alice", "team-x"]
+        assert [e['node']['name'] for e in r['data']['user']['projects']['edges']] == ["sweep"]
+        assert sorted(g['path'] for g in r['data']['glob']) == ["/alice/sweep/run_0/metrics.pkl",
+                                                               "/alice/sweep/run_1/metrics.pkl",
+                                                               "/team-x/bob/sweep/run_2/metrics.pkl"]
+        assert r['data']['series']['yCount'] == [20]
+
+        experiments = find_experiments(cwd="/alice", stop=10)
+        assert sorted(e.path for e in experiments) == ["/alice/sweep/run_0", "/alice/sweep/run_1"]
+    finally:
+        MountArgs.mounts = None
+        Args.logdir = log_dir
+
+
+class FakeS3:
+    """an in-memory stand-in for the few calls of the S3 API that the driver makes."""
+
+    class Error(Exception):
+        def __init__(self, code):
+            super().__init__(code)
+            self.response = dict(Error=dict(Code=code))
+
+    def __init__(self, page_size=2):
+        self.objects = {}
+        self.page_size = page_size
+        self.gets = 0
+
+    def head_object(self, Bucket, Key):
+        from datetime import datetime, timezone
+        import hashlib
+        if (Bucket, Key) not in self.objects:
+            raise self.Error("404")
+        data = self.objects[Bucket, Key]
+        return dict(ContentLength=len(data), LastModified=datetime.now(timezone.utc),
+                    ETag='"%s"' % hashlib.md5(data).hexdigest())
+
+    def get_object(self, Bucket, Key, Range):
+        import io
+        if (Bucket, Key) not in self.objects:
+            raise self.Error("NoSuchKey")
+        self.gets += 1
+        start, _, stop = Range[len("bytes="):].partition('-')
+        data = self.objects[Bucket, Key]
+        return dict(Body=io.BytesIO(data[int(start):int(stop) + 1 if stop else None]))
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, MaxKeys=None, ContinuationToken=None):
+        keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+        if Delimiter:
+            entries = []
+            for k in keys:
+                rest = k[len(Prefix):]
+                entry = Prefix + rest.split(Delimiter)[0] + Delimiter if Delimiter in rest else k
+                if entry not in entries:
+                    entries.append(entry)
+        else:
+            entries = keys
+        start = int(ContinuationToken or 0)
+        page = entries[start:start + (MaxKeys or self.page_size)]
+        r = dict(Contents=[dict(Key=k) for k in page if not k.endswith('/')],
+                 CommonPrefixes=[dict(Prefix=k) for k in page if k.endswith('/')], KeyCount=len(page))
+        if start + len(page) < len(entries):
+            r.update(IsTruncated=True, NextContinuationToken=str(start + len(page)))
+        return r
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Bucket, Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        for o in Delete['Objects']:
+            self.objects.pop((Bucket, o['Key']), None)
+
+
+def test_object_storage(log_dir, tmp_path):
+    import time
+    from ml_dash import storage, mounts, deletion_jobs
+    from ml_dash.config import Args, MountArgs, StorageArgs, IndexArgs
+    Args.logdir = log_dir
+    IndexArgs.metrics_index_dir = ""
+
+    s3 = FakeS3()
+    for name in ["metrics.pkl", "parameters.pkl"]:
+        with open(log_dir + "/episodeyang/cpc-belief/mdp/experiment_00/" + name, 'rb') as f:
+            s3.put_object(Bucket="logs", Key="alice/sweep/run_0/" + name, Body=f.read())
+    s3.put_object(Bucket="logs", Key="alice/sweep/run_0/README.md", Body=b"line 0\nline 1\n")
+    storage.register("s3", storage.S3Driver(client=s3))
+    MountArgs.mounts = f"/={log_dir};/archive=s3://logs"
+    block_size, block_cache_dir = StorageArgs.block_size, StorageArgs.block_cache_dir
+    StorageArgs.block_size, StorageArgs.block_cache_dir = 1024, ""
+    try:
+        assert storage.glob_regex("**/*.pkl").match("a/b/metrics.pkl")
+        assert not storage.glob_regex("*.pkl").match("a/metrics.pkl")
+        assert storage.list_dir("s3://logs/alice/sweep/run_0") == ([], ["README.md", "metrics.pkl", "parameters.pkl"])
+        assert mounts.to_virtual("s3://logs/alice/sweep") == "/archive/alice/sweep"
+
+        query = """
+            query Storage ($metricsFiles: [String]!) {
+                glob (cwd: "/archive", query: "**/*.pkl") { path }
+                text: glob (cwd: "/archive/alice/sweep/run_0", query: "README.md") { text (start: 1) }
+                metricsKeys (metricsFiles: $metricsFiles)
+                series (metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", k: 1) { yCount }
+            }
+        """
+        variables = dict(metricsFiles=["/archive/alice/sweep/run_0/metrics.pkl",
+                                       "/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl"])
+        r = Client(schema).execute(query, variables=variables)
+        assert 'errors' not in r, r['errors']
+        assert [g['path'] for g in r['data']['glob']] == ["/archive/alice/sweep/run_0/metrics.pkl",
+                                                         "/archive/alice/sweep/run_0/parameters.pkl"]
+        assert r['data']['text'][0]['text'] == "line 1\n"
+        assert r['data']['metricsKeys']['sine']['runs'] == 2
+        assert r['data']['series']['yCount'] == [102]
+
+        # note: a second read of the metrics file is served by the block cache.
+        gets = s3.gets
+        with storage.open("s3://logs/alice/sweep/run_0/metrics.pkl") as f:
+            assert len(f.read()) == 8568
+        assert s3.gets == gets
+
+        job = deletion_jobs.submit("s3://logs/alice")
+        while job.finished is None:
+            time.sleep(0.01)
+        assert job.status == "done" and job.deleted == 3
+        assert not s3.objects
+    finally:
+        storage.register("s3")
+        storage.get_block_cache().clear()
+        MountArgs.mounts = None
+        StorageArgs.block_size, StorageArgs.block_cache_dir = block_size, block_cache_dir
+
+
+
+def test_block_cache(tmp_path):
+    import os
+    from ml_dash.storage import BlockCache
+    # note: two workers share the directory, which already holds a block of an earlier run.
+    a, b = BlockCache(str(tmp_path), 3000), BlockCache(str(tmp_path), 3000)
+    with open(a.file("old"), 'wb') as f:
+        f.write(bytes(1000))
+    for i, (cache, key) in enumerate([(a, "old"), (a, "k0"), (b, "k1"), (b, "k2")]):
+        if key != "old":
+            cache.put(key, bytes(1000))
+        os.utime(cache.file(key), (i, i))
+    assert a.get("old") is None, "the oldest block should be evicted for all of the workers"
+    assert b.get("k0") == bytes(1000) and a.get("k2") == bytes(1000)
+    assert sum(f.stat().st_size for f in tmp_path.iterdir() if not f.name.startswith('.')) == 3000
+    assert (a.hits, a.misses) == (1, 1)
+
+    os.remove(b.file("k1"))
+    assert a.get("k1") is None and a.misses == 2
+    a.clear()
+    assert b.get("k0") is None
+
+def test_compressed_files(log_dir, tmp_path):
+    import asyncio, gzip, io, json, pickle, struct
+    from types import SimpleNamespace
+    from ml_dash import compressed_files
+    from ml_dash.config import Args, IndexArgs
+    from ml_dash.file_handlers import get_path
+    from ml_dash.schema.files.file_helpers import read_dataframe
+
+    run = tmp_path / "alice" / "run"
+    run.mkdir(parents=True)
+    with gzip.open(run / "metrics.pkl.gz", 'wb') as f:
+        for i in range(100):
+            pickle.dump(dict(step=i, loss=1. / (i + 1)), f)
+    with gzip.open(run / "outputs.log.gz", 'wt') as f:
+        f.write("".join(f"line {i}\n" for i in range(1000)))
+    Args.logdir, IndexArgs.metrics_index_dir = str(tmp_path), ""
+    try:
+        assert compressed_files.detect(b'\x28\xb5\x2f\xfd\x00') == "zstd"
+        assert compressed_files.detect(b'\x80\x04\x95') is None
+        df = read_dataframe(str(run / "metrics.pkl"))
+        assert len(df) == 100 and df['loss'].iloc[1] == 0.5
+
+        # note: the footer of a seekable zstd file with two frames, without the frames themselves.
+        table = struct.pack('<II', 10, 100) + struct.pack('<II', 12, 50) + struct.pack('<IBI', 2, 0, 0x8F92EAB1)
+        assert compressed_files.seek_table(io.BytesIO(table)) == [(0, 10, 0, 100), (10, 12, 100, 50)]
+
+        query = """
+            query Compressed ($id: ID!) {
+                metricsKeys (metricsFiles: ["/alice/run/metrics.pkl"])
+                series (metricsFiles: ["/alice/run/metrics.pkl"], xKey: "step", yKey: "loss", k: 1) { yCount }
+                node (id: $id) { ... on File { text (start: 998) } }
+            }
+        """
+        r = Client(schema).execute(query, variables=dict(id=to_global_id("File", "/alice/run/outputs.log")))
+        assert 'errors' not in r, r['errors']
+        assert r['data']['metricsKeys']['loss'] == dict(dtype='float64', count=100, runs=1)
+        assert r['data']['series']['yCount'] == [100]
+        assert r['data']['node']['text'] == "line 998\nline 999\n"
+
+        def get(file_path, headers=None, **args):
+            request = SimpleNamespace(args=args, headers=headers or {})
+            return asyncio.new_event_loop().run_until_complete(get_path(request, file_path))
+
+        assert get("alice/run/outputs.log", start="2", stop="4").body == b"line 2\nline 3\n"
+        r = get("alice/run/outputs.log", headers={'Range': 'bytes=7-13'})
+        assert r.status == 206 and r.body == b"line 1\n"
+        size = sum(len(f"line {i}\n") for i in range(1000))
+        r = get("alice/run/outputs.log", headers={'Range': f'bytes={size}-'})
+        assert r.status == 416 and r.headers['Content-Range'] == f"bytes */{size}"
+        assert get("alice/run/outputs.log", headers={'Range': 'bytes=13-7'}).status == 200
+        assert len(json.loads(get("alice/run/metrics.pkl", records="1", reservoir="5", seed="0").body)) == 5
+    finally:
+        Args.logdir = log_dir
+
+
+class MakeDirs:
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        import os
+        return os.makedirs, (self.path,)
+
+
+def test_record_decoder(log_dir, tmp_path):
+    import io, pickle
+    import numpy as np
+    import pandas as pd
+    from ml_dash.record_decoder import decode_columns
+    from ml_dash.record_stream import read_all
+
+    records = [dict(step=i, loss=np.float32(1 / (i + 1)), big=2 ** 40 + i, done=i % 2 == 0,
+                    lr=None if i % 3 else 0.1, **({'eval': -i} if i % 5 == 0 else {})) for i in range(300)]
+    buf = b"".join(pickle.dumps(r) for r in records)
+    df = pd.DataFrame(decode_columns(buf))
+    pd.testing.assert_frame_equal(df, pd.DataFrame(read_all(io.BytesIO(buf))))
+    assert df['loss'].dtype == np.float32 and df['eval'].isna().sum() == 240
+
+    with open(log_dir + "/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl", 'rb') as f:
+        buf = f.read()
+    pd.testing.assert_frame_equal(pd.DataFrame(decode_columns(buf)), pd.DataFrame(read_all(io.BytesIO(buf))))
+
+    # note: anything but flat dicts of scalars goes through the safe unpickler.
+    assert decode_columns(pickle.dumps(dict(step=0, note="hey"))) is None
+    assert decode_columns(pickle.dumps(dict(step=0)) + pickle.dumps(dict(step=1))[:-3]) is None
+    path = tmp_path / "pwned"
+    record, = read_all(io.BytesIO(pickle.dumps(dict(step=0, x=MakeDirs(str(path))))))
+    assert record['step'] == 0 and not path.exists()
+
+
+def test_memory_budget(log_dir):
+    from ml_dash.config import Args, MemoryArgs
+    from ml_dash.memory_budget import memory_budget, MemoryLimitError
+    from ml_dash.schema.files.series import get_series
+    Args.logdir = log_dir
+
+    # note: each of these metrics files has 8568 bytes.
+    runs = dict(metrics_files=["/episodeyang/cpc-belief/mdp/experiment_00/metrics.pkl",
+                               "/episodeyang/cpc-belief/mdp/experiment_01/metrics.pkl"], x_key="epoch", y_key="sine")
+    with memory_budget(soft=20_000, hard=None) as budget:
+        series = get_series(**runs)
+    assert series.warning is None and len(series._df) == 51
+    assert budget.peak > 0 and budget.used == 0, "the runs are released once the series is made"
+
+    with memory_budget(soft=10_000, hard=None):
+        series = get_series(**runs)
+    assert "sketches" in series.warning and len(series._df) <= MemoryArgs.degraded_k
+    assert series._df[('sine', 'count')].sum() == 102
+
+    with memory_budget(soft=None, hard=10_000):
+        series = get_series(**runs, k=10)
+    assert "first 1 of 2 runs" in series.warning and series._df[('sine', 'count')].sum() == 51
+
+    with memory_budget(soft=None, hard=1_000), pytest.raises(MemoryLimitError):
+        get_series(**runs, k=10)
+    with memory_budget(soft=None, hard=1_000):
+        r = Client(schema).execute("""
+            query Series ($metricsFiles: [String]!) {
+                series(metricsFiles: $metricsFiles, xKey: "epoch", yKey: "sine", k: 10) { xData warning }
+            }
+        """, variables=dict(metricsFiles=runs['metrics_files']))
+    assert "memory" in r['errors'][0]['message']
+
+
+def test_admission(log_dir, monkeypatch):
+    import asyncio
+    from ml_dash.admission import AdmissionController, AdmissionTimeoutError
+    from ml_dash.config import AdmissionArgs, Args
+    from ml_dash.server import app
+    Args.logdir = log_dir
+    monkeypatch.setattr(AdmissionArgs, "max_heavy_queries", 1)
+    monkeypatch.setattr(AdmissionArgs, "max_queue_wait", 0.2)
+
+    async def main():
+        controller, order = AdmissionController(), []
+
+        async def query(client, name, seconds=0.01):
+            async with controller.admit(client, cost=AdmissionArgs.heavy_query_cost):
+                order.append(name)
+                await asyncio.sleep(seconds)
+
+        # note: the second client does not wait behind all of the queries of the first.
+        await asyncio.gather(query("a", "a1"), query("a", "a2"), query("a", "a3"), query("b", "b1"))
+        assert order == ["a1", "a2", "b1", "a3"]
+
+        async with controller.admit("a", cost=0):
+            assert controller.running == 0, "light queries are not held back"
+
+        slow = asyncio.ensure_future(query("a", "slow", seconds=0.5))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionTimeoutError):
+            await query("b", "late")
+        assert controller.queue_depth() == 0 and controller.rejected == 1
+        await slow
+        return controller.metrics()
+
+    metrics = asyncio.new_event_loop().run_until_complete(main())
+    assert 'ml_dash_queries_total{class="heavy"} 6' in metrics
+    assert "ml_dash_heavy_queries_rejected_total 1" in metrics
+    assert 'ml_dash_heavy_query_wait_seconds_bucket{le="+Inf"} 5' in metrics
+
+    _, r = app.test_client.get('/metrics')
+    assert r.status == 200 and "ml_dash_heavy_queries_queued 0" in r.text
+
+
+
+def test_client_id(monkeypatch):
+    from types import SimpleNamespace
+    from ml_dash.admission import client_id
+    from ml_dash.config import AdmissionArgs
+
+    def request(**headers):
+        return SimpleNamespace(headers={k.replace('_', '-'): v for k, v in headers.items()},
+                               remote_addr="", ip="10.0.0.1")
+
+    proxied = request(X_Forwarded_For="6.6.6.6, 192.168.1.7")
+    assert client_id(proxied) == "10.0.0.1", "proxy headers are not trusted by default"
+    monkeypatch.setattr(AdmissionArgs, "trust_proxy_headers", True)
+    assert client_id(proxied) == "192.168.1.7", "the address that the proxy saw, not the one the client sent"
+    assert client_id(request(X_Real_IP="192.168.1.8")) == "192.168.1.8"
+    assert client_id(request()) == "10.0.0.1"
+
+    monkeypatch.setattr(AdmissionArgs, "client_header", "Authorization")
+    alice, bob = request(Authorization="Bearer alice"), request(Authorization="Bearer bob")
+    assert client_id(alice) != client_id(bob) and "alice" not in client_id(alice)
+    assert client_id(proxied) == "192.168.1.7"
+
+def test_glob_dependencies(tmp_path):
+    import os
+    from ml_dash.response_cache import ResponseCache, record
+    from ml_dash.schema.files.file_helpers import find_files
+
+    (tmp_path / "sweep1" / "run1").mkdir(parents=True)
+    (tmp_path / "sweep1" / "run1" / "parameters.pkl").write_bytes(b"")
+    (tmp_path / "sweep2").mkdir()
+    cache = ResponseCache()
+
+    def query():
+        with record() as deps:
+            files = [f['path'] for f in find_files(str(tmp_path), "**/parameters.pkl")]
+        cache.put("runs", files, deps)
+        return files
+
+    assert query() == ["sweep1/run1/parameters.pkl"]
+    assert cache.get("runs") is not None
+
+    # note: a directory without matches still changes when a run is added to it.
+    (tmp_path / "sweep2" / "run1").mkdir()
+    (tmp_path / "sweep2" / "run1" / "parameters.pkl").write_bytes(b"")
+    stat = os.stat(tmp_path / "sweep2")
+    os.utime(tmp_path / "sweep2", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.get("runs") is None
+    assert sorted(query()) == ["sweep1/run1/parameters.pkl", "sweep2/run1/parameters.pkl"]
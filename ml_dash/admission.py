@@ -0,0 +1,195 @@
+"""
+Admission control for heavy queries.
+
+Queries with an estimated cost of at least `AdmissionArgs.heavy_query_cost` are heavy.
+Each worker runs a few of them at once, and each client only some of those. Heavy
+queries over the limits wait in one queue per client, and the queues take turns, so
+that a client that sends 40 queries does not push the others back by 40. A query
+that waits longer than `max_queue_wait` is rejected with a 503, and can be retried.
+Light queries, and queries served from the response cache, are never held back.
+
+The counters are per worker process, and `/metrics` reports those of the worker that
+serves it, in the Prometheus text format.
+"""
+import time
+from collections import Counter, OrderedDict, deque
+
+# the upper bounds of the buckets of the wait time histogram, in seconds.
+WAIT_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60]
+
+
+class AdmissionTimeoutError(Exception):
+    pass
+
+
+def client_id(request):
+    """
+    the key of the queue of the client: the `client_header` when it is set, or the address.
+
+    Behind a proxy, the address is that of the proxy, unless `trust_proxy_headers` is on.
+    Only the last address of X-Forwarded-For is used, which is the one that the proxy saw:
+    the ones before it come from the client, and can be anything.
+    """
+    import hashlib
+    from ml_dash.config import AdmissionArgs
+    headers = request.headers
+    if AdmissionArgs.client_header and headers.get(AdmissionArgs.client_header):
+        # note: keeps a hash rather than the credentials.
+        return "header:" + hashlib.sha1(headers[AdmissionArgs.client_header].encode()).hexdigest()
+    if AdmissionArgs.trust_proxy_headers:
+        forwarded = headers.get('X-Real-IP') or headers.get('X-Forwarded-For', '').split(',')[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.remote_addr or request.ip
+
+
+class AdmissionController:
+    def __init__(self):
+        self.running = 0
+        self.clients = Counter()
+        # note: the order of the clients is the order that they take turns in.
+        self.queues = OrderedDict()
+        self.queries = Counter()
+        self.rejected = 0
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.
+
+    def queue_depth(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def has_room(self, client):
+        from ml_dash.config import AdmissionArgs
+        return self.running < AdmissionArgs.max_heavy_queries and \
+               self.clients[client] < AdmissionArgs.max_heavy_per_client
+
+    def start(self, client, queued_at):
+        import bisect
+        self.running += 1
+        self.clients[client] += 1
+        wait = time.monotonic() - queued_at
+        self.waits[bisect.bisect_left(WAIT_BUCKETS, wait)] += 1
+        self.wait_sum += wait
+
+    def release(self, client):
+        self.running -= 1
+        self.clients[client] -= 1
+        if not self.clients[client]:
+            del self.clients[client]
+        self.dispatch()
+
+    def dispatch(self):
+        """starts the waiting queries that fit, one per client per turn."""
+        admitted = True
+        while admitted and self.queues:
+            admitted = False
+            for client in list(self.queues):
+                if not self.has_room(client):
+                    continue
+                queue = self.queues.pop(client)
+                future, queued_at = queue.popleft()
+                self.start(client, queued_at)
+                future.set_result(None)
+                admitted = True
+                if queue:
+                    # note: the client goes to the back of the line.
+                    self.queues[client] = queue
+
+    def dequeue(self, client, entry):
+        queue = self.queues.get(client)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                del self.queues[client]
+
+    async def acquire(self, client):
+        """
+        waits for the turn of a heavy query.
+
+        :raises AdmissionTimeoutError: when the query waits for longer than `max_queue_wait`.
+        """
+        import asyncio
+        from ml_dash.config import AdmissionArgs
+        queued_at = time.monotonic()
+        if client not in self.queues and self.has_room(client):
+            self.start(client, queued_at)
+            return
+        entry = asyncio.get_running_loop().create_future(), queued_at
+        self.queues.setdefault(client, deque()).append(entry)
+        try:
+            await asyncio.wait([entry[0]], timeout=AdmissionArgs.max_queue_wait or None)
+        except BaseException:
+            # note: the request was cancelled, e.g. because the client went away.
+            if entry[0].done():
+                self.release(client)
+            else:
+                self.dequeue(client, entry)
+            raise
+        if not entry[0].done():
+            self.dequeue(client, entry)
+            self.rejected += 1
+            raise AdmissionTimeoutError(f"The server is busy with other heavy queries, and this one waited for "
+                                        f"{AdmissionArgs.max_queue_wait:g} seconds. Try again later.")
+
+    def admit(self, client, cost):
+        """:return: an async context manager that holds a slot for the query while it runs."""
+        from ml_dash.config import AdmissionArgs
+        heavy = bool(AdmissionArgs.heavy_query_cost) and cost >= AdmissionArgs.heavy_query_cost
+        self.queries["heavy" if heavy else "light"] += 1
+        return Slot(self, client) if heavy else NoSlot()
+
+    def metrics(self):
+        """the counters in the Prometheus text format."""
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.extend([f"# HELP ml_dash_{name} {help}", f"# TYPE ml_dash_{name} {kind}"])
+            lines.extend(f"ml_dash_{name}{labels} {value}" for labels, value in samples)
+
+        metric("queries_total", "counter", "GraphQL and series queries, by their estimated cost.",
+               [(f'{{class="{c}"}}', self.queries[c]) for c in ["light", "heavy"]])
+        metric("heavy_queries_running", "gauge", "heavy queries that are running.", [("", self.running)])
+        metric("heavy_queries_queued", "gauge", "heavy queries that wait for their turn.",
+               [("", self.queue_depth())])
+        metric("heavy_queries_rejected_total", "counter", "heavy queries that waited for too long.",
+               [("", self.rejected)])
+        buckets, total = [], 0
+        for le, count in zip([*WAIT_BUCKETS, "+Inf"], self.waits):
+            total += count
+            buckets.append((f'_bucket{{le="{le}"}}', total))
+        metric("heavy_query_wait_seconds", "histogram", "the time heavy queries waited for their turn.",
+               [*buckets, ("_sum", f"{self.wait_sum:.6f}"), ("_count", total)])
+        return "\n".join(lines) + "\n"
+
+
+class Slot:
+    def __init__(self, controller, client):
+        self.controller, self.client = controller, client
+
+    async def __aenter__(self):
+        await self.controller.acquire(self.client)
+
+    async def __aexit__(self, *exc):
+        self.controller.release(self.client)
+
+
+class NoSlot:
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+_controller = None
+
+
+async def get_metrics(request):
+    from sanic import response
+    return response.text(get_controller().metrics(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,209 @@
+"""
+Transparent reads of compressed metrics and log files.
+
+The archive job compresses old runs, as `metrics.pkl.zst` or `outputs.log.gz`. `open`
+detects gzip, zstd and lz4 by their magic bytes and decompresses as a stream, so the
+readers see the same bytes as before. `locate` finds the compressed file when the
+plain one is gone, so queries can keep asking for `metrics.pkl`.
+
+Decompressed files are seekable. Going forward decompresses and drops the bytes in
+between, and going back starts over. Files in the seekable zstd format end with a
+seek table of their frames, and a seek only decompresses the frame that it lands in.
+
+zstandard and lz4 are optional, and only imported for files that need them.
+"""
+import bisect
+import io
+import struct
+
+from ml_dash import storage
+
+GZIP, ZSTD, LZ4 = "gzip", "zstd", "lz4"
+EXTENSIONS = {ZSTD: ".zst", GZIP: ".gz", LZ4: ".lz4"}
+MAGIC = [(b'\x1f\x8b', GZIP), (b'\x28\xb5\x2f\xfd', ZSTD), (b'\x04\x22\x4d\x18', LZ4)]
+# note: zstd skippable frames, such as the seek table, can also start a file.
+SKIPPABLE_MAGIC = range(0x184D2A50, 0x184D2A60)
+SEEK_TABLE_MAGIC = 0x8F92EAB1
+SEEK_TABLE_FOOTER = 9
+CHUNK_SIZE = 1024 ** 2
+
+
+def detect(head):
+    """:return: the encoding of the file that starts with these bytes, or None when it is not compressed."""
+    for magic, encoding in MAGIC:
+        if head.startswith(magic):
+            return encoding
+    if len(head) >= 4 and struct.unpack('<I', head[:4])[0] in SKIPPABLE_MAGIC:
+        return ZSTD
+    return None
+
+
+def locate(path):
+    """the path, or its compressed version when only that exists."""
+    from ml_dash.response_cache import track
+    if storage.exists(path):
+        return path
+    for extension in EXTENSIONS.values():
+        if storage.exists(path + extension):
+            track(path + extension)
+            return path + extension
+    return path
+
+
+def encoding_of(path):
+    with storage.open(path, 'rb') as f:
+        return detect(f.read(4))
+
+
+def seek_table(f):
+    """
+    the frames of a file in the seekable zstd format.
+
+    :param f: the compressed file
+    :return: [(compressed offset, compressed size, decompressed offset, decompressed size)],
+        or None when the file has no seek table.
+    """
+    try:
+        f.seek(-SEEK_TABLE_FOOTER, io.SEEK_END)
+    except OSError:
+        return None
+    footer = f.read(SEEK_TABLE_FOOTER)
+    if len(footer) < SEEK_TABLE_FOOTER:
+        return None
+    count, descriptor, magic = struct.unpack('<IBI', footer)
+    if magic != SEEK_TABLE_MAGIC:
+        return None
+    entry_size = 12 if descriptor & 0x80 else 8
+    f.seek(-SEEK_TABLE_FOOTER - count * entry_size, io.SEEK_END)
+    entries = f.read(count * entry_size)
+    frames, c_offset, d_offset = [], 0, 0
+    for i in range(count):
+        c_size, d_size = struct.unpack_from('<II', entries, i * entry_size)
+        frames.append((c_offset, c_size, d_offset, d_size))
+        c_offset, d_offset = c_offset + c_size, d_offset + d_size
+    return frames
+
+
+def decompress_stream(f, encoding):
+    if encoding == GZIP:
+        import gzip
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    try:
+        if encoding == ZSTD:
+            import zstandard
+            return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(f, mode='rb')
+    except ImportError as e:
+        raise ImportError(f"{encoding} files need the {'zstandard' if encoding == ZSTD else 'lz4'} package. "
+                          f"Install it with `pip install ml-dash[compression]`.") from e
+
+
+class DecompressedReader(io.RawIOBase):
+    """a seekable, read-only file over the decompressed bytes of a compressed one."""
+
+    def __init__(self, path, encoding, raw=None):
+        """:param raw: the compressed file, when it is already open."""
+        self.path = path
+        self.encoding = encoding
+        self.pos = 0
+        self.raw = storage.open(path, 'rb') if raw is None else raw
+        self.frames = seek_table(self.raw) if encoding == ZSTD else None
+        self.raw.seek(0)
+        self.starts = None if self.frames is None else [d_offset for _, _, d_offset, _ in self.frames]
+        self.stream = None
+        # the decompressed frame of the seekable format that the last read landed in.
+        self.frame = None, b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def size(self):
+        if self.frames is not None:
+            return self.frames[-1][2] + self.frames[-1][3] if self.frames else 0
+        # note: the size of a stream is only known at its end.
+        while self.readinto(bytearray(CHUNK_SIZE)):
+            pass
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size()
+        if offset < 0:
+            raise ValueError("negative seek position")
+        if self.frames is not None:
+            self.pos = offset
+            return self.pos
+        if offset < self.pos:
+            self.restart()
+        while self.pos < offset:
+            if not self.readinto(bytearray(min(CHUNK_SIZE, offset - self.pos))):
+                break
+        return self.pos
+
+    def restart(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.raw.seek(0)
+        self.stream, self.pos = None, 0
+
+    def read_frame(self, index):
+        if self.frame[0] != index:
+            import zstandard
+            c_offset, c_size, _, _ = self.frames[index]
+            self.raw.seek(c_offset)
+            self.frame = index, zstandard.ZstdDecompressor().decompressobj().decompress(self.raw.read(c_size))
+        return self.frame[1]
+
+    def readinto(self, b):
+        if self.frames is not None:
+            index = bisect.bisect_right(self.starts, self.pos) - 1
+            # note: the seek table is a skippable frame after the data frames, not one of them.
+            if index < 0 or self.pos >= self.frames[index][2] + self.frames[index][3]:
+                return 0
+            data = self.read_frame(index)
+            offset = self.pos - self.frames[index][2]
+            n = min(len(b), len(data) - offset)
+            b[:n] = data[offset:offset + n]
+            self.pos += n
+            return n
+        if self.stream is None:
+            self.stream = decompress_stream(self.raw, self.encoding)
+        data = self.stream.read(len(b))
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.raw.close()
+        super().close()
+
+
+def open(path, mode='rb'):
+    """
+    opens a file for reading, decompressing it when it is compressed.
+
+    :param path: the physical path. Falls back to the compressed file when the path does not exist.
+    :param mode: 'rb' or 'r'
+    """
+    path = locate(path)
+    f = storage.open(path, 'rb')
+    try:
+        encoding = detect(f.read(4))
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    if encoding is not None:
+        f = io.BufferedReader(DecompressedReader(path, encoding, raw=f), buffer_size=CHUNK_SIZE)
+    return io.TextIOWrapper(f, encoding='utf-8') if 'b' not in mode else f
@@ -0,0 +1,149 @@
+"""
+Content-negotiated compression for the GraphQL and `/files` responses.
+
+`serve_precompressed` is a request middleware: when a file under `/files` has a
+`.br`, `.zst` or `.gz` sibling the client accepts, it serves that file as is. Like
+the static `/files` route, it only serves files under `Args.logdir`.
+
+`compress_response` is a response middleware: it compresses JSON and text
+bodies above `CompressionArgs.compress_min_size` with the best encoding both
+sides support. Compression runs in the default executor, off the event loop.
+Partial (206) responses are sent as is, since their `Content-Range` counts the
+bytes of the uncompressed file.
+
+brotli and zstd are optional. Install `brotli` or `zstandard` to enable them.
+"""
+import gzip
+from os.path import realpath, isfile, expanduser, join, sep
+from urllib.parse import unquote
+
+from sanic import response
+
+EXTENSIONS = dict(br=".br", zstd=".zst", gzip=".gz")
+COMPRESSIBLE_TYPES = ["application/json", "text/"]
+
+
+def compressors():
+    """returns the available encodings, mapped to their compress function. Built on first use."""
+    global _compressors
+    if _compressors is None:
+        _compressors = make_compressors()
+    return _compressors
+
+
+_compressors = None
+
+
+def make_compressors():
+    from ml_dash.config import CompressionArgs
+    level = CompressionArgs.compress_level
+    available = {}
+    for encoding in CompressionArgs.compress_encodings.split(','):
+        encoding = encoding.strip()
+        if encoding == "br":
+            try:
+                import brotli
+                available['br'] = lambda data: brotli.compress(data, quality=min(level, 11))
+            except ImportError:
+                pass
+        elif encoding == "zstd":
+            try:
+                import zstandard
+                available['zstd'] = lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+            except ImportError:
+                pass
+        elif encoding == "gzip":
+            available['gzip'] = lambda data: gzip.compress(data, compresslevel=min(level, 9))
+    return available
+
+
+def accepted_encodings(header):
+    """parses Accept-Encoding into a {encoding: q} dict."""
+    accepted = {}
+    for part in (header or "").split(','):
+        if not part.strip():
+            continue
+        encoding, *params = [_.strip() for _ in part.split(';')]
+        q = 1.
+        for p in params:
+            if p.startswith('q='):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.
+        accepted[encoding.lower()] = q
+    return accepted
+
+
+def negotiate(header, available):
+    """
+    picks the encoding to use.
+
+    :param header: the Accept-Encoding header of the request
+    :param available: encodings in the server's order of preference
+    :return: the encoding, or None to send the body as is.
+    """
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0)
+    best, best_q = None, 0
+    for encoding in available:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type):
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+def is_compressed_route(path):
+    return path.startswith('/graphql') or path.startswith('/files')
+
+
+async def serve_precompressed(request):
+    from ml_dash.config import Args
+    if request.method != 'GET' or not request.path.startswith('/files/') or 'Range' in request.headers:
+        return None
+
+    root = realpath(expanduser(Args.logdir))
+    path = realpath(join(root, unquote(request.path[len('/files/'):])))
+    if not path.startswith(root + sep) or not isfile(path):
+        return None
+
+    variants = [e for e in ['br', 'zstd', 'gzip'] if isfile(path + EXTENSIONS[e])]
+    encoding = negotiate(request.headers.get('Accept-Encoding'), variants)
+    if encoding is None:
+        return None
+
+    from mimetypes import guess_type
+    mime_type = guess_type(path)[0] or 'text/plain'
+    return await response.file(path + EXTENSIONS[encoding], mime_type=mime_type,
+                               headers={'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+
+
+async def compress_response(request, res):
+    from asyncio import get_event_loop
+    from ml_dash.config import CompressionArgs
+
+    body = getattr(res, 'body', None)
+    if not body or len(body) < CompressionArgs.compress_min_size:
+        return None
+    if not is_compressed_route(request.path) or 'Content-Encoding' in res.headers:
+        return None
+    if res.status == 206 or 'Content-Range' in res.headers:
+        return None
+    if not is_compressible(res.content_type or ""):
+        return None
+
+    available = compressors()
+    encoding = negotiate(request.headers.get('Accept-Encoding'), available)
+    if encoding is None:
+        return None
+
+    compressed = await get_event_loop().run_in_executor(None, available[encoding], body)
+    headers = {k: v for k, v in res.headers.items() if k.lower() != 'content-length'}
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return response.HTTPResponse(body_bytes=compressed, status=res.status, headers=headers,
+                                 content_type=res.content_type)
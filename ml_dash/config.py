@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from params_proto import ParamsProto, Proto, Flag
 
@@ -30,3 +31,108 @@ class ServerArgs(ParamsProto):
 class SSLArgs(ParamsProto):
     cert = Proto(None, dtype=str, help="the path to the SSL certificate")
     key = Proto(None, dtype=str, help="the path to the SSL key")
+
+
+class QueryArgs(ParamsProto):
+    max_query_cost = Proto(100_000, help="reject GraphQL queries with a higher estimated cost. 0 turns this off.")
+    query_deadline = Proto(60., help="seconds a GraphQL request may run before it is cancelled. 0 turns this off.")
+
+
+class MemoryArgs(ParamsProto):
+    soft_memory_limit = Proto(1024 ** 3, help="bytes of data a request may hold before its series are approximated, "
+                                              "downsampled or truncated. 0 turns this off.")
+    hard_memory_limit = Proto(4 * 1024 ** 3, help="bytes of data a request may hold before it is rejected. "
+                                                  "0 turns this off.")
+    degraded_k = Proto(200, help="the number of bins of a degraded series that does not set k.")
+
+
+class AdmissionArgs(ParamsProto):
+    heavy_query_cost = Proto(10_000, help="queries with at least this estimated cost wait for their turn when the "
+                                          "worker is busy. 0 turns this off.")
+    max_heavy_queries = Proto(4, help="heavy queries that each worker runs at once.")
+    max_heavy_per_client = Proto(2, help="heavy queries that each worker runs at once for the same client.")
+    max_queue_wait = Proto(30., help="seconds a heavy query may wait for its turn before it is rejected. "
+                                     "0 waits for as long as it takes.")
+    trust_proxy_headers = Flag("tell the clients apart by X-Real-IP or X-Forwarded-For, as set by the proxy in "
+                               "front of the server. Without it, every client of a proxy shares one queue.")
+    client_header = Proto(None, dtype=str, help="header that tells the clients apart when it is set, such as the "
+                                                "Authorization checked by an auth proxy. Takes precedence over "
+                                                "the address.")
+
+
+class CacheArgs(ParamsProto):
+    response_cache_size = Proto(256, help="number of GraphQL responses to keep in the cache. 0 turns it off.")
+    response_cache_ttl = Proto(None, dtype=float, help="optional max age of a cached response, in seconds.")
+
+
+class CompressionArgs(ParamsProto):
+    compress_encodings = Proto("br,zstd,gzip", help="encodings to offer, in order of preference.")
+    compress_min_size = Proto(4096, help="only compress responses of at least this many bytes.")
+    compress_level = Proto(5, help="the compression level.")
+
+
+class SharedCacheArgs(ParamsProto):
+    shared_cache_dir = Proto(None, dtype=str,
+                             help="directory for the metric columns shared by all workers, ideally on a tmpfs "
+                                  "such as /dev/shm/ml-dash. The cache is off when this is not set.")
+    shared_cache_size = Proto(2 * 1024 ** 3, help="max bytes of the shared cache, before evicting old entries.")
+
+
+class StartupArgs(ParamsProto):
+    warm_up = Proto(True, help="import pandas, ruamel.yaml and ml_logger in the background after the server starts.")
+
+
+class PoolArgs(ParamsProto):
+    processes = Proto(0, help="size of the process pool for series aggregation and record decoding. "
+                              "0 runs them inline, in the worker.")
+    pool_timeout = Proto(120., help="seconds before a task in the pool is killed. 0 turns this off.")
+    pool_min_rows = Proto(100_000, help="aggregate series with fewer rows inline, where the pool costs more than it saves.")
+
+
+class DiscoveryArgs(ParamsProto):
+    discovery_threads = Proto(8, help="threads that walk the top-level directories when finding experiments. "
+                                      "1 walks them one by one.")
+
+
+class SketchArgs(ParamsProto):
+    sketch_bins = Proto(1024, help="the number of x-bins in the sketch of each run, for approximate series.")
+    sketch_points = Proto(16, help="the number of quantiles kept for each bin of a sketch.")
+    sketch_cache_size = Proto(4096, help="the number of run sketches to keep in memory.")
+
+
+class IndexArgs(ParamsProto):
+    metrics_index_dir = Proto(os.path.join(os.path.expanduser("~"), ".cache", "ml-dash", "index"),
+                              help="directory for the key index of each metrics file, shared by the workers. It must "
+                                   "belong to the user of the server, with mode 0o700. Set to an empty string to keep "
+                                   "the indices in memory only.")
+
+
+class DeletionArgs(ParamsProto):
+    deletion_threads = Proto(16, help="threads that delete the subtrees of directories in the background.")
+    deletion_jobs_dir = Proto(os.path.join(os.path.expanduser("~"), ".cache", "ml-dash", "deletion-jobs"),
+                              help="directory for the state of the deletion jobs, so that any worker can report on "
+                                   "and cancel them. It must belong to the user of the server, with mode 0o700. Set "
+                                   "to an empty string to keep the jobs in the memory of their worker.")
+
+
+class MountArgs(ParamsProto):
+    mounts = Proto(None, dtype=str,
+                   help="mount table of virtual prefixes and physical roots, as `/=/data/logs;/team-x=/mnt/a,/mnt/b`. "
+                        "A prefix with several roots is their union. Defaults to `/` at the logdir.")
+
+
+class StorageArgs(ParamsProto):
+    s3_endpoint = Proto(None, dtype=str, help="endpoint of the S3 API for s3:// roots, e.g. http://localhost:9000 "
+                                              "for MinIO. Defaults to AWS.")
+    block_size = Proto(1024 ** 2, help="bytes of each ranged read from an object store.")
+    block_cache_dir = Proto(os.path.join(tempfile.gettempdir(), "ml-dash-blocks"),
+                            help="directory for the blocks read from object stores. "
+                                 "Set to an empty string to keep them in memory.")
+    block_cache_size = Proto(1024 ** 3, help="max bytes of the block cache, for all of the workers together. "
+                                             "In memory, the limit is per worker.")
+    stat_ttl = Proto(2., help="seconds to reuse the metadata of an object before asking the object store again.")
+
+
+class PickleArgs(ParamsProto):
+    trusted_pickles = Flag("unpickle any class in the logdir. By default, only numbers, containers, numpy and "
+                           "datetime types are built, and other classes become placeholders.")
@@ -0,0 +1,307 @@
+"""
+Background deletion of large directories.
+
+`shutil.rmtree` on a sweep with many thousands of files can take minutes over NFS,
+and blocks the event loop for all of that time. `submit` queues the deletion as a
+job and returns right away. Each job runs in its own coordinator thread, which
+deletes the files at the top of the directory and hands every subdirectory to a
+shared pool of `DeletionArgs.deletion_threads` threads, so that subtrees are
+deleted in parallel. The directory itself goes last.
+
+Jobs count the files and directories they have deleted, and can be cancelled
+between any two of them. Sanic runs several workers, and a query for a job can land
+on any of them, so the worker that runs a job saves its state to a json file in
+`DeletionArgs.deletion_jobs_dir`, a few times a second. The other workers read it
+from there, and cancel the job by leaving a `<id>.cancel` marker next to it, which
+the job picks up just as often. Without the directory, jobs live in the memory of
+the worker that runs them.
+
+On an object store, a directory is the prefix of its keys, which the job deletes
+in batches of 1000, in its coordinator thread.
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ml_dash import storage
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = "queued", "running", "done", "cancelled", "failed"
+# finished jobs to keep around for their progress queries.
+MAX_FINISHED = 1000
+# seconds between the saves of the state of a running job, and the checks for its cancel marker.
+SYNC_INTERVAL = 0.2
+# seconds to keep the state files of finished jobs.
+STATE_TTL = 24 * 3600
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_pool = None
+
+
+class CancelledDeletion(Exception):
+    pass
+
+
+def jobs_dir():
+    """the directory of the state files, or None when the jobs live in memory only."""
+    from ml_dash.config import DeletionArgs
+    path = DeletionArgs.deletion_jobs_dir
+    return path if path and storage.private_dir(path, "the deletion jobs") else None
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Job:
+    STATE = ["id", "path", "status", "deleted", "subtrees", "subtrees_done", "errors", "created", "finished", "pid"]
+
+    def __init__(self, path):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.status = QUEUED
+        self.deleted = 0
+        self.subtrees = 0
+        self.subtrees_done = 0
+        self.errors = []
+        self.created = time.time()
+        self.finished = None
+        # the worker that runs the job.
+        self.pid = os.getpid()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._synced = 0.
+
+    @classmethod
+    def load(cls, id):
+        """the job of another worker, from its state file. None when there is no such job."""
+        directory = jobs_dir()
+        if directory is None or not re.fullmatch(r"[0-9a-f]{32}", id):
+            return None
+        try:
+            with open(os.path.join(directory, id + ".json"), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(state['path'])
+        for key in cls.STATE:
+            setattr(job, key, state[key])
+        if job.status in [QUEUED, RUNNING] and not is_running(job.pid):
+            job.status, job.errors = FAILED, [*job.errors, "the worker that ran the job is gone"]
+        return job
+
+    def save(self):
+        directory = jobs_dir()
+        if directory is None:
+            return
+        with self._lock:
+            state = {key: getattr(self, key) for key in self.STATE}
+            state['errors'] = list(self.errors)
+        file = os.path.join(directory, self.id + ".json")
+        tmp = f"{file}.tmp-{threading.get_ident()}"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, file)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def sync(self, force=False):
+        """saves the state of the job for the other workers, and picks up their cancel marker."""
+        now = time.monotonic()
+        if not force and now - self._synced < SYNC_INTERVAL:
+            return
+        self._synced = now
+        directory = jobs_dir()
+        if directory is None:
+            return
+        if os.path.exists(os.path.join(directory, self.id + ".cancel")):
+            self._cancel.set()
+        self.save()
+
+    @property
+    def progress(self):
+        """the fraction of the subtrees that are deleted."""
+        if self.status == DONE:
+            return 1.
+        return self.subtrees_done / self.subtrees if self.subtrees else 0.
+
+    def cancel(self):
+        """cancels the job, which can also run in another worker."""
+        self._cancel.set()
+        directory = jobs_dir()
+        if directory is not None and self.status in [QUEUED, RUNNING]:
+            try:
+                open(os.path.join(directory, self.id + ".cancel"), 'w').close()
+            except OSError:
+                pass
+        return self.status in [QUEUED, RUNNING]
+
+    def count(self, n=1):
+        with self._lock:
+            self.deleted += n
+
+    def check(self):
+        self.sync()
+        if self._cancel.is_set():
+            raise CancelledDeletion()
+
+
+def get_pool():
+    global _pool
+    from ml_dash.config import DeletionArgs
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(DeletionArgs.deletion_threads, thread_name_prefix="deletion")
+    return _pool
+
+
+def remove(path, job, is_dir):
+    """removes one file or empty directory. Something else deleting it first is fine."""
+    job.check()
+    try:
+        if is_dir:
+            os.rmdir(path)
+        else:
+            os.remove(path)
+        job.count()
+    except FileNotFoundError:
+        pass
+
+
+def delete_tree(root, job):
+    """deletes the subtree bottom-up, checking for cancellation between entries."""
+    errors = []
+
+    def onerror(e):
+        errors.append(f"{e.filename}: {e.strerror}")
+
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False, onerror=onerror):
+        for name in filenames:
+            try:
+                remove(os.path.join(dirpath, name), job, is_dir=False)
+            except OSError as e:
+                errors.append(f"{e.filename}: {e.strerror}")
+        for name in dirnames:
+            path = os.path.join(dirpath, name)
+            try:
+                # note: os.walk does not descend into symlinks to directories, so remove the link.
+                remove(path, job, is_dir=not os.path.islink(path))
+            except OSError as e:
+                errors.append(f"{e.filename}: {e.strerror}")
+    remove(root, job, is_dir=True)
+    return errors
+
+
+def run(job):
+    job.status = RUNNING
+    job.sync(force=True)
+    try:
+        job.check()
+        if storage.is_url(job.path):
+            job.subtrees = 1
+            storage.get_driver(job.path).delete_prefix(job.path, job)
+            job.subtrees_done = 1
+            job.status = DONE
+            return
+        with os.scandir(job.path) as it:
+            entries = [(entry.path, entry.is_dir(follow_symlinks=False)) for entry in it]
+        dirs = [path for path, is_dir in entries if is_dir]
+        job.subtrees = len(dirs) + 1
+        job.sync(force=True)
+
+        pool = get_pool()
+        futures = [pool.submit(delete_tree, path, job) for path in dirs]
+        for path, is_dir in entries:
+            if not is_dir:
+                try:
+                    remove(path, job, is_dir=False)
+                except OSError as e:
+                    job.errors.append(f"{e.filename}: {e.strerror}")
+        for future in futures:
+            try:
+                job.errors.extend(future.result())
+            except CancelledDeletion:
+                pass
+            except OSError as e:
+                job.errors.append(str(e))
+            job.subtrees_done += 1
+        job.check()
+        if job.errors:
+            raise OSError(f"could not delete {len(job.errors)} entries")
+        remove(job.path, job, is_dir=True)
+        job.subtrees_done += 1
+        job.status = DONE
+    except CancelledDeletion:
+        job.status = CANCELLED
+    except Exception as e:
+        job.errors.append(str(e))
+        job.status = FAILED
+    finally:
+        job.finished = time.time()
+        job.save()
+        prune()
+
+
+def prune():
+    with _lock:
+        finished = [id for id, job in _jobs.items() if job.finished]
+        for id in finished[:max(len(finished) - MAX_FINISHED, 0)]:
+            del _jobs[id]
+    directory = jobs_dir()
+    if directory is None:
+        return
+    # note: running jobs save their state every SYNC_INTERVAL, so only finished jobs get this old.
+    for name in os.listdir(directory):
+        file = os.path.join(directory, name)
+        try:
+            if time.time() - os.stat(file).st_mtime > STATE_TTL:
+                os.remove(file)
+        except OSError:
+            pass
+
+
+def submit(path):
+    """
+    queues the deletion of a directory.
+
+    :param path: the absolute path to the directory
+    :return: the Job. Raises FileNotFoundError when the directory does not exist.
+    """
+    if not storage.isdir(path):
+        raise FileNotFoundError(path)
+    job = Job(path)
+    with _lock:
+        _jobs[job.id] = job
+    job.save()
+    threading.Thread(target=run, args=(job,), name=f"deletion-{job.id}", daemon=True).start()
+    return job
+
+
+def get_job(id):
+    """the job of this worker, or the last state that another worker saved of its job."""
+    with _lock:
+        job = _jobs.get(id)
+    return job if job is not None else Job.load(id)
+
+
+def cancel(id):
+    """:return: the job, or None when there is no such job."""
+    job = get_job(id)
+    if job is not None:
+        job.cancel()
+    return job
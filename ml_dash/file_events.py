@@ -4,6 +4,7 @@ from sanic import response
 from sanic.exceptions import RequestTimeout
 
 from ml_dash.file_utils import path_match
+from ml_dash.response_cache import get_cache
 from termcolor import cprint
 
 from . import config
@@ -20,6 +21,7 @@ class Handler(AIOEventHandler):
     @coroutine
     async def on_any_event(self, event):
         _event = dict(src_path=event.src_path, event_type=event.event_type, is_directory=event.is_directory)
+        get_cache().invalidate(event.src_path)
         for que in subscriptions:
             await que.put(_event)
             # self._loop.create_task(que.put(event))
@@ -1,10 +1,10 @@
+import io
 import os
 import stat
 from glob import iglob
-from shutil import rmtree
 from sanic import response
 
-from . import config
+from . import mounts, storage, compressed_files
 
 
 def get_type(mode):
@@ -17,29 +17,29 @@ def get_type(mode):
 
 async def remove_path(request, file_path=""):
     print(file_path)
-    path = os.path.join(config.Args.logdir, file_path)
-    if os.path.isdir(path):
-        rmtree(path)
-        res = response.text("ok", status=204)
-    elif os.path.isfile(path):
-        os.remove(path)
+    path = mounts.resolve('/' + file_path)
+    if storage.isdir(path):
+        from ml_dash import deletion_jobs
+        # note: large directories take minutes to delete, so this only queues the deletion. Clients
+        #  poll /deletions/<job> for its progress.
+        job = deletion_jobs.submit(path)
+        res = response.json(dict(job=job.id), status=202)
+    elif storage.isfile(path):
+        storage.delete(path)
         res = response.text("ok", status=204)
     else:
         res = response.text('Not found', status=404)
     return res
 
 
-from contextlib import contextmanager
-
-
-@contextmanager
-def cwdContext(path):
-    owd = os.getcwd()
-    os.chdir(path)
-    try:
-        yield
-    finally:
-        os.chdir(owd)
+async def deletion_job(request, job_id):
+    """the progress of a deletion that `remove_path` queued. DELETE cancels it."""
+    from ml_dash import deletion_jobs
+    job = deletion_jobs.cancel(job_id) if request.method == 'DELETE' else deletion_jobs.get_job(job_id)
+    if job is None:
+        return response.text('Not found', status=404)
+    return response.json(dict(id=job.id, path=mounts.to_virtual(job.path), status=job.status, deleted=job.deleted,
+                              progress=job.progress, errors=job.errors))
 
 
 async def batch_get_path(request):
@@ -53,8 +53,8 @@ async def batch_get_path(request):
 
         if options.get('json', False):
             for path in file_paths:
-                from ml_logger.helpers import load_from_pickle
-                batch_res_data[path] = [_ for _ in load_from_pickle(path)]
+                from ml_dash.record_stream import load_records
+                batch_res_data[path] = load_records(path)
 
             res = response.json(batch_res_data, status=200, content_type='application/json')
             return res
@@ -65,6 +65,28 @@ async def batch_get_path(request):
         return res
 
 
+def read_window(request, path):
+    """
+    the decompressed bytes of the file, or the `Range: bytes=start-stop` window of them.
+
+    :return: (bytes, status, headers). A window past the end of the data is a 416.
+    """
+    import re
+    _range = re.fullmatch(r"bytes=(\d+)-(\d*)", request.headers.get('Range', '').strip())
+    with compressed_files.open(path, 'rb') as f:
+        start = 0 if _range is None else int(_range.group(1))
+        stop = int(_range.group(2)) + 1 if _range and _range.group(2) else None
+        # note: a range that ends before it starts is invalid, and is ignored.
+        if _range is None or stop is not None and stop <= start:
+            return f.read(), 200, None
+        f.seek(start)
+        data = f.read() if stop is None else f.read(stop - start)
+        if not data:
+            return b"", 416, {'Content-Range': f"bytes */{f.seek(0, io.SEEK_END)}"}
+    # note: the decompressed size is not known without reading all of it.
+    return data, 206, {'Content-Range': f"bytes {start}-{start + len(data) - 1}/*"}
+
+
 async def get_path(request, file_path=""):
     print(file_path)
 
@@ -82,42 +104,64 @@ async def get_path(request, file_path=""):
     stop = None if _stop is None else int(_stop)
 
     reservoir_k = int(request.args.get('reservoir', '200'))
+    # note: makes the reservoir sample deterministic.
+    _seed = request.args.get('seed', None)
+    seed = None if _seed is None else int(_seed)
 
     # limit for the search itself.
     search_limit = 500
 
-    path = os.path.join(config.Args.logdir, file_path)
-    print("=============>", [query], [path], os.path.isdir(path))
+    path = mounts.resolve('/' + file_path)
+    is_dir = storage.isdir(path)
+    print("=============>", [query], [path], is_dir)
 
-    if os.path.isdir(path):
+    if is_dir:
+        from glob import escape
         from itertools import islice
-        with cwdContext(path):
-            print(os.getcwd(), query, is_recursive)
-            file_paths = list(islice(iglob(query, recursive=is_recursive), start or 0, stop or 200))
-            files = map(file_stat, file_paths)
-            res = response.json(files, status=200)
-    elif os.path.isfile(path):
-        if as_records:
-            from ml_logger.helpers import load_pickle_as_dataframe
-            df = load_pickle_as_dataframe(path, reservoir_k)
-            res = response.text(df.to_json(orient="records"), status=200, content_type='application/json')
-        elif as_log:
-            from ml_logger.helpers import load_pickle_as_dataframe
-            df = load_pickle_as_dataframe(path, reservoir_k)
-            res = response.text(df.to_json(orient="records"), status=200, content_type='application/json')
+        print(path, query, is_recursive)
+        if storage.is_url(path):
+            file_paths = (str(p) for p in storage.glob(path, query))
+        else:
+            # note: glob from the directory instead of changing into it, which is not thread-safe.
+            file_paths = (os.path.relpath(p, path) for p in
+                          iglob(os.path.join(escape(path), query), recursive=is_recursive))
+        files = [file_stat(p, root=path) for p in islice(file_paths, start or 0, stop or 200)]
+        res = response.json(files, status=200)
+    elif storage.isfile(path) or compressed_files.locate(path) != path:
+        if as_records or as_log:
+            from ml_dash import process_pool
+            from ml_dash.schema.files.file_helpers import read_records
+            if process_pool.enabled():
+                try:
+                    text = await process_pool.run_async(read_records, path, reservoir_k, seed)
+                except process_pool.PoolTimeoutError as e:
+                    return response.text(str(e), status=503)
+            else:
+                text = read_records(path, reservoir_k, seed)
+            res = response.text(text, status=200, content_type='application/json')
         elif as_json:
-            from ml_logger.helpers import load_from_pickle
-            data = [_ for _ in load_from_pickle(path)]
+            from ml_dash.record_stream import load_records
+            data = load_records(path)
             res = response.json(data, status=200, content_type='application/json')
         elif type(start) is int or type(stop) is int:
             from itertools import islice
-            with open(path, 'r') as f:
+            with compressed_files.open(path, 'r') as f:
                 text = ''.join([l for l in islice(f, start, stop)])
             res = response.text(text, status=200)
         else:
             # todo: check the file handling here. Does this use correct
             #  mimeType for text files?
-            res = await response.file(path)
+            if compressed_files.locate(path) != path:
+                from mimetypes import guess_type
+                # note: the compressed version of the file, which is served as the file itself.
+                data, status, headers = read_window(request, path)
+                res = response.raw(data, status=status, content_type=guess_type(path)[0] or 'text/plain',
+                                   headers=headers)
+            elif storage.is_url(path):
+                from mimetypes import guess_type
+                res = response.raw(storage.read(path), content_type=guess_type(path)[0] or 'text/plain')
+            else:
+                res = await response.file(path)
             if as_attachment:
                 res.headers['Content-Disposition'] = 'attachment'
     else:
@@ -126,16 +170,16 @@ async def get_path(request, file_path=""):
 
 
 # use glob! LOL
-def file_stat(file_path):
+def file_stat(file_path, root=None):
     # this looped over is very slow. Fine for a small list of files though.
-    stat_res = os.stat(file_path)
-    ft = get_type(stat_res.st_mode)
-    sz = stat_res.st_size
+    stat_res = storage.stat(os.path.join(root, file_path) if root else file_path)
+    ft = 'dir' if stat_res.is_dir else 'file'
+    sz = stat_res.size
     return dict(
         name=os.path.basename(file_path),
         path=file_path,
-        mtime=stat_res.st_mtime,
-        ctime=stat_res.st_ctime,
+        mtime=stat_res.mtime,
+        ctime=stat_res.ctime,
         type=ft,
         size=sz,
     )
@@ -0,0 +1,119 @@
+import json
+
+from graphql import parse, GraphQLError
+from graphql.language import ast
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.language.printer import print_ast
+from graphql_server import HttpQueryError
+from sanic.response import HTTPResponse
+from sanic_graphql import GraphQLView
+
+from ml_dash import response_cache
+from ml_dash.admission import client_id, get_controller, AdmissionTimeoutError
+from ml_dash.memory_budget import memory_budget
+from ml_dash.query_budget import check_budget, deadline, QueryCostError
+
+
+def get_operations(data, args):
+    """
+    returns the (query, variables, operation_name) triplets of the request.
+
+    :param data: the parsed request body, a dict or a list of dicts for batched queries.
+    :param args: the url query arguments
+    :return: list of triplets
+    """
+    batch = data if isinstance(data, list) else [data or {}]
+    operations = []
+    for params in batch:
+        query = params.get('query') or args.get('query')
+        variables = params.get('variables') or args.get('variables')
+        if isinstance(variables, str):
+            variables = json.loads(variables)
+        operation_name = params.get('operationName') or args.get('operationName')
+        if query:
+            operations.append((query, variables, operation_name))
+    return operations
+
+
+def has_errors(body):
+    """whether any of the results in the response body has top-level errors."""
+    try:
+        results = json.loads(body)
+    except ValueError:
+        return True
+    return any(not isinstance(r, dict) or r.get('errors') for r in (results if isinstance(results, list) else [results]))
+
+
+def is_read_only(document):
+    return all(d.operation == 'query' for d in document.definitions
+               if isinstance(d, ast.OperationDefinition))
+
+
+class DashGraphQLView(GraphQLView):
+    """
+    GraphQLView that rejects queries over the cost budget before executing them,
+    runs the rest under the per-request deadline in `config.QueryArgs` and the memory
+    limits in `config.MemoryArgs`, and serves
+    repeated read-only queries from the response cache. Heavy queries that miss the
+    cache wait for their turn, see `admission`.
+
+    Resolvers may return coroutines, which run on the event loop of the worker.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._enable_async = True
+
+    def get_executor(self, request):
+        from asyncio import get_event_loop
+        # note: one per request, because the sanic test client runs each app on a new loop.
+        return AsyncioExecutor(loop=get_event_loop())
+
+    async def dispatch_request(self, request, *args, **kwargs):
+        from ml_dash.config import Args, MemoryArgs, MountArgs, QueryArgs
+
+        if request.method.lower() == 'options':
+            return await super().dispatch_request(request, *args, **kwargs)
+
+        try:
+            data = self.parse_body(request)
+            operations = [(parse(query), variables, operation_name)
+                          for query, variables, operation_name in get_operations(data, request.args)]
+        except (GraphQLError, HttpQueryError, ValueError):
+            # note: let the regular handler report syntax and body errors.
+            operations = []
+
+        cost = 0
+        try:
+            for document, variables, operation_name in operations:
+                cost += check_budget(document, variables, operation_name)
+        except QueryCostError as e:
+            return self.error_response(str(e), status=400)
+
+        key = None
+        show_graphiql = request.method.lower() == 'get' and self.should_display_graphiql(request)
+        cacheable = operations and not show_graphiql and all(is_read_only(d) for d, *_ in operations)
+        if cacheable:
+            key = response_cache.cache_key(
+                Args.logdir, MountArgs.mounts, self.batch, isinstance(data, list), request.args.get('pretty'),
+                [(print_ast(document), variables, operation_name) for document, variables, operation_name in operations])
+            body = response_cache.get_cache().get(key)
+            if body is not None:
+                return HTTPResponse(body_bytes=body, status=200, content_type='application/json')
+
+        try:
+            async with get_controller().admit(client_id(request), cost):
+                with deadline(QueryArgs.query_deadline), response_cache.record() as deps, \
+                        memory_budget(MemoryArgs.soft_memory_limit, MemoryArgs.hard_memory_limit):
+                    response = await super().dispatch_request(request, *args, **kwargs)
+        except AdmissionTimeoutError as e:
+            return self.error_response(str(e), status=503, headers={'Retry-After': '5'})
+
+        # note: don't cache errors, they are often transient (deadlines, files being written).
+        if key and response.status == 200 and not has_errors(response.body):
+            response_cache.get_cache().put(key, response.body, deps)
+        return response
+
+    def error_response(self, message, status, headers=None):
+        return HTTPResponse(self.encode({'errors': [{'message': message}]}),
+                            status=status, headers=headers, content_type='application/json')
@@ -0,0 +1,149 @@
+"""
+Per-request memory accounting.
+
+The loaders charge the request for the data they hold: the decoded columns of each
+metrics file, and the pooled runs that a series aggregates. A series that would go
+over the soft limit is degraded instead: it is approximated from per-run sketches,
+which only hold one run at a time, and downsampled to `MemoryArgs.degraded_k` bins
+when it has no `k`. Runs that would not fit under the hard limit are left out. Each
+of these sets the `warning` of the series. A charge over the hard limit fails the
+request with `MemoryLimitError`.
+
+The numbers are estimates. Files are sized up from their size on disk before they are
+read, and charged by the size of their columns after. The temporary copies that pandas makes are not
+counted.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# the decoded size of a compressed metrics file, relative to its size on disk.
+COMPRESSION_RATIO = 4
+
+
+class MemoryLimitError(Exception):
+    pass
+
+
+def mb(nbytes):
+    return f"{nbytes / 1024 ** 2:.0f} MB"
+
+
+class MemoryBudget:
+    def __init__(self, soft=None, hard=None):
+        self.soft, self.hard = soft, hard
+        self.used = self.peak = 0
+        self.lock = threading.Lock()
+
+    def charge(self, nbytes, what="data"):
+        with self.lock:
+            if self.hard and self.used + nbytes > self.hard:
+                raise self.limit_error(what)
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+
+    def limit_error(self, what):
+        return MemoryLimitError(f"The query needs more than the {mb(self.hard)} of memory that a request may use, "
+                                f"at {what}. Pass `k` or `approximate` to `series`, or read fewer metrics files.")
+
+    def release(self, nbytes):
+        with self.lock:
+            self.used = max(self.used - nbytes, 0)
+
+
+_budget = ContextVar("memory_budget", default=None)
+# the charges of the innermost `scope`, which are released when it exits.
+_scope = ContextVar("memory_scope", default=None)
+
+
+@contextmanager
+def memory_budget(soft=None, hard=None):
+    """runs the block with a memory budget. `None` or 0 turns a limit off."""
+    budget = MemoryBudget(soft, hard) if soft or hard else None
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+@contextmanager
+def scope():
+    """
+    releases the charges made in the block when it exits, for data that does not
+    outlive the block. Threads started in the block with a copy of the context add
+    their charges to it.
+    """
+    charges = []
+    token = _scope.set(charges)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        budget = _budget.get()
+        if budget is not None:
+            budget.release(sum(charges))
+
+
+def active():
+    return _budget.get() is not None
+
+
+def charge(nbytes, what="data", held=False):
+    """
+    :param held: the data is held until the end of the request, e.g. in the dataframe
+        memo, so the charge outlives the current scope.
+    :raises MemoryLimitError: when the request goes over the hard limit.
+    """
+    budget = _budget.get()
+    if budget is None or not nbytes:
+        return
+    budget.charge(nbytes, what)
+    charges = _scope.get()
+    if charges is not None and not held:
+        charges.append(nbytes)
+
+
+def used():
+    budget = _budget.get()
+    return 0 if budget is None else budget.used
+
+
+def degraded(nbytes=0):
+    """whether another nbytes would take the request over the soft limit."""
+    budget = _budget.get()
+    return budget is not None and bool(budget.soft) and budget.used + nbytes > budget.soft
+
+
+def fitting(sizes, what="data"):
+    """
+    the number of leading items of sizes that fit under the hard limit together.
+
+    :raises MemoryLimitError: when not even the first one fits.
+    """
+    budget = _budget.get()
+    if budget is None or not budget.hard:
+        return len(sizes)
+    total = budget.used
+    for i, size in enumerate(sizes):
+        total += size
+        if total > budget.hard:
+            if i == 0:
+                raise budget.limit_error(what)
+            return i
+    return len(sizes)
+
+
+def frame_bytes(df):
+    return 0 if df is None else int(df.memory_usage(index=True, deep=False).sum())
+
+
+def file_bytes(path):
+    """an estimate of the decoded size of a metrics file, from its size on disk."""
+    from ml_dash import compressed_files, storage
+    _path = compressed_files.locate(path)
+    try:
+        size = storage.stat(_path).size
+    except (FileNotFoundError, NotADirectoryError):
+        return 0
+    return size * COMPRESSION_RATIO if _path != path else size
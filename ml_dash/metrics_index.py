@@ -0,0 +1,281 @@
+"""
+Sidecar index of the keys of each metrics file.
+
+ml_logger only ever appends records to a metrics file. The index of a file keeps
+the byte offset that it has read up to, and on each lookup it decodes only the
+records that were appended since. For every key, it keeps the dtype, the number
+of rows that have the key, and the first and last values, which is the x range
+for the x key. Numeric keys also keep their min and max, and the rows they are
+at. `keys` and `summary` are then a stat and a small json read, however long the
+run.
+
+- Indices are written to `IndexArgs.metrics_index_dir`, named after the hash of
+  the file's real path, and not next to the metrics file. Writing into the logdir
+  would change the mtime of the experiment, and invalidate its cached responses.
+- Each index also keeps the bytes right before its offset. When they no longer
+  match, the file was rewritten rather than appended to, and we start over.
+- Indices are written to a temporary file and published with an atomic rename,
+  so that the workers can share them.
+- The directory must belong to the user of the server, and be closed to the
+  others, who could otherwise plant indices that we would serve as data. Indices
+  are kept in memory only when it is not.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from os.path import join
+
+from ml_dash import storage, compressed_files
+
+VERSION = 3
+FINGERPRINT_SIZE = 64
+# the indices that each worker keeps in memory, to skip the json read.
+MEMORY_SIZE = 4096
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def index_dir():
+    from ml_dash.config import IndexArgs
+    return IndexArgs.metrics_index_dir
+
+
+def index_path(path):
+    return join(index_dir(), hashlib.sha1(storage.realpath(path).encode()).hexdigest() + ".json")
+
+
+def value_kind(value):
+    """the dtype of a value, in the terms of pandas. None for missing values."""
+    import numpy as np
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, (int, np.integer)):
+        return "int64"
+    if isinstance(value, (float, np.floating)):
+        return None if value != value else "float64"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, (np.datetime64,)) or hasattr(value, "isoformat"):
+        return "datetime64"
+    return "object"
+
+
+def merge_kinds(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {"int64", "float64"}:
+        return "float64"
+    return "object"
+
+
+def json_scalar(value):
+    """the value, if it fits into json as a scalar."""
+    import numpy as np
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        # note: json has no NaN or Infinity, and the standard parsers reject them.
+        return None
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return None
+
+
+def new_index():
+    return dict(version=VERSION, offset=0, fingerprint="", rows=0, keys={})
+
+
+def update_key(entry, value, row):
+    kind = value_kind(value)
+    entry.setdefault('dtype', None)
+    entry.setdefault('count', 0)
+    # note: a key that is always missing still is a column of the DataFrame.
+    if kind is None:
+        return
+    entry['dtype'] = merge_kinds(entry['dtype'], kind)
+    entry['count'] += 1
+    value = json_scalar(value)
+    if 'first' not in entry:
+        entry['first'], entry['first_row'] = value, row
+    entry['last'], entry['last_row'] = value, row
+    # note: infinities are left out of the min and max, like NaN.
+    if kind in ["int64", "float64"] and value is not None:
+        if entry.get('min') is None or value < entry['min']:
+            entry['min'], entry['argmin'] = value, row
+        if entry.get('max') is None or value > entry['max']:
+            entry['max'], entry['argmax'] = value, row
+
+
+def update_index(index, f):
+    """
+    reads the records that were appended after index['offset'].
+
+    :param index: the index, updated in place
+    :param f: the metrics file, opened in binary mode
+    :return: the index
+    """
+    from ml_dash.record_stream import read_record
+    f.seek(index['offset'])
+    while True:
+        try:
+            record = read_record(f)
+        except EOFError:
+            break
+        except Exception:
+            # note: the last record can be half-written while ml_logger appends to it.
+            break
+        row = index['rows']
+        if isinstance(record, dict):
+            for key, value in record.items():
+                update_key(index['keys'].setdefault(str(key), {}), value, row)
+        index['rows'] = row + 1
+        index['offset'] = f.tell()
+
+    start = max(index['offset'] - FINGERPRINT_SIZE, 0)
+    f.seek(start)
+    index['fingerprint'] = f.read(index['offset'] - start).hex()
+    return index
+
+
+def is_valid(index, f, size):
+    """the file still starts with what the index has read."""
+    if index is None or index.get('version') != VERSION or size < index['offset']:
+        return False
+    start = max(index['offset'] - FINGERPRINT_SIZE, 0)
+    f.seek(start)
+    return f.read(index['offset'] - start).hex() == index['fingerprint']
+
+
+def load_index(path):
+    if not index_dir() or not storage.private_dir(index_dir(), "the metrics index"):
+        return None
+    try:
+        with open(index_path(path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_index(path, index):
+    if not index_dir() or not storage.private_dir(index_dir(), "the metrics index"):
+        return
+    file = index_path(path)
+    tmp = f"{file}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, file)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def get_index(path):
+    """
+    the up-to-date index of the metrics file.
+
+    :param path: the absolute path to the metrics file
+    :return: dict(rows, keys={key: dict(dtype, count, first, last, first_row, last_row)}), or None when the
+        file does not exist. Numeric keys also have min, max, argmin and argmax, where the arg is the row.
+    """
+    from ml_dash.query_budget import check_deadline
+    from ml_dash.response_cache import track
+    check_deadline()
+    track(path)
+    path = compressed_files.locate(path)
+    try:
+        s = storage.stat(path)
+    except OSError:
+        return None
+    stamp = [s.size, s.etag]
+
+    with _lock:
+        index = _memory.get(path)
+        if index is not None:
+            _memory.move_to_end(path)
+    if index is not None and index['stamp'] == stamp:
+        return index
+
+    index = index if index is not None else load_index(path)
+    if index is not None and index.get('stamp') == stamp:
+        changed = False
+    else:
+        changed = True
+        try:
+            # note: compressed files are rewritten rather than appended to, so they start over.
+            compressed = compressed_files.encoding_of(path) is not None
+            with compressed_files.open(path, 'rb') as f:
+                # note: the other workers and the memory share these, so update a copy.
+                valid = not compressed and is_valid(index, f, s.size)
+                index = json.loads(json.dumps(index)) if valid else new_index()
+                update_index(index, f)
+        except OSError:
+            return None
+        index['stamp'] = stamp
+
+    with _lock:
+        _memory[path] = index
+        _memory.move_to_end(path)
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+    if changed:
+        save_index(path, index)
+    return index
+
+
+def get_keys(path):
+    index = get_index(path)
+    return None if index is None else list(index['keys'])
+
+
+SUMMARY = ["count", "last", "min", "max", "argmin", "argmax"]
+
+
+def get_summary(path, keys=None):
+    """
+    the summary of each key of the metrics file, without reading the series.
+
+    :param keys: only summarize these keys. Missing keys are left out.
+    :return: {key: dict(count, last, min, max, argmin, argmax)}
+    """
+    index = get_index(path)
+    if index is None:
+        return None
+    return {key: {stat: entry.get(stat) for stat in SUMMARY}
+            for key, entry in index['keys'].items() if keys is None or key in keys}
+
+
+def union_keys(paths):
+    """
+    the union of the keys of the metrics files, in the order they first appear.
+
+    :return: {key: dict(dtype, count, runs)}
+    """
+    keys = {}
+    for path in paths:
+        index = get_index(path)
+        if index is None:
+            continue
+        for key, entry in index['keys'].items():
+            _ = keys.setdefault(key, dict(dtype=None, count=0, runs=0))
+            _['dtype'] = merge_kinds(_['dtype'], entry['dtype'])
+            _['count'] += entry['count']
+            _['runs'] += 1
+    return keys
+
+
+def clear():
+    with _lock:
+        _memory.clear()
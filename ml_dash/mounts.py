@@ -0,0 +1,189 @@
+"""
+Mount table for logs that are spread over several disks and NFS exports.
+
+`MountArgs.mounts` maps virtual path prefixes to physical roots, as in
+
+    /=/data/logs;/team-x=/mnt/nfs-1/team-x,/mnt/nfs-2/team-x
+
+The longest matching prefix wins. A prefix with several roots is their union:
+listings and globs merge all of them, and a path resolves to the first root that
+has it. Without a mount table, `/` is `Args.logdir`.
+
+Globs that span several roots, either as a union or through mounts under their
+directory, walk each root in its own thread, so the I/O is spread over volumes.
+
+Roots can also be urls of an object store, as in `/archive=s3://bucket/logs`,
+which are read through `storage`.
+"""
+from os.path import join, relpath, normpath, expanduser
+
+from ml_dash import storage
+
+
+def parse(mounts):
+    """:return: [(prefix, [roots])], longest prefix first"""
+    table = {}
+    for entry in (mounts or "").split(';'):
+        if not entry.strip():
+            continue
+        prefix, _, roots = entry.partition('=')
+        prefix = normpath('/' + prefix.strip().strip('/'))
+        table.setdefault(prefix, []).extend(expanduser(r.strip()) for r in roots.split(',') if r.strip())
+    return sorted(table.items(), key=lambda t: -len(t[0]))
+
+
+_parsed = None, []
+
+
+def table():
+    global _parsed
+    from ml_dash.config import Args, MountArgs
+    key = MountArgs.mounts, Args.logdir
+    if _parsed[0] != key:
+        _table = parse(MountArgs.mounts)
+        if '/' not in dict(_table):
+            _table.append(('/', [Args.logdir]))
+        _parsed = key, _table
+    return _parsed[1]
+
+
+def enabled():
+    from ml_dash.config import MountArgs
+    return bool(MountArgs.mounts)
+
+
+def locate(path):
+    """:return: (prefix, roots, the rest of the path under the prefix)"""
+    path = normpath('/' + path.lstrip('/'))
+    for prefix, roots in table():
+        if path == prefix or path.startswith(prefix.rstrip('/') + '/'):
+            return prefix, roots, path[len(prefix):].lstrip('/')
+    raise KeyError(path)
+
+
+def candidates(path):
+    """the physical paths that the virtual path can be at, in the order of the roots."""
+    prefix, roots, rest = locate(path)
+    return [join(root, rest) for root in roots]
+
+
+def resolve(path):
+    """
+    the physical path of a virtual path.
+
+    :param path: absolute, virtual path, e.g. `/episodeyang/project/experiment/metrics.pkl`
+    :return: the path in the first root that has it, or in the first root when none do.
+    """
+    from ml_dash.config import Args
+    if not enabled():
+        return join(Args.logdir, path[1:])
+    _ = candidates(path)
+    if len(_) > 1:
+        for p in _:
+            if storage.exists(p):
+                return p
+    return _[0]
+
+
+def to_virtual(physical):
+    """the virtual path of a physical one, or None when it is not under any root."""
+    physical = storage.realpath(physical)
+    for prefix, roots in table():
+        for root in roots:
+            if storage.is_url(root) != storage.is_url(physical):
+                continue
+            rest = relpath(physical, storage.realpath(expanduser(root)))
+            if rest == '.':
+                return prefix
+            if not rest.startswith('..'):
+                return join(prefix, rest)
+    return None
+
+
+def mount_points(path):
+    """the names of the entries of the virtual directory that lead to other mounts."""
+    path = normpath('/' + path.lstrip('/'))
+    names = []
+    for prefix, roots in table():
+        if prefix != path and prefix.startswith(path.rstrip('/') + '/'):
+            name = prefix[len(path.rstrip('/')) + 1:].split('/')[0]
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def list_dir(path):
+    """
+    lists a virtual directory over all of its roots.
+
+    :return: (directory names, file names), without duplicates.
+    """
+    from ml_dash.response_cache import track
+    dirs, files = [], []
+    for root in candidates(path):
+        track(root)
+        try:
+            _dirs, _files = storage.list_dir(root)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for _, names in [(dirs, _dirs), (files, _files)]:
+            for name in names:
+                if name not in dirs and name not in files:
+                    _.append(name)
+    for name in mount_points(path):
+        if name not in dirs:
+            dirs.append(name)
+    return dirs, files
+
+
+def glob_roots(cwd, query):
+    """:return: [(physical root, the virtual directory under cwd that it is at)] to glob"""
+    if not enabled():
+        return [(candidates(cwd)[0], "")]
+    cwd = normpath('/' + cwd.lstrip('/'))
+    _ = [(root, "") for root in candidates(cwd) if storage.isdir(root)]
+    # note: only recursive queries reach into the mounts below the directory.
+    if query.startswith('**'):
+        for prefix, roots in table():
+            if prefix != cwd and prefix.startswith(cwd.rstrip('/') + '/'):
+                _.extend((root, relpath(prefix, cwd)) for root in roots if storage.isdir(root))
+    return [(storage.realpath(root).rstrip('/'), offset) for root, offset in _]
+
+
+def find_files(cwd, query, start=None, stop=None, threads=1, **kwargs):
+    """
+    `file_helpers.find_files` over the virtual directory cwd.
+
+    Each root is walked in its own thread. The paths are relative to cwd, and a path
+    that is in several roots is listed once, for the first of them.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+    from itertools import islice
+    from ml_dash.schema.files import file_helpers
+
+    roots = glob_roots(cwd, query)
+    if not roots:
+        return
+    if len(roots) == 1:
+        root, _ = roots[0]
+        yield from file_helpers.find_files(root, query, start=start, stop=stop, threads=threads, **kwargs)
+        return
+
+    def walk(root, offset):
+        files = file_helpers.find_files(root, query, stop=stop, threads=threads, **kwargs)
+        return [dict(f, path=join(offset, f['path']), dir=join(offset, f['dir']).rstrip('/')) if offset else f
+                for f in files]
+
+    with ThreadPoolExecutor(len(roots)) as executor:
+        futures = [executor.submit(copy_context().run, walk, root, offset) for root, offset in roots]
+
+        def merge():
+            seen = set()
+            for future in futures:
+                for f in future.result():
+                    if f['path'] not in seen:
+                        seen.add(f['path'])
+                        yield f
+
+        yield from islice(merge(), start, stop)
@@ -0,0 +1,226 @@
+"""
+Managed process pool for the CPU-bound work of a request.
+
+Aggregating a large series with pandas holds the GIL for seconds, which blocks
+every other request on the worker. `run` and `run_async` send such work to a
+pool of `PoolArgs.processes` processes instead.
+
+- Large arrays travel as shared memory: `share` copies them into one block, and
+  `attach` maps them in the other process without a copy.
+- A task that runs longer than `PoolArgs.pool_timeout` is killed, together with
+  its pool. The pool is re-created for the next task. Note that this also kills the
+  tasks of other requests that run in the pool at the time. Those fail with
+  `BrokenProcessPool`, and are retried once on the new pool, which only the first
+  of them re-creates.
+- A request that runs out of time stops waiting for its task with a
+  `QueryDeadlineError`, but leaves the task to finish, and the pool running.
+- Tasks that return their result in shared memory name the block up front
+  (`block_name`), so that the block is unlinked when the task is killed.
+- With `PoolArgs.processes = 0` (the default) everything runs inline.
+"""
+import asyncio
+import threading
+import uuid
+from concurrent.futures import TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+_pool = None
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+def enabled():
+    from ml_dash.config import PoolArgs
+    return PoolArgs.processes > 0
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from ml_dash.config import PoolArgs
+        # note: spawn, because forking a worker with a running event loop is not safe.
+        _pool = ProcessPoolExecutor(PoolArgs.processes, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def reset_pool(pool=None):
+    """
+    kills the processes of the pool, including the tasks they are running, for every
+    request. Does not wait for them to exit, so that it does not block the event loop.
+
+    :param pool: only reset the pool if it still is this one, and not one that another
+        task has already re-created.
+    :return: the killed processes
+    """
+    global _pool
+    if pool is not None and _pool is not pool:
+        return []
+    pool, _pool = _pool, None
+    if pool is None:
+        return []
+    processes = list((pool._processes or {}).values())
+    for process in processes:
+        process.terminate()
+    # note: wait for the shutdown in a thread. Without waiting, the pool of python 3.8 closes
+    #  the pipe that its management thread still uses.
+    threading.Thread(target=pool.shutdown, daemon=True).start()
+    return processes
+
+
+def discard(result, processes):
+    """unlinks the result block of a killed task, once its process is gone."""
+    for process in processes:
+        process.join(1)
+    if result is not None:
+        unlink(result)
+
+
+def abandon(future, result):
+    """stops waiting for a task that is left to finish. Its result block is unlinked when it does."""
+    future.cancel()
+    if result is not None:
+        future.add_done_callback(lambda _: unlink(result))
+
+
+def wait_time(timeout=None):
+    """
+    :param timeout: seconds before the task is killed. Defaults to `PoolArgs.pool_timeout`.
+    :return: (seconds to wait for the task, whether the wait ends at the deadline of the
+        request rather than at the timeout)
+    """
+    from ml_dash.config import PoolArgs
+    from ml_dash.query_budget import time_left
+    timeout = PoolArgs.pool_timeout or None if timeout is None else timeout
+    left = time_left()
+    if left is not None and (timeout is None or left < timeout):
+        return max(left, 0), True
+    return timeout, False
+
+
+def deadline_error(fn):
+    from ml_dash.query_budget import QueryDeadlineError
+    return QueryDeadlineError(f"The query ran out of time while {fn.__name__} was running.")
+
+
+def run(fn, *args, timeout=None, result=None):
+    """
+    runs fn(*args) in the pool and waits for the result.
+
+    :param timeout: seconds before the task is killed. Defaults to `PoolArgs.pool_timeout`.
+    :param result: the name of the shared memory block that fn returns its result in,
+        from `block_name`. It is unlinked when the task is killed or abandoned.
+    :raises PoolTimeoutError: when the task took too long. The task is killed.
+    :raises QueryDeadlineError: when the request ran out of time first. The task is not killed.
+    """
+    from ml_dash.query_budget import check_deadline
+    for retry in [True, False]:
+        check_deadline()
+        pool = get_pool()
+        wait, at_deadline = wait_time(timeout)
+        try:
+            future = pool.submit(fn, *args)
+            return future.result(wait)
+        except TimeoutError:
+            if at_deadline:
+                abandon(future, result)
+                raise deadline_error(fn)
+            discard(result, reset_pool(pool))
+            raise PoolTimeoutError(f"{fn.__name__} did not finish in {wait} seconds.")
+        except BrokenProcessPool:
+            # note: another task timed out and took the pool down with it. Try once more. The
+            #  retry writes its result into the same block, so keep it.
+            processes = reset_pool(pool)
+            if not retry:
+                discard(result, processes)
+                raise
+            discard(None, processes)
+
+
+async def run_async(fn, *args, timeout=None, result=None):
+    """same as `run`, but awaits the result instead of blocking the event loop."""
+    from ml_dash.query_budget import check_deadline
+    loop = asyncio.get_running_loop()
+    for retry in [True, False]:
+        check_deadline()
+        pool = get_pool()
+        wait, at_deadline = wait_time(timeout)
+        try:
+            future = pool.submit(fn, *args)
+            return await asyncio.wait_for(asyncio.wrap_future(future), wait)
+        except asyncio.TimeoutError:
+            if at_deadline:
+                abandon(future, result)
+                raise deadline_error(fn)
+            await loop.run_in_executor(None, discard, result, reset_pool(pool))
+            raise PoolTimeoutError(f"{fn.__name__} did not finish in {wait} seconds.")
+        except BrokenProcessPool:
+            processes = reset_pool(pool)
+            if not retry:
+                await loop.run_in_executor(None, discard, result, processes)
+                raise
+            await loop.run_in_executor(None, discard, None, processes)
+
+
+def block_name():
+    """a fresh name for a block of shared memory."""
+    return f"mld_{uuid.uuid4().hex[:20]}"
+
+
+def share(arrays, name=None):
+    """
+    copies the arrays into a new block of shared memory.
+
+    :param arrays: list of numpy arrays, with fixed-size dtypes
+    :param name: the name of the block. Replaces what a killed attempt at the same task left behind.
+    :return: (shm, specs). Pass shm.name and the specs to `attach`. The caller
+        owns the block, and has to close and unlink it.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    import numpy as np
+
+    specs, offset = [], 0
+    for a in arrays:
+        specs.append((a.dtype.str, a.shape, offset))
+        # note: keep every array 8-byte aligned.
+        offset += (a.nbytes + 7) // 8 * 8
+    try:
+        shm = SharedMemory(name, create=True, size=max(offset, 1))
+    except FileExistsError:
+        unlink(name)
+        shm = SharedMemory(name, create=True, size=max(offset, 1))
+    for a, (dtype, shape, offset) in zip(arrays, specs):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = a
+    return shm, specs
+
+
+def attach(name, specs):
+    """
+    maps the arrays of a block made by `share`, without copying them.
+
+    :return: (shm, arrays). Drop the arrays before calling shm.close().
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    import numpy as np
+
+    shm = SharedMemory(name)
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset) for dtype, shape, offset in specs]
+    return shm, arrays
+
+
+def release(shm):
+    shm.close()
+    shm.unlink()
+
+
+def unlink(name):
+    """removes the block of that name, if there is one."""
+    from multiprocessing.shared_memory import SharedMemory
+    try:
+        shm = SharedMemory(name)
+    except FileNotFoundError:
+        return
+    release(shm)
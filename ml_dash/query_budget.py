@@ -0,0 +1,204 @@
+"""
+Static cost analysis and per-request deadlines for GraphQL queries.
+
+The cost of a query is estimated from its AST before execution: every field has
+a weight, connection and list fields multiply the cost of their children by the
+number of nodes they may return, recursive globs grow with how close their `cwd`
+is to the root, and `series` grows with the number of metrics files it reads.
+`seriesGroups` and `topExperiments` read every experiment under their `cwd`, up
+to `stop`, and `dashboard` reads the series of every chart under its `path`.
+
+The deadline is cooperative: long loops (globbing, reading metrics files) call
+`check_deadline()`, which raises once the request has run out of time.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from graphql.language import ast
+
+# note: reading and decoding a file is what costs us, not the field itself.
+FIELD_WEIGHTS = dict(
+    text=10,
+    json=10,
+    yaml=10,
+    readme=10,
+    # note: keys come from the key index, which only reads what was appended.
+    keys=2,
+    keySchema=2,
+    summary=2,
+    value=20,
+    raw=10,
+    flat=10,
+    parameters=5,
+    metrics=5,
+)
+DEFAULT_FIELD_WEIGHT = 1
+
+# connection fields list a directory, `experiments` globs the whole subtree.
+CONNECTION_WEIGHTS = dict(
+    experiments=1000,
+    charts=1000,
+    dashConfigs=10,
+    directories=10,
+    files=10,
+    projects=10,
+)
+LIST_FIELDS = ['users']
+# the number of nodes we assume a connection returns when `first` is not given.
+UNBOUNDED_SIZE = 1000
+
+GLOB_WEIGHT = 100
+# recursive globs cost this much more for every level the cwd is above an experiment.
+RECURSIVE_GLOB_FACTOR = 10
+EXPERIMENT_DEPTH = 4
+
+SERIES_FILE_WEIGHT = 100
+# the number of metrics files we assume the charts of a dashboard read.
+DASHBOARD_FILES = 100
+# reading every row instead of k bins.
+UNAGGREGATED_FACTOR = 10
+
+
+class QueryCostError(Exception):
+    pass
+
+
+class QueryDeadlineError(Exception):
+    pass
+
+
+def ast_value(node, variables):
+    """convert an argument value node into a python value."""
+    if isinstance(node, ast.Variable):
+        return (variables or {}).get(node.name.value)
+    elif isinstance(node, ast.IntValue):
+        return int(node.value)
+    elif isinstance(node, ast.FloatValue):
+        return float(node.value)
+    elif isinstance(node, ast.ListValue):
+        return [ast_value(_, variables) for _ in node.values]
+    elif isinstance(node, ast.ObjectValue):
+        return {f.name.value: ast_value(f.value, variables) for f in node.fields}
+    return getattr(node, 'value', None)
+
+
+def glob_cost(cwd, query):
+    depth = len([_ for _ in (cwd or "/").split('/') if _])
+    if '**' in (query or ""):
+        return GLOB_WEIGHT * RECURSIVE_GLOB_FACTOR ** max(1, EXPERIMENT_DEPTH - depth)
+    return GLOB_WEIGHT
+
+
+def series_cost(n_files, k=None):
+    return SERIES_FILE_WEIGHT * n_files * (1 if k else UNAGGREGATED_FACTOR)
+
+
+def field_cost(field, variables, fragments):
+    name = field.name.value
+    args = {a.name.value: ast_value(a.value, variables) for a in field.arguments or []}
+    children = selection_cost(field.selection_set, variables, fragments)
+
+    if name == "glob":
+        start, stop = args.get('start') or 0, args.get('stop')
+        size = UNBOUNDED_SIZE if stop is None else max(stop - start, 0)
+        return glob_cost(args.get('cwd'), args.get('query', "**/*.*")) + size * children
+    elif name == "series":
+        return series_cost(len(args.get('metricsFiles') or []), args.get('k')) + children
+    elif name == "metricsKeys":
+        return FIELD_WEIGHTS['keys'] * len(args.get('metricsFiles') or []) + children
+    elif name == "dashboard":
+        # note: the series come from the chart files, which the query does not show.
+        return glob_cost(args.get('path'), "**/*.chart.yml") + series_cost(DASHBOARD_FILES, k=True) + children
+    elif name == "topExperiments":
+        # note: scores come from the key index, except for mean_last_n, which reads the series.
+        size = args.get('stop') or UNBOUNDED_SIZE
+        weight = SERIES_FILE_WEIGHT if args.get('agg') == "mean_last_n" else FIELD_WEIGHTS['summary']
+        return glob_cost(args.get('cwd'), "**/metrics.pkl") + size * weight + (args.get('k') or 20) * children
+    elif name == "seriesGroups":
+        # note: reads the parameters and the metrics of every experiment under cwd.
+        size = args.get('stop') or UNBOUNDED_SIZE
+        return glob_cost(args.get('cwd'), "**/parameters.pkl") + size * FIELD_WEIGHTS['flat'] \
+               + series_cost(size, args.get('k')) + children
+    elif name in CONNECTION_WEIGHTS:
+        size = args.get('first') or args.get('last') or UNBOUNDED_SIZE
+        return CONNECTION_WEIGHTS[name] + size * children
+    elif name in LIST_FIELDS:
+        return DEFAULT_FIELD_WEIGHT + UNBOUNDED_SIZE * children
+    return FIELD_WEIGHTS.get(name, DEFAULT_FIELD_WEIGHT) + children
+
+
+def selection_cost(selection_set, variables, fragments, _visited=tuple()):
+    if selection_set is None:
+        return 0
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            cost += field_cost(selection, variables, fragments)
+        elif isinstance(selection, ast.InlineFragment):
+            cost += selection_cost(selection.selection_set, variables, fragments)
+        elif isinstance(selection, ast.FragmentSpread):
+            name = selection.name.value
+            if name in fragments and name not in _visited:
+                cost += selection_cost(fragments[name].selection_set, variables, fragments, (*_visited, name))
+    return cost
+
+
+def estimate_cost(document, variables=None, operation_name=None):
+    """
+    estimate the cost of a query before executing it.
+
+    :param document: the query string, or a parsed document
+    :param variables: the query variables
+    :param operation_name: the operation to estimate. Sums over all operations if None.
+    :return: the estimated cost
+    """
+    if isinstance(document, str):
+        from graphql import parse
+        document = parse(document)
+
+    fragments = {d.name.value: d for d in document.definitions if isinstance(d, ast.FragmentDefinition)}
+    cost = 0
+    for d in document.definitions:
+        if not isinstance(d, ast.OperationDefinition):
+            continue
+        if operation_name and (d.name is None or d.name.value != operation_name):
+            continue
+        cost += selection_cost(d.selection_set, variables, fragments)
+    return cost
+
+
+def check_budget(document, variables=None, operation_name=None, max_cost=None):
+    """raises QueryCostError when the estimated cost is over max_cost."""
+    from ml_dash.config import QueryArgs
+    max_cost = QueryArgs.max_query_cost if max_cost is None else max_cost
+    cost = estimate_cost(document, variables, operation_name)
+    if max_cost and cost > max_cost:
+        raise QueryCostError(f"The estimated query cost {cost} exceeds the budget of {max_cost}. "
+                             f"Pass `k` to `series`, `first` to connections, or narrow down the glob.")
+    return cost
+
+
+_deadline = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """runs the block with a deadline. `None` or 0 turns the deadline off."""
+    token = _deadline.set((time.monotonic() + seconds, seconds) if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    _ = _deadline.get()
+    return None if _ is None else _[0] - time.monotonic()
+
+
+def check_deadline():
+    """call this inside long loops. Raises QueryDeadlineError when the request is out of time."""
+    _ = _deadline.get()
+    if _ is not None and time.monotonic() > _[0]:
+        raise QueryDeadlineError(f"The query did not finish within the {_[1]}s deadline.")
@@ -0,0 +1,292 @@
+"""
+Fast, restricted decoding of metrics files.
+
+The records of a metrics file are almost always flat dicts of str to a number, a
+bool, None or a numpy scalar, and the pickles of two records with the same keys
+and the same types of values only differ in the bytes of the values. `decode_columns`
+parses the first record of each such shape into a template: the bytes that have to
+match, and the offsets and dtypes of the values. The records that match a template
+are only checked against it, and their values are decoded at the end, one column
+at a time, with numpy. No dict or python object is made per row.
+
+Anything else, such as nested values, strings or other classes, makes
+`decode_columns` return None, and the file is unpickled in full by `SafeUnpickler`.
+It only builds the classes in `SAFE_GLOBALS`, so that pickles from a shared logdir
+cannot run code. Other classes become placeholders, as they do in ml_logger for
+classes that are not installed. `PickleArgs.trusted_pickles` turns this off.
+"""
+import io
+import pickletools
+
+from ml_logger.helpers import Whatever
+
+# the shapes of records that one file can have, before it is no longer worth it.
+MAX_TEMPLATES = 64
+SCALAR = {("numpy.core.multiarray", "scalar"), ("numpy._core.multiarray", "scalar")}
+DTYPE = ("numpy", "dtype")
+
+SAFE_GLOBALS = {
+    *(("builtins", name) for name in ["bool", "bytearray", "bytes", "complex", "dict", "float", "frozenset",
+                                      "int", "list", "object", "range", "set", "slice", "str", "tuple"]),
+    *((module, name) for module in ["numpy.core.multiarray", "numpy._core.multiarray"]
+      for name in ["scalar", "_reconstruct"]),
+    ("numpy", "dtype"), ("numpy", "ndarray"), ("numpy.core.numeric", "_frombuffer"),
+    ("numpy._core.numeric", "_frombuffer"),
+    ("copyreg", "_reconstructor"), ("collections", "OrderedDict"), ("_codecs", "encode"),
+    *(("datetime", name) for name in ["date", "datetime", "time", "timedelta", "timezone"]),
+    ("pathlib", "PosixPath"), ("pathlib", "PurePosixPath"),
+    ("pandas._libs.tslibs.timestamps", "_unpickle_timestamp"),
+    ("pandas._libs.tslibs.timedeltas", "_timedelta_unpickle"),
+}
+
+
+class SafeUnpickler(Whatever):
+    def find_class(self, module, name):
+        from ml_dash.config import PickleArgs
+        if PickleArgs.trusted_pickles or (module, name) in SAFE_GLOBALS:
+            return super().find_class(module, name)
+        return self.cls_factory(module, name)
+
+
+class Unsupported(Exception):
+    """the record is not a flat dict of scalars."""
+
+
+class Const:
+    def __init__(self, value):
+        self.value = value
+
+
+class Slot:
+    """a value in the bytes of the record, `width` bytes at `offset`."""
+
+    def __init__(self, offset, width, dtype, value=None):
+        self.offset, self.width, self.dtype, self.value = offset, width, dtype, value
+
+
+class Global:
+    def __init__(self, module, name):
+        if (module, name) not in SCALAR and (module, name) != DTYPE:
+            raise Unsupported(f"{module}.{name}")
+        self.name = (module, name)
+
+
+class Dtype:
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+
+MARK = object()
+# note: python ints and floats, which are int64 and float64 in pandas however they are pickled.
+INTS = dict(BININT1=(1, "int:u1"), BININT2=(2, "int:<u2"), BININT=(4, "int:<i4"), BINFLOAT=(8, "float:>f8"))
+
+
+class Template:
+    """the bytes that a record of this shape has to match, and where its values are."""
+
+    def __init__(self, buf, start, stop, record):
+        import numpy as np
+        self.size = stop - start
+        self.keys, self.slots, self.consts = [], [], {}
+        for key, value in record:
+            if not isinstance(key, Const) or not isinstance(key.value, str) or key.value in self.keys:
+                raise Unsupported("keys need to be unique strings")
+            self.keys.append(key.value)
+            if isinstance(value, Slot):
+                if value.dtype != "long" and np.dtype(value.dtype.split(':')[-1]).kind not in "biuf":
+                    raise Unsupported(value.dtype)
+                self.slots.append((key.value, value.offset - start, value.width, value.dtype))
+            elif isinstance(value, Const) and (value.value is None or isinstance(value.value, bool)):
+                self.consts[key.value] = value.value
+            else:
+                raise Unsupported(f"the value of {key.value}")
+
+        self.literals, cursor = [], 0
+        for _, offset, width, _ in sorted(self.slots, key=lambda s: s[1]):
+            if offset > cursor:
+                self.literals.append((cursor, bytes(buf[start + cursor:start + offset])))
+            cursor = offset + width
+        if cursor < self.size:
+            self.literals.append((cursor, bytes(buf[start + cursor:stop])))
+        self.starts, self.rows = [], []
+
+    def matches(self, buf, pos):
+        if pos + self.size > len(buf):
+            return False
+        for offset, literal in self.literals:
+            if not buf.startswith(literal, pos + offset):
+                return False
+        return True
+
+
+def parse(buf, pos):
+    """
+    runs the pickle of the record at pos symbolically.
+
+    :return: (the end of the record, [(key, value)]) with the values as `Slot` or `Const`.
+    :raises Unsupported: for anything but a flat dict of scalars.
+    """
+    import numpy as np
+    stack, memo = [], {}
+    f = io.BytesIO(memoryview(buf)[pos:])
+    for op, arg, offset in pickletools.genops(f):
+        name, offset = op.name, pos + offset
+        if name in ["PROTO", "FRAME"]:
+            continue
+        elif name == "STOP":
+            result = stack.pop()
+            if not isinstance(result, list):
+                raise Unsupported("the record is not a dict")
+            return offset + 1, result
+        elif name == "EMPTY_DICT":
+            stack.append([])
+        elif name == "MARK":
+            stack.append(MARK)
+        elif name in ["SHORT_BINUNICODE", "BINUNICODE", "BINUNICODE8"]:
+            stack.append(Const(arg))
+        elif name == "MEMOIZE":
+            memo[len(memo)] = stack[-1]
+        elif name in ["BINPUT", "LONG_BINPUT"]:
+            memo[arg] = stack[-1]
+        elif name in ["BINGET", "LONG_BINGET"]:
+            stack.append(memo[arg])
+        elif name in INTS:
+            width, dtype = INTS[name]
+            stack.append(Slot(offset + 1, width, dtype, arg))
+        elif name == "LONG1":
+            width = buf[offset + 1]
+            if not 0 < width <= 8:
+                raise Unsupported("long integer")
+            stack.append(Slot(offset + 2, width, "long", arg))
+        elif name in ["NONE", "NEWTRUE", "NEWFALSE"]:
+            stack.append(Const(dict(NONE=None, NEWTRUE=True, NEWFALSE=False)[name]))
+        elif name in ["SHORT_BINBYTES", "BINBYTES"]:
+            stack.append(Slot(offset + (2 if name == "SHORT_BINBYTES" else 5), len(arg), None, arg))
+        elif name == "STACK_GLOBAL":
+            _name, module = stack.pop(), stack.pop()
+            stack.append(Global(module.value, _name.value))
+        elif name == "GLOBAL":
+            stack.append(Global(*arg.split(' ', 1)))
+        elif name in ["TUPLE1", "TUPLE2", "TUPLE3"]:
+            n = int(name[-1])
+            items = stack[-n:]
+            del stack[-n:]
+            stack.append(tuple(items))
+        elif name == "TUPLE":
+            i = len(stack) - 1 - stack[::-1].index(MARK)
+            items = tuple(stack[i + 1:])
+            del stack[i:]
+            stack.append(items)
+        elif name == "EMPTY_TUPLE":
+            stack.append(())
+        elif name == "REDUCE":
+            args, fn = stack.pop(), stack.pop()
+            if not isinstance(fn, Global):
+                raise Unsupported(name)
+            if fn.name == DTYPE:
+                stack.append(Dtype(np.dtype(args[0].value)))
+            elif isinstance(args[0], Dtype) and isinstance(args[1], Slot) and args[1].dtype is None \
+                    and args[0].dtype.itemsize == args[1].width:
+                stack.append(Slot(args[1].offset, args[1].width, args[0].dtype.str))
+            else:
+                raise Unsupported(name)
+        elif name == "BUILD":
+            state, obj = stack.pop(), stack[-1]
+            if not isinstance(obj, Dtype):
+                raise Unsupported(name)
+            # note: the state of a dtype has its byte order second.
+            order = state[1].value if isinstance(state[1], Const) else None
+            if order in ["<", ">"]:
+                obj.dtype = obj.dtype.newbyteorder(order)
+        elif name in ["SETITEM", "SETITEMS"]:
+            if name == "SETITEM":
+                items = stack[-2:]
+                del stack[-2:]
+            else:
+                i = len(stack) - 1 - stack[::-1].index(MARK)
+                items = stack[i + 1:]
+                del stack[i:]
+            if not isinstance(stack[-1], list):
+                raise Unsupported(name)
+            stack[-1].extend(zip(items[::2], items[1::2]))
+        else:
+            raise Unsupported(name)
+    raise Unsupported("the record has no end")
+
+
+def decode_slot(matrix, offset, width, dtype):
+    import numpy as np
+    raw = matrix[:, offset:offset + width]
+    if dtype == "long":
+        # note: little-endian two's complement, sign-extended to 8 bytes.
+        _ = np.where(raw[:, -1:] >= 128, np.uint8(255), np.uint8(0)).repeat(8, axis=1)
+        _[:, :width] = raw
+        return _.view("<i8").ravel()
+    kind, _, dtype = dtype.rpartition(':')
+    values = np.ascontiguousarray(raw).view(dtype).ravel()
+    return values.astype(dict(int=np.int64, float=np.float64).get(kind, values.dtype.newbyteorder("=")))
+
+
+def assemble(n, parts):
+    """one column from the values of each template, in the pandas dtype that a list of dicts would get."""
+    import numpy as np
+    kinds, dtypes = set(), set()
+    for _, values in parts:
+        kinds.add(values.dtype.kind if isinstance(values, np.ndarray) else "N" if values is None else "b")
+        dtypes.add(values.dtype if isinstance(values, np.ndarray) else None)
+    full = sum(len(rows) for rows, _ in parts) == n
+    if full and len(dtypes) == 1 and None not in dtypes:
+        column = np.empty(n, dtype=dtypes.pop())
+    elif full and kinds <= {"b"}:
+        column = np.empty(n, dtype=bool)
+    elif full and kinds <= {"i", "u"}:
+        column = np.empty(n, dtype=np.int64)
+    elif kinds <= {"i", "u", "f", "N"}:
+        column = np.full(n, np.nan)
+    else:
+        column = np.full(n, np.nan, dtype=object)
+    for rows, values in parts:
+        column[rows] = np.nan if values is None and column.dtype != object else values
+    return column
+
+
+def decode_columns(buf):
+    """
+    decodes a metrics file into columns.
+
+    :param buf: the bytes of the file
+    :return: {key: numpy array}, in the order that the keys first appear in, or None when
+        a record is not a flat dict of scalars.
+    """
+    import numpy as np
+    templates, last, pos, n = [], None, 0, 0
+    while pos < len(buf):
+        template = last if last is not None and last.matches(buf, pos) else None
+        if template is None:
+            template = next((t for t in templates if t.matches(buf, pos)), None)
+        if template is None:
+            if len(templates) >= MAX_TEMPLATES:
+                return None
+            try:
+                stop, record = parse(buf, pos)
+                template = Template(buf, pos, stop, record)
+            except (Unsupported, ValueError, IndexError, KeyError, AttributeError, TypeError):
+                return None
+            templates.append(template)
+        template.starts.append(pos)
+        template.rows.append(n)
+        pos, n, last = pos + template.size, n + 1, template
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+    parts = {}
+    for t in templates:
+        rows = np.asarray(t.rows)
+        matrix = data[np.asarray(t.starts)[:, None] + np.arange(t.size)] if t.slots else None
+        for key in t.keys:
+            parts.setdefault(key, [])
+        for key, offset, width, dtype in t.slots:
+            parts[key].append((rows, decode_slot(matrix, offset, width, dtype)))
+        for key, value in t.consts.items():
+            parts[key].append((rows, value))
+    return {key: assemble(n, _) for key, _ in parts.items()}
+
@@ -0,0 +1,132 @@
+"""
+Streaming reads of ml_logger's pickle files, which are a sequence of pickled records.
+
+`sample_records` draws a uniform reservoir sample of k records in one pass and O(k)
+memory. It uses Algorithm L, which jumps over a geometric number of records between
+replacements, so that only about k log(n / k) records are ever decoded. Records
+pickled with protocol 4 or above are framed, and skipping them is a seek over their
+frames. Other records are decoded and dropped.
+"""
+import math
+import random
+import struct
+
+PROTO = 0x80
+FRAME = 0x95
+STOP = b'.'
+
+
+def read_record(f):
+    """:raises EOFError: at the end of the file."""
+    from ml_dash.record_decoder import SafeUnpickler
+    return SafeUnpickler(f).load()
+
+
+def read_all(f):
+    records = []
+    while True:
+        try:
+            records.append(read_record(f))
+        except EOFError:
+            return records
+
+
+def skip_record(f):
+    """
+    moves the file past the next record, without decoding it when it is framed.
+
+    :return: False at the end of the file.
+    """
+    start = f.tell()
+    header = f.read(2)
+    if not header:
+        return False
+    if len(header) == 2 and header[0] == PROTO and header[1] >= 4:
+        last = None
+        while f.read(1) == bytes([FRAME]):
+            size = f.read(8)
+            if len(size) < 8:
+                return False
+            f.seek(struct.unpack('<Q', size)[0] - 1, 1)
+            last = f.read(1)
+            # note: a record is framed up to its STOP opcode. The next one starts with PROTO.
+            _ = f.read(1)
+            f.seek(-len(_), 1)
+            if _ == bytes([FRAME]):
+                continue
+            if last == STOP and _ in [b'', bytes([PROTO])]:
+                return True
+            break
+    # note: not framed, or framed in a way we don't recognize.
+    f.seek(start)
+    try:
+        read_record(f)
+    except EOFError:
+        return False
+    return True
+
+
+def sample_records(path, k, seed=None):
+    """
+    a uniform sample of k records of the file, in the order they appear in.
+
+    :param path: the pickle file
+    :param k: the size of the reservoir
+    :param seed: makes the sample deterministic
+    :return: list of records
+    """
+    rng = random.Random(seed)
+
+    def uniform():
+        # note: in (0, 1], so that the log is finite.
+        return 1. - rng.random()
+
+    from ml_dash import compressed_files
+    reservoir = []
+    with compressed_files.open(path, 'rb') as f:
+        try:
+            while len(reservoir) < k:
+                reservoir.append((len(reservoir), read_record(f)))
+        except EOFError:
+            return [r for _, r in reservoir]
+
+        count = k
+        w = math.exp(math.log(uniform()) / k)
+        while True:
+            skip = int(math.log(uniform()) / math.log(1 - w)) if w < 1 else 0
+            for _ in range(skip):
+                if not skip_record(f):
+                    return [r for _, r in sorted(reservoir, key=lambda t: t[0])]
+            count += skip
+            try:
+                record = read_record(f)
+            except EOFError:
+                return [r for _, r in sorted(reservoir, key=lambda t: t[0])]
+            reservoir[rng.randrange(k)] = (count, record)
+            count += 1
+            w *= math.exp(math.log(uniform()) / k)
+
+
+def load_records(path):
+    """all of the records of the file, which can be compressed, or on an object store."""
+    from ml_dash import compressed_files
+    with compressed_files.open(path, 'rb') as f:
+        return read_all(f)
+
+
+def load_as_dataframe(path):
+    """flat records of scalars are decoded into the columns directly, see `record_decoder`."""
+    import io
+    import pandas as pd
+    from ml_dash import compressed_files, record_decoder
+    with compressed_files.open(path, 'rb') as f:
+        buf = f.read()
+    columns = record_decoder.decode_columns(buf)
+    if columns is None:
+        return pd.DataFrame(read_all(io.BytesIO(buf)))
+    return pd.DataFrame(columns)
+
+
+def load_sample_as_dataframe(path, k, seed=None):
+    import pandas as pd
+    return pd.DataFrame(sample_records(path, k, seed))
@@ -0,0 +1,128 @@
+"""
+GraphQL response cache keyed by the normalized query and its variables.
+
+While a query runs, the resolvers `track()` every file and directory they read.
+Each cache entry keeps the (mtime, size) of these dependencies, and a hit is
+only served when all of them are unchanged. The file watcher can also drop
+entries through `invalidate()`. Resolvers whose results do not depend on files,
+like the progress of a background job, call `volatile()` to skip the cache.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os.path import dirname
+
+_dependencies = ContextVar("dependencies", default=None)
+# note: not a valid path, so that no file can be tracked under this name.
+VOLATILE = "\0volatile"
+
+
+def stat_signature(path):
+    if "://" in path:
+        from ml_dash import storage
+        return storage.signature(path)
+    try:
+        s = os.stat(path)
+        return s.st_mtime_ns, s.st_size
+    except OSError:
+        return None
+
+
+def track(path):
+    """
+    record the file or directory as a dependency of the current request.
+
+    Call this *before* reading, so that a change during the read invalidates the entry.
+    """
+    deps = _dependencies.get()
+    if deps is None or path in deps:
+        return
+    deps[path] = stat_signature(path)
+
+
+def volatile():
+    """marks the response of the current request as one that is not to be cached."""
+    deps = _dependencies.get()
+    if deps is not None:
+        deps[VOLATILE] = None
+
+
+@contextmanager
+def record():
+    """collects the dependencies tracked inside the block."""
+    deps = {}
+    token = _dependencies.set(deps)
+    try:
+        yield deps
+    finally:
+        _dependencies.reset(token)
+
+
+def cache_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, size=256, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # note: the series of `seriesGroups` run in threads.
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        body, deps, created = entry
+        expired = self.ttl and time.time() - created > self.ttl
+        if expired or any(stat_signature(p) != sig for p, sig in deps.items()):
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body, deps):
+        if not self.size or VOLATILE in deps:
+            return
+        with self.lock:
+            self.entries[key] = body, dict(deps), time.time()
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path):
+        """drops the entries that depend on the path, or on its parent directory."""
+        paths = {path.rstrip('/'), dirname(path.rstrip('/'))}
+        with self.lock:
+            for key in [k for k, (_, deps, _) in self.entries.items() if paths & deps.keys()]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    from ml_dash.config import CacheArgs
+    if _cache is None:
+        _cache = ResponseCache(CacheArgs.response_cache_size, CacheArgs.response_cache_ttl)
+    return _cache
@@ -1,14 +1,18 @@
 from graphene import relay, ObjectType, Float, Schema, List, String, Field, Int
-from ml_dash.schema.files.series import Series, get_series, SeriesArguments
-from ml_dash.schema.files.metrics import Metrics, get_metrics
+from ml_dash.schema.files.series import Series, resolve_series, SeriesArguments
+from ml_dash.schema.files.series_groups import SeriesGroup, resolve_series_groups, SeriesGroupsArguments
+from graphene.types.generic import GenericScalar
+from ml_dash.schema.files.metrics import Metrics, get_metrics, get_metrics_keys
 from ml_dash.schema.schema_helpers import bind, bind_args
 from ml_dash.schema.users import User, get_users, get_user
 from ml_dash.schema.projects import Project
 from ml_dash.schema.directories import Directory, get_directory
 from ml_dash.schema.files import File, FileConnection, MutateTextFile, MutateJSONFile, MutateYamlFile, \
-    DeleteFile, DeleteDirectory, find_files_by_query
+    DeleteFile, DeleteDirectory, DeletionJob, CancelDeletionJob, find_files_by_query, get_deletion_job
 # MutateJSONFile, MutateYamlFile
 from ml_dash.schema.experiments import Experiment
+from ml_dash.schema.dashboard import Dashboard, resolve_dashboard
+from ml_dash.schema.top_experiments import TopExperiment, resolve_top_experiments, TopExperimentsArguments
 
 
 class EditText(relay.ClientIDMutation):
@@ -30,7 +34,14 @@ class Query(ObjectType):
 
     users = Field(List(User), resolver=bind_args(get_users))
     user = Field(User, username=String(), resolver=bind_args(get_user))
-    series = Field(Series, resolver=bind_args(get_series), **SeriesArguments)
+    series = Field(Series, resolver=resolve_series, **SeriesArguments)
+    series_groups = Field(List(SeriesGroup), resolver=resolve_series_groups, **SeriesGroupsArguments)
+    dashboard = Field(Dashboard, path=String(required=True), resolver=resolve_dashboard,
+                      description="the charts under the directory, with the data of all of their series")
+    top_experiments = Field(List(TopExperiment), resolver=resolve_top_experiments, **TopExperimentsArguments)
+    metrics_keys = Field(GenericScalar, metrics_files=List(String, required=True),
+                         description="the union of the keys of the metrics files, as {key: {dtype, count, runs}}",
+                         resolver=bind_args(get_metrics_keys))
 
     project = relay.Node.Field(Project)
     experiment = relay.Node.Field(Experiment)
@@ -40,6 +51,8 @@ class Query(ObjectType):
 
     glob = Field(List(File), cwd=String(required=True), query=String(), start=Int(), stop=Int(),
                  resolver=bind_args(find_files_by_query))
+    deletion_job = Field(DeletionJob, id=String(required=True), description="the progress of a deleteDirectory",
+                         resolver=bind_args(get_deletion_job))
 
 
 class Mutation(ObjectType):
@@ -53,6 +66,7 @@ class Mutation(ObjectType):
 
     delete_file = DeleteFile.Field()
     delete_directory = DeleteDirectory.Field()
+    cancel_deletion_job = CancelDeletionJob.Field()
     # update_text = EditText.Field()
     update_text = MutateTextFile.Field()
     update_json = MutateJSONFile.Field()
@@ -0,0 +1,159 @@
+import re
+from os.path import join, isabs, dirname
+
+from graphene import ObjectType, String, List, Int
+from graphene.types.generic import GenericScalar
+from ml_dash import mounts, storage
+from ml_dash.memory_budget import MemoryLimitError
+from ml_dash.query_budget import QueryDeadlineError
+from ml_dash.response_cache import track
+from ml_dash.schema.files.file_helpers import dataframe_memo
+from ml_dash.schema.files.series import Series, get_series, SeriesArguments
+from ml_dash.schema.files.series_groups import parallel_map
+
+CHART_QUERY = "**/*.chart.yml"
+DASH_CONFIG_QUERY = "*.dashcfg"
+# note: `metricFiles` in the dashboard design doc.
+SERIES_ALIASES = dict(metric_files="metrics_files")
+
+
+class DashboardChart(ObjectType):
+    file = String(description="path to the chart or dashcfg file that defines the chart")
+    index = Int(description="the position of the chart in its file")
+    name = String(description="the name of the chart")
+    type = String(description="the type of the chart, e.g. series, video or image")
+    config = GenericScalar(description="the chart, as it is in the file")
+    series = List(Series, description="the data of each series of the chart, in order. Null when a series is empty")
+    errors = List(String, description="errors of the series that could not be resolved")
+
+
+class Dashboard(ObjectType):
+    path = String(description="the directory of the dashboard")
+    charts = List(DashboardChart, description="the charts of every chart and dashcfg file under the directory")
+
+
+def read_yaml(path):
+    import ruamel.yaml
+    track(path)
+    with storage.open(path, "r") as f:
+        text = f.read()
+    if ruamel.yaml.version_info < (0, 15):
+        return ruamel.yaml.safe_load(text)
+    from ruamel.yaml import YAML
+    return YAML(typ="safe").load(text)
+
+
+def snake_case(key):
+    key = re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", key).lower()
+    return SERIES_ALIASES.get(key, key)
+
+
+def chart_list(config):
+    """a chart file holds one chart, a list of them, or a dict with `charts`, like the dashcfg files."""
+    if isinstance(config, dict) and "charts" in config:
+        return config["charts"] or []
+    if isinstance(config, list):
+        return config
+    return [config] if isinstance(config, dict) else []
+
+
+def series_specs(chart, config, cwd):
+    """
+    the arguments of `get_series` for each series of the chart.
+
+    A chart lists its series under `series`. A series chart without them is one series
+    itself, as in `{type: series, x_key: epoch, y_key: loss}`. Series without metrics
+    files read the `metrics.pkl` of the `experiments` of the config, or of the directory
+    of the file.
+
+    :param cwd: the directory of the config file, the default prefix of relative metrics files
+    """
+    if not isinstance(chart, dict):
+        return []
+    if "series" in chart:
+        specs = chart["series"] or []
+    elif chart.get("type", "series") == "series" and any(k in chart for k in ["y_key", "yKey", "y_keys", "yKeys"]):
+        specs = [chart]
+    else:
+        return []
+
+    experiments = config.get("experiments") if isinstance(config, dict) else None
+    _specs = []
+    for spec in specs:
+        spec = {snake_case(k): v for k, v in spec.items()}
+        spec = {k: v for k, v in spec.items() if k in SeriesArguments}
+        if not spec.get("metrics_files"):
+            spec["metrics_files"] = [join(e, "metrics.pkl") for e in experiments] if experiments else ["metrics.pkl"]
+        if not spec.get("prefix") and not all(isabs(p) for p in spec["metrics_files"]):
+            spec["prefix"] = cwd
+        elif spec.get("prefix") and not isabs(spec["prefix"]):
+            # note: as in the design doc, a relative prefix starts at the logdir.
+            spec["prefix"] = "/" + spec["prefix"]
+        _specs.append(spec)
+    return _specs
+
+
+def resolve_spec(spec):
+    """one broken chart should not fail the dashboard, but the deadline and the memory limit fail all of it."""
+    try:
+        return get_series(**spec), None
+    except (QueryDeadlineError, MemoryLimitError):
+        raise
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def get_dashboard(path):
+    """
+    reads the chart and dashcfg files under the directory, and resolves the series of all
+    of their charts in one parallel pass. The series share the metrics files they read.
+
+    :param path: the directory of the dashboard
+    :return: Dashboard
+    """
+    from ml_dash.config import DiscoveryArgs
+    assert isabs(path), "the path need to be an absolute path."
+    threads = DiscoveryArgs.discovery_threads
+    files = [p['path'] for p in mounts.find_files(path, CHART_QUERY, threads=threads)] + \
+            [p['path'] for p in mounts.find_files(path, DASH_CONFIG_QUERY)]
+
+    charts, specs = [], []
+    for file in files:
+        file_path = join(path, file)
+        try:
+            config = read_yaml(mounts.resolve(file_path))
+        except Exception as e:
+            charts.append(DashboardChart(file=file_path, index=0, config=None, series=[],
+                                         errors=[f"{type(e).__name__}: {e}"]))
+            continue
+        for i, chart in enumerate(chart_list(config)):
+            _specs = series_specs(chart, config, dirname(file_path))
+            name = chart.get("name") if isinstance(chart, dict) else None
+            _type = chart.get("type", "series") if isinstance(chart, dict) else None
+            charts.append(DashboardChart(file=file_path, index=i, name=name, type=_type, config=chart))
+            specs.append((len(charts) - 1, _specs))
+
+    with dataframe_memo():
+        results = parallel_map(resolve_spec, [spec for _, _specs in specs for spec in _specs], threads)
+
+    results = iter(results)
+    for chart_index, _specs in specs:
+        chart = charts[chart_index]
+        chart.series, chart.errors = [], []
+        for _ in _specs:
+            series, error = next(results)
+            chart.series.append(series)
+            if error:
+                chart.errors.append(error)
+    return Dashboard(path=path, charts=charts)
+
+
+def resolve_dashboard(_, info, path):
+    """runs in the default executor when there is an event loop, so that the series don't block it."""
+    from asyncio import get_running_loop
+    from contextvars import copy_context
+    try:
+        loop = get_running_loop()
+    except RuntimeError:
+        return get_dashboard(path)
+    return loop.run_in_executor(None, copy_context().run, lambda: get_dashboard(path))
@@ -1,5 +1,4 @@
-from os import listdir
-from os.path import isfile, join, split
+from os.path import join, split
 from graphene import ObjectType, relay, String, Field
 from ml_dash import schema
 
@@ -39,18 +38,16 @@ class Directory(ObjectType):
     directories = relay.ConnectionField(lambda: schema.directories.DirectoryConnection)
 
     def resolve_directories(self, info, **kwargs):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [get_directory(join(self.id, _))
-                for _ in listdir(root_dir) if not isfile(join(root_dir, _))]
+        from ml_dash import mounts
+        dirs, files = mounts.list_dir(self.id)
+        return [get_directory(join(self.id, _)) for _ in dirs]
 
     files = relay.ConnectionField(lambda: schema.files.FileConnection)
 
     def resolve_files(self, info, **kwargs):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [schema.files.File(id=join(self.id, _), name=_)
-                for _ in listdir(root_dir) if isfile(join(root_dir, _))]
+        from ml_dash import mounts
+        dirs, files = mounts.list_dir(self.id)
+        return [schema.files.File(id=join(self.id, _), name=_) for _ in files]
 
     @classmethod
     def get_node(cls, info, id):
@@ -1,10 +1,8 @@
-from os import listdir
-from os.path import isfile, join, basename, realpath, isabs, split
+from os.path import join, basename, isabs, split
 
 from graphene import ObjectType, relay, String, Field
-from ml_dash import schema
+from ml_dash import schema, mounts
 from ml_dash.schema import files
-from ml_dash.schema.files.file_helpers import find_files
 from ml_dash.schema.files.metrics import find_metrics
 from ml_dash.schema.files.parameters import find_parameters
 
@@ -43,16 +41,12 @@ class Experiment(ObjectType):
     files = relay.ConnectionField(lambda: schema.files.FileConnection)
 
     def resolve_directories(self, info, **kwargs):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [schema.directories.get_directory(join(self.id, _))
-                for _ in listdir(root_dir) if not isfile(join(root_dir, _))]
+        dirs, files = mounts.list_dir(self.id)
+        return [schema.directories.get_directory(join(self.id, _)) for _ in dirs]
 
     def resolve_files(self, info, **kwargs):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [schema.files.File(id=join(self.id, _), name=_)
-                for _ in listdir(root_dir) if isfile(join(root_dir, _))]
+        dirs, files = mounts.list_dir(self.id)
+        return [schema.files.File(id=join(self.id, _), name=_) for _ in files]
 
     @classmethod
     def get_node(cls, info, id):
@@ -73,16 +67,16 @@ def find_experiments(cwd, stop, **kwargs):
     :param stop:
     :return:
     """
-    from ml_dash.config import Args
+    from ml_dash.config import DiscoveryArgs
     assert isabs(cwd), "the current work directory need to be an absolute path."
-    _cwd = realpath(join(Args.logdir, cwd[1:])).rstrip('/')
-    parameter_files = find_files(_cwd, "**/parameters.pkl", stop=stop + 1, **kwargs)
+    kwargs.setdefault('threads', DiscoveryArgs.discovery_threads)
+    parameter_files = mounts.find_files(cwd, "**/parameters.pkl", stop=stop + 1, **kwargs)
     return [
         # note: not sure about the name.
-        Experiment(id=join(cwd.rstrip('/'), p['dir']),
+        Experiment(id=join(cwd, p['dir']),
                    name=basename(p['dir']) or ".",
-                   path=join(cwd.rstrip('/'), p['dir']),
-                   parameters=join(cwd.rstrip('/'), p['path']), )
+                   path=join(cwd, p['dir']),
+                   parameters=join(cwd, p['path']), )
         for p in parameter_files
     ]
 
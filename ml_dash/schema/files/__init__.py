@@ -1,9 +1,10 @@
 import os
-from os.path import split, isabs, realpath, join, basename, dirname
-from graphene import ObjectType, relay, String, Int, Mutation, ID, Field, Node, Boolean
+from os.path import split, isabs, join, basename, dirname
+from graphene import ObjectType, relay, String, Int, Mutation, ID, Field, Node, Boolean, Float, List
 from graphene.types.generic import GenericScalar
 from graphql_relay import from_global_id
-from ml_dash.schema.files.file_helpers import find_files
+from ml_dash import storage, compressed_files
+from ml_dash.response_cache import track
 
 from . import parameters, metrics
 
@@ -31,9 +32,10 @@ class File(ObjectType):
                   stop=Int(required=False, default_value=None))
 
     def resolve_text(self, info, start=0, stop=None):
-        from ml_dash.config import Args
+        from ml_dash import mounts
         try:
-            with open(join(Args.logdir, self.id[1:]), "r") as f:
+            track(mounts.resolve(self.id))
+            with compressed_files.open(mounts.resolve(self.id), "r") as f:
                 lines = list(f)[start: stop]
                 return "".join(lines)
         except FileNotFoundError:
@@ -44,8 +46,9 @@ class File(ObjectType):
     def resolve_json(self, info):
         import json
         try:
-            from ml_dash.config import Args
-            with open(join(Args.logdir, self.id[1:]), "r") as f:
+            from ml_dash import mounts
+            track(mounts.resolve(self.id))
+            with compressed_files.open(mounts.resolve(self.id), "r") as f:
                 return json.load(f)
         except FileNotFoundError:
             return None
@@ -63,9 +66,10 @@ class File(ObjectType):
             yaml.explict_start = True
             load_fn = yaml.load
 
-        from ml_dash.config import Args
+        from ml_dash import mounts
         try:
-            with open(join(Args.logdir, self.id[1:]), "r") as f:
+            track(mounts.resolve(self.id))
+            with compressed_files.open(mounts.resolve(self.id), "r") as f:
                 return load_fn('\n'.join(f))
         except FileNotFoundError:
             return None
@@ -85,66 +89,87 @@ def get_file(id):
 
 
 def find_files_by_query(cwd, query="**/*.*", **kwargs):
-    from ml_dash.config import Args
+    from ml_dash import mounts
     assert isabs(cwd), "the current work directory need to be an absolute path."
-    _cwd = realpath(join(Args.logdir, cwd[1:])).rstrip('/')
-    parameter_files = find_files(_cwd, query, **kwargs)
+    parameter_files = mounts.find_files(cwd, query, **kwargs)
     return [
         # note: not sure about the name.
-        File(id=join(cwd.rstrip('/'), p['path']),
+        File(id=join(cwd, p['path']),
              name=basename(p['path']),
-             path=join(cwd.rstrip('/'), p['path']))
+             path=join(cwd, p['path']))
         for p in parameter_files
     ]
 
 
 def save_text_to_file(path, text):
-    from ml_dash.config import Args
+    from ml_dash import mounts
     assert isabs(path), "the path has to be absolute path."
-    _path = join(Args.logdir, path[1:])
-    with open(_path, "w") as f:
-        f.write(text)
+    _path = mounts.resolve(path)
+    storage.write(_path, text)
     return get_file(path)
 
 
 def save_yaml_to_file(path, data):
-    from ml_dash.config import Args
+    from ml_dash import mounts
     assert isabs(path), "the path has to be absolute path."
-    _path = join(Args.logdir, path[1:])
+    _path = mounts.resolve(path)
     # note: assume all text format
-    with open(_path, "w+") as f:
-        import yaml
-        _ = yaml.dump(data, f)
+    import yaml
+    storage.write(_path, yaml.dump(data))
     return get_file(path)
 
 
 def save_json_to_file(path, data):
-    from ml_dash.config import Args
+    from ml_dash import mounts
     assert isabs(path), "the path has to be absolute path."
-    _path = join(Args.logdir, path[1:])
+    _path = mounts.resolve(path)
     # note: assume all text format
-    with open(_path, "w+") as f:
-        import json
-        _ = json.dumps(data, sort_keys=True, indent=2)
-        f.write(_)
+    import json
+    storage.write(_path, json.dumps(data, sort_keys=True, indent=2))
     return get_file(path)
 
 
 def remove_file(path):
     """remove does not work with directories"""
-    from ml_dash.config import Args
+    from ml_dash import mounts
     assert isabs(path), "the path has to be absolute path."
-    _path = join(Args.logdir, path[1:])
-    os.remove(_path)
+    _path = mounts.resolve(path)
+    storage.delete(_path)
 
 
 def remove_directory(path):
-    """rmtree does not work with files"""
-    import shutil
-    from ml_dash.config import Args
+    """
+    queues the deletion of the directory, which runs in the background.
+
+    :return: the deletion job. Raises FileNotFoundError when there is no such directory.
+    """
+    from ml_dash import deletion_jobs
+    from ml_dash import mounts
     assert isabs(path), "the path has to be absolute path."
-    _path = join(Args.logdir, path[1:])
-    shutil.rmtree(_path)
+    _path = mounts.resolve(path)
+    return deletion_jobs.submit(_path)
+
+
+class DeletionJob(ObjectType):
+    id = String(description="the id of the job")
+    path = String(description="the directory that is being deleted")
+    status = String(description="one of queued, running, done, cancelled or failed")
+    deleted = Int(description="the number of files and directories deleted so far")
+    subtrees = Int(description="the number of subtrees that are deleted in parallel, including the directory itself")
+    subtrees_done = Int(description="the number of subtrees that are deleted")
+    progress = Float(description="the fraction of the subtrees that are deleted")
+    errors = List(String, description="the entries that could not be deleted")
+
+    def resolve_path(self, info):
+        from ml_dash import mounts
+        return mounts.to_virtual(self.path)
+
+
+def get_deletion_job(id):
+    from ml_dash import deletion_jobs
+    from ml_dash.response_cache import volatile
+    volatile()
+    return deletion_jobs.get_job(id)
 
 
 class MutateTextFile(relay.ClientIDMutation):
@@ -218,11 +243,27 @@ class DeleteDirectory(relay.ClientIDMutation):
     ok = Boolean()
     id = ID()
 
+    job = Field(DeletionJob, description="the deletion, which runs in the background")
+
     @classmethod
     def mutate_and_get_payload(cls, root, info, id, client_mutation_id):
         _type, path = from_global_id(id)
         try:
-            remove_directory(path)
-            return DeleteDirectory(ok=True, id=id)
+            job = remove_directory(path)
+            return DeleteDirectory(ok=True, id=id, job=job)
         except FileNotFoundError:
             return DeleteDirectory(ok=False)
+
+
+class CancelDeletionJob(relay.ClientIDMutation):
+    class Input:
+        id = String(required=True)
+
+    ok = Boolean()
+    job = Field(DeletionJob)
+
+    @classmethod
+    def mutate_and_get_payload(cls, root, info, id, client_mutation_id=None):
+        from ml_dash import deletion_jobs
+        job = deletion_jobs.cancel(id)
+        return CancelDeletionJob(ok=job is not None, job=job)
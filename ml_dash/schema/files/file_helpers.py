@@ -1,12 +1,14 @@
-import pathlib
-from glob import iglob
-from os import stat
-from os.path import basename, join, realpath, dirname
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os.path import basename, join, dirname
 
-from ml_dash.file_handlers import cwdContext
+from ml_dash import storage
+from ml_dash.query_budget import check_deadline
+from ml_dash.response_cache import track
 
 
-def file_stat(file_path, no_stat=True):
+def file_stat(file_path, no_stat=True, root=None):
     """
     getting the stats of the file.
 
@@ -14,6 +16,7 @@ def file_stat(file_path, no_stat=True):
 
     :param file_path:
     :param no_stat:
+    :param root: the directory that file_path is relative to.
     :return:
     """
     # note: this when looped over is very slow. Fine for a small list of files though.
@@ -24,14 +27,14 @@ def file_stat(file_path, no_stat=True):
             dir=dirname(file_path),
         )
 
-    stat_res = stat(file_path)
-    sz = stat_res.st_size
+    stat_res = storage.stat(join(root, file_path) if root else file_path)
+    sz = stat_res.size
     return dict(
         name=basename(file_path),
         path=file_path,
         dir=dirname(file_path),
-        time_modified=stat_res.st_mtime,
-        time_created=stat_res.st_ctime,
+        time_modified=stat_res.mtime,
+        time_created=stat_res.ctime,
         # type=ft,
         size=sz,
     )
@@ -46,7 +49,67 @@ def fast_glob(query, wd, skip_children=False):
     raise NotImplementedError()
 
 
-def find_files(cwd, query, start=None, stop=None, no_stat=True, show_progress=False):
+def glob_files(root, query):
+    """
+    yields the paths under root that match the glob query, relative to root.
+
+    Globs from the root instead of changing the working directory, so that
+    any number of them can run at the same time. Roots can be urls, see `storage`.
+    """
+    yield from storage.glob(root, query)
+
+
+def glob_files_parallel(root, query, threads):
+    """
+    same as `glob_files`, but walks each top-level directory in its own thread,
+    for `**/` queries over large trees. Yields in the same order as `glob_files`.
+
+    Only `threads` directories are walked ahead of the one being yielded, and the
+    walks stop listing directories once the generator is closed, e.g. by the `islice`
+    of `find_files`.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+
+    # note: an object store lists all of the keys under the root in one go.
+    if not query.startswith('**/') or threads < 2 or storage.is_url(root):
+        yield from glob_files(root, query)
+        return
+
+    # note: `**` also matches the root itself.
+    yield from glob_files(root, query[3:])
+
+    stopped = threading.Event()
+
+    def walk(d):
+        with storage.stop_on(stopped):
+            return list(glob_files(join(root, d), query))
+
+    # note: the same directories that the serial glob walks into, which leaves out symlinks.
+    subdirs = iter([entry.name for entry in storage.get_driver(root).subdirs(root)])
+    executor = ThreadPoolExecutor(threads)
+    futures = deque()
+    try:
+        while True:
+            # note: the context carries the deadline and the dependencies of the request.
+            for d in subdirs:
+                futures.append((d, executor.submit(copy_context().run, walk, d)))
+                if len(futures) >= threads:
+                    break
+            if not futures:
+                return
+            d, future = futures.popleft()
+            for file in future.result():
+                yield d / file
+    finally:
+        stopped.set()
+        for _, future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def find_files(cwd, query, start=None, stop=None, no_stat=True, show_progress=False, threads=1):
     """
     find files by iGlob.
 
@@ -55,6 +118,7 @@ def find_files(cwd, query, start=None, stop=None, no_stat=True, show_progress=Fa
     :param start: starting index for iGlob.
     :param stop: ending index for iGlob
     :param no_stat: boolean flag to turn off the file_stat call.
+    :param threads: walk the top-level directories in parallel, for `**/` queries.
     :return:
     """
     from itertools import islice
@@ -63,52 +127,116 @@ def find_files(cwd, query, start=None, stop=None, no_stat=True, show_progress=Fa
     if query.endswith('**'):
         query += "/*"
 
-    with cwdContext(cwd):
-        _ = islice(pathlib.Path(".").glob(query), start, stop)
-        if show_progress:
-            from tqdm import tqdm
-            _ = tqdm(_, desc="@find_files")
+    # note: the glob tracks every directory it lists, so that new files show up as changes to them.
+    track(cwd)
+    files = glob_files_parallel(cwd, query, threads)
+    _ = islice(files, start, stop)
+    if show_progress:
+        from tqdm import tqdm
+        _ = tqdm(_, desc="@find_files")
+    try:
         for i, file in enumerate(_):
+            check_deadline()
             print(str(file))
-            yield file_stat(str(file), no_stat=no_stat)
+            yield file_stat(str(file), no_stat=no_stat, root=cwd)
+    finally:
+        # note: stops the walks of the parallel glob as soon as we have enough.
+        files.close()
+
+
+_memo = ContextVar("dataframe_memo", default=None)
+
+
+@contextmanager
+def dataframe_memo():
+    """
+    within the block, `read_dataframe` loads each file once, and hands the same
+    DataFrame to every reader. The threads of the request share the memo through
+    their copy of the context. Readers must not modify the frames in place.
+    """
+    token = _memo.set(({}, threading.Lock()))
+    try:
+        yield
+    finally:
+        _memo.reset(token)
 
 
 def read_dataframe(path, k=None):
-    from ml_logger.helpers import load_pickle_as_dataframe
+    """charges the request for the frame, see `memory_budget`. Frames in the memo are held to the end."""
+    from ml_dash import memory_budget
+    memo = _memo.get()
+    if memo is None or k is not None:
+        df = _read_dataframe(path, k)
+        memory_budget.charge(memory_budget.frame_bytes(df), path)
+        return df
+    frames, lock = memo
+    with lock:
+        # note: one lock per file, so that different files still load in parallel.
+        entry = frames.setdefault(path, [threading.Lock(), None, False])
+    with entry[0]:
+        track(path)
+        if not entry[2]:
+            entry[1], entry[2] = _read_dataframe(path), True
+            memory_budget.charge(memory_budget.frame_bytes(entry[1]), path, held=True)
+        return entry[1]
+
+
+def _read_dataframe(path, k=None):
+    from ml_dash import shared_cache
+    from ml_dash.record_stream import load_as_dataframe, load_sample_as_dataframe
+    from ml_dash import compressed_files
+    check_deadline()
+    track(path)
+    path = compressed_files.locate(path)
+    # note: the shared cache only holds complete files, not reservoir samples.
+    if k is None and shared_cache.enabled():
+        df = shared_cache.load(path)
+        if df is not None:
+            return df
     try:
-        return load_pickle_as_dataframe(path, k)
+        df = load_sample_as_dataframe(path, k) if k else load_as_dataframe(path)
     except FileNotFoundError:
         return None
+    if k is None and shared_cache.enabled():
+        shared_cache.publish(path, df)
+    return df
 
 
-def read_records(path, k=200):
-    from ml_logger.helpers import load_pickle_as_dataframe
-    df = load_pickle_as_dataframe(path, k)
+def read_records(path, k=200, seed=None):
+    from ml_dash.record_stream import load_as_dataframe, load_sample_as_dataframe
+    track(path)
+    df = load_sample_as_dataframe(path, k, seed) if k else load_as_dataframe(path)
     return df.to_json(orient="records")
 
 
-def read_log(path, k=200):
-    from ml_logger.helpers import load_pickle_as_dataframe
-    df = load_pickle_as_dataframe(path, k)
+def read_log(path, k=200, seed=None):
+    from ml_dash.record_stream import load_as_dataframe, load_sample_as_dataframe
+    track(path)
+    df = load_sample_as_dataframe(path, k, seed) if k else load_as_dataframe(path)
     return df.to_json(orient="records")
 
 
 def read_pikle(path):
-    from ml_logger.helpers import load_from_pickle
-    data = [_ for _ in load_from_pickle(path)]
+    from ml_dash.record_stream import load_records
+    track(path)
+    data = load_records(path)
     return data
 
 
 def read_pickle_for_json(path):
     """convert non JSON serializable types to string"""
-    from ml_logger.helpers import load_from_pickle, regularize_for_json
-    data = [regularize_for_json(_) for _ in load_from_pickle(path)]
+    from ml_logger.helpers import regularize_for_json
+    from ml_dash.record_stream import load_records
+    track(path)
+    data = [regularize_for_json(_) for _ in load_records(path)]
     return data
 
 
 def read_text(path, start, stop):
     from itertools import islice
-    with open(path, 'r') as f:
+    from ml_dash import compressed_files
+    track(path)
+    with compressed_files.open(path, 'r') as f:
         text = ''.join([l for l in islice(f, start, stop)])
     return text
 
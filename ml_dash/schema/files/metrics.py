@@ -1,8 +1,8 @@
 from os.path import split, realpath, join, splitext, basename
 from graphene import relay, ObjectType, String, List, JSONString, Int
 from graphene.types.generic import GenericScalar
-from ml_dash.config import Args
-from ml_dash.schema.files.file_helpers import find_files, read_records, read_dataframe
+from ml_dash import mounts
+from ml_dash.schema.files.file_helpers import read_records, read_dataframe
 
 
 class Metrics(ObjectType):
@@ -20,6 +20,10 @@ class Metrics(ObjectType):
         return self.name.split('.')[0]
 
     keys = List(String, description="list of keys for the metrics")
+    key_schema = GenericScalar(description="{key: {dtype, count, first, last}} of the metrics, from the key index")
+    summary = GenericScalar(keys=List(String, required=False),
+                            description="{key: {count, last, min, max, argmin, argmax}}, where the args are rows. "
+                                        "Read from the key index, without loading the series.")
 
     # value = List(GenericScalar, description="the raw value")
     value = GenericScalar(description="The value of the metrics file",
@@ -29,13 +33,21 @@ class Metrics(ObjectType):
                           window=Int(required=False))
 
     def resolve_keys(self, info):
-        df = read_dataframe(join(Args.logdir, self.id[1:]))
-        keys = df.keys()
-        return list(keys)
+        from ml_dash import metrics_index
+        return metrics_index.get_keys(mounts.resolve(self.id))
+
+    def resolve_key_schema(self, info):
+        from ml_dash import metrics_index
+        index = metrics_index.get_index(mounts.resolve(self.id))
+        return None if index is None else index['keys']
+
+    def resolve_summary(self, info, keys=None):
+        from ml_dash import metrics_index
+        return metrics_index.get_summary(mounts.resolve(self.id), keys)
 
     # todo: add more complex queries.
     def resolve_value(self, info, keys=None, k=None, last=None, window=None):
-        path = join(Args.logdir, self.id[1:])
+        path = mounts.resolve(self.id)
         realpath(path)
         _ = read_dataframe(path)
         if keys:
@@ -59,9 +71,18 @@ def get_metrics(id):
     return Metrics(id=id, name=basename(id), path=id)
 
 
+def get_metrics_keys(metrics_files):
+    """
+    the union of the keys of many metrics files, from their key indices.
+
+    :param metrics_files: paths to the metrics files, relative to the logdir
+    :return: {key: {dtype, count, runs}}
+    """
+    from ml_dash import metrics_index
+    return metrics_index.union_keys([mounts.resolve(p) for p in metrics_files])
+
+
 def find_metrics(cwd, **kwargs):
-    from ml_dash.config import Args
-    _cwd = realpath(join(Args.logdir, cwd[1:]))
-    parameter_files = find_files(_cwd, "**/metrics.pkl", **kwargs)
+    parameter_files = mounts.find_files(cwd, "**/metrics.pkl", **kwargs)
     for p in parameter_files:
         yield Metrics(id=join(cwd, p['path']), name="metrics.pkl")
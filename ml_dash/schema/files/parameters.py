@@ -1,9 +1,9 @@
 from functools import reduce
-from os.path import split, join as pJoin, basename, realpath
+from os.path import split, join as pJoin, basename
 from graphene import ObjectType, relay, String, List
 from graphene.types.generic import GenericScalar
-from ml_dash.config import Args
-from ml_dash.schema.files.file_helpers import find_files, read_pickle_for_json
+from ml_dash import mounts
+from ml_dash.schema.files.file_helpers import read_pickle_for_json
 from ml_dash.schema.helpers import assign, dot_keys, dot_flatten
 
 
@@ -25,18 +25,18 @@ class Parameters(ObjectType):
         return self.id
 
     def resolve_keys(self, info):
-        value = reduce(assign, read_pickle_for_json(pJoin(Args.logdir, self.id[1:])) or [{}])
+        value = reduce(assign, read_pickle_for_json(mounts.resolve(self.id)) or [{}])
         return dot_keys(value)
 
     def resolve_value(self, info, **kwargs):
-        return reduce(assign, read_pickle_for_json(pJoin(Args.logdir, self.id[1:])) or [{}])
+        return reduce(assign, read_pickle_for_json(mounts.resolve(self.id)) or [{}])
 
     def resolve_raw(self, info, **kwargs):
-        return read_pickle_for_json(pJoin(Args.logdir, self.id[1:]))
+        return read_pickle_for_json(mounts.resolve(self.id))
 
     def resolve_flat(self, info, **kwargs):
         # note: this always gives truncated some-folder/arameter.pkl path.
-        value = reduce(assign, read_pickle_for_json(pJoin(Args.logdir, self.id[1:])) or [{}])
+        value = reduce(assign, read_pickle_for_json(mounts.resolve(self.id)) or [{}])
         return dot_flatten(value)
 
     # description = String(description='string serialized data')
@@ -57,8 +57,6 @@ def get_parameters(id):
 
 
 def find_parameters(cwd, **kwargs):
-    from ml_dash.config import Args
-    _cwd = realpath(pJoin(Args.logdir, cwd[1:]))
-    parameter_files = find_files(_cwd, "parameters.pkl", **kwargs)
+    parameter_files = mounts.find_files(cwd, "parameters.pkl", **kwargs)
     for p in parameter_files:
         yield Parameters(id=pJoin(cwd, p['path']))
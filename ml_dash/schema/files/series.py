@@ -1,10 +1,9 @@
 from os.path import join, isabs
 
-import numpy as np
-import pandas as pd
-from graphene import relay, ObjectType, String, List, ID, Int, Float
+from graphene import relay, ObjectType, String, List, ID, Int, Float, Boolean
 from graphene.types.generic import GenericScalar
-from ml_dash.config import Args
+from ml_dash import mounts
+from ml_dash.query_budget import check_deadline
 from ml_dash.schema.files.file_helpers import read_dataframe
 
 
@@ -19,6 +18,18 @@ def get_columns(df, keys, stat_key):
     return {k: get_column(df, k, stat_key) for k in keys}
 
 
+def x_array(df):
+    import numpy as np
+    # note: new in 0.24.1.
+    #  ~> df.value.dtype does NOT work for categorical data.
+    _ = df['__x'].to_numpy()
+    if np.issubdtype(_.dtype, np.datetime64):
+        return _.astype(int) / 1000
+    elif np.issubdtype(_.dtype, np.timedelta64):
+        return _.astype(int) / 1000
+    return _
+
+
 class Series(ObjectType):
     class Meta:
         interfaces = relay.Node,
@@ -30,7 +41,7 @@ class Series(ObjectType):
 
     _df = GenericScalar(description='the processed dataframe object that aggregates all metrics files.')
 
-    window = Float(description="the window for the rolling average")
+    window = Float(description="the window for the rolling average, when smoothing with one")
 
     label = String(description="the lable for the series")
     x_key = String(description="key for the x")
@@ -61,14 +72,7 @@ class Series(ObjectType):
     # todo: need to move the keys out, so that we can dropnan on the joint table.
     #   Otherwise the different data columns would not necessarily be the same length.
     def resolve_x_data(self, info):
-        # note: new in 0.24.1.
-        #  ~> df.value.dtype does NOT work for categorical data.
-        _ = self._df['__x'].to_numpy()
-        if np.issubdtype(_.dtype, np.datetime64):
-            return (_.astype(int) / 1000).tolist()
-        elif np.issubdtype(_.dtype, np.timedelta64):
-            return (_.astype(int) / 1000).tolist()
-        return _.tolist()
+        return x_array(self._df).tolist()
 
     def resolve_y_mean(self, info):
         if self.y_key is not None:
@@ -125,88 +129,142 @@ class Series(ObjectType):
         return Series(id)
 
 
-def get_series(metrics_files=tuple(),
-               prefix=None,
-               head=None,
-               tail=None,
-               x_low=None,
-               x_high=None,
-               x_edge=None,  # OneOf('start', 'after', 'mid', 'mode')
-               k=None,
-               x_align=None,  # OneOf(int, 'left', 'right')
-               x_key=None,
-               y_key=None,
-               y_keys=None,
-               label=None):
-    warning = None
-    assert not y_key or not y_keys, "yKey and yKeys can not be trueful at the same time"
-    assert y_key or y_keys, "yKey and yKeys can not be both falseful."
-    assert head is None or tail is None, "head and tail can not be trueful at the same time"
+def check_smoothing(smoothing):
+    if not smoothing:
+        return
+    assert isinstance(smoothing, dict) and len(smoothing) == 1, \
+        f"smoothing {smoothing} should be OneOf[{{ema: alpha}}, {{window: n}}]"
+    if 'ema' in smoothing:
+        assert 0 < smoothing['ema'] <= 1, f"the ema alpha {smoothing['ema']} should be in (0, 1]."
+    elif 'window' in smoothing:
+        assert isinstance(smoothing['window'], int) and smoothing['window'] >= 1, \
+            f"the window {smoothing['window']} should be a positive integer."
+    else:
+        raise AssertionError(f"smoothing {smoothing} should be OneOf[{{ema: alpha}}, {{window: n}}]")
+
+
+def smooth(df, y_keys, ema=None, window=None):
+    """
+    smooths the y columns of a single run.
+
+    Each column is smoothed over the rows where it has a value, so that keys that
+    are logged at different steps don't pull each other's averages towards NaN.
+
+    :param ema: the alpha of an exponential moving average
+    :param window: the number of points in a trailing rolling average
+    """
+    df = df.copy()
+    for key in y_keys:
+        column = df[key].dropna()
+        if ema is not None:
+            column = column.ewm(alpha=ema, adjust=False).mean()
+        else:
+            column = column.rolling(window, min_periods=1).mean()
+        df[key] = column.reindex(df.index)
+    return df
+
+
+def metrics_paths(metrics_files, prefix=None):
     if not prefix:
         for id in metrics_files:
             assert isabs(id), f"metricFile need to be absolute path is prefix is {prefix}. It is {id} instead."
 
     ids = [join(prefix or "", id) for id in metrics_files]
-    dfs = [read_dataframe(join(Args.logdir, _id[1:])) for _id in ids]
+    return [mounts.resolve(_id) for _id in ids]
 
-    y_keys = y_keys or [y_key]
+
+def prepare_run(df, head=None, tail=None, x_low=None, x_high=None, x_align=None, x_key=None, y_keys=None,
+                smoothing=None):
+    """returns the columns of one run that go into the series."""
     join_keys = [k for k in {x_key, *y_keys} if k is not None]
 
+    if x_key is not None:
+        df.set_index(x_key)
+        if x_align is None:
+            pass
+        # note: assign instead of -=, the frame can be shared with other series of the request.
+        elif x_align == "start":  # todo: this needs to be part of the join
+            df = df.assign(**{x_key: df[x_key] - df[x_key][0]})
+        elif x_align == "end":
+            df = df.assign(**{x_key: df[x_key] - df[x_key][-1]})
+        else:
+            df = df.assign(**{x_key: df[x_key] - x_align})
+    else:
+        df = df[y_keys]
+        df['index'] = df.index
+        df.set_index('index')
+
+    # note: smooth the whole run, so that the range below does not change the values.
+    if smoothing:
+        df = smooth(df, y_keys, **smoothing)
+
+    # todo: maybe apply tail and head *after* dropna??
+    if tail is not None:
+        df = df.tail(tail)
+    if head is not None:
+        df = df.head(head)
+    inds = True
+    if x_low is not None:
+        inds &= df[x_key or "index"] >= x_low
+        # print("x_low >>>", inds)
+    if x_high is not None:
+        inds &= df[x_key or "index"] <= x_high
+        # print("x_high >>>", inds)
+    if inds is not True:
+        df = df.loc[inds]
+
+    # todo: only dropna if we are not using ranges. <need to test>
+    try:
+        column = df[join_keys]
+        if head is None and tail is None:
+            return column.dropna()
+        return column
+    except KeyError as e:
+        raise KeyError(f"{join_keys} contain keys that is not in the dataframe. "
+                       f"Keys available include {df.keys()}") from e
+
+
+def load_series(metrics_files=tuple(),
+                prefix=None,
+                head=None,
+                tail=None,
+                x_low=None,
+                x_high=None,
+                x_align=None,  # OneOf(int, 'left', 'right')
+                x_key=None,
+                y_keys=None,
+                smoothing=None):
+    """reads the metrics files, and returns the columns of each run that go into the series."""
+    return load_runs(metrics_paths(metrics_files, prefix), head, tail, x_low, x_high, x_align, x_key, y_keys,
+                     smoothing)
+
+
+def load_runs(paths, head=None, tail=None, x_low=None, x_high=None, x_align=None, x_key=None, y_keys=None,
+              smoothing=None):
+    """same as `load_series`, with the physical paths of the metrics files."""
+    dfs = [read_dataframe(path) for path in paths]
+
     dataframes = []
     for df in dfs:
+        check_deadline()
         if df is None:
             continue
-        elif x_key is not None:
-            df.set_index(x_key)
-            if x_align is None:
-                pass
-            elif x_align == "start":  # todo: this needs to be part of the join
-                df[x_key] -= df[x_key][0]
-            elif x_align == "end":
-                df[x_key] -= df[x_key][-1]
-            else:
-                df[x_key] -= x_align
-        else:
-            df = df[y_keys]
-            df['index'] = df.index
-            df.set_index('index')
-
-        # todo: maybe apply tail and head *after* dropna??
-        if tail is not None:
-            df = df.tail(tail)
-        if head is not None:
-            df = df.head(head)
-        inds = True
-        if x_low is not None:
-            inds &= df[x_key or "index"] >= x_low
-            # print("x_low >>>", inds)
-        if x_high is not None:
-            inds &= df[x_key or "index"] <= x_high
-            # print("x_high >>>", inds)
-        if inds is not True:
-            df = df.loc[inds]
-
-        # todo: only dropna if we are not using ranges. <need to test>
-        try:
-            column = df[join_keys]
-            if head is None and tail is None:
-                dataframes.append(column.dropna())
-            else:
-                dataframes.append(column)
-        except KeyError as e:
-            raise KeyError(f"{join_keys} contain keys that is not in the dataframe. "
-                           f"Keys available include {df.keys()}") from e
-
-    if not dataframes:  # No dataframe, return `null`.
-        return None
+        dataframes.append(prepare_run(df, head, tail, x_low, x_high, x_align, x_key, y_keys, smoothing))
+    return dataframes
+
 
+def aggregate_series(dataframes, x_key=None, y_keys=None, k=None, x_edge=None):
+    """
+    bins the runs on x, and describes the y values in each bin. This is the CPU-heavy part.
+
+    :return: the `describe()` DataFrame, with the x values in the `__x` column.
+    """
+    import pandas as pd
     all = pd.concat(dataframes)
 
     if x_key:
         all = all.set_index(x_key)
 
-    all.rank(method='first')
-
     if k is not None:
         bins = pd.qcut(all.index, k, duplicates='drop')
         grouped = all.groupby(bins)
@@ -215,7 +273,6 @@ def get_series(metrics_files=tuple(),
         grouped = all.groupby(level=0)
 
     # treat all numbers in bin as equal. For raw (not averaged, or averaged)
-    grouped[y_keys].agg(['count', 'mean', 'min', 'max'])
     df = grouped[y_keys].describe(percentiles=[0.25, 0.75, 0.5, 0.05, 0.95]).reset_index()
 
     if k is not None:
@@ -231,19 +288,469 @@ def get_series(metrics_files=tuple(),
         else:
             raise KeyError(f"x_edge {[x_edge]} should be OneOf['start', 'after', 'mid', 'mode']")
     else:
-        df['__x'] = df.index
+        # note: reset_index moved the x values into a column.
+        df['__x'] = df[x_key or 'index']
+
+    return df.sort_values(by="__x")
+
 
+def aggregate_shared(name, specs, layout, x_key, y_keys, k, x_edge, result_name=None):
+    """
+    runs `aggregate_series` in a pool process, on the columns in shared memory.
+
+    :param layout: the column names of each run. Each run is stored as its index, then its columns.
+    :param result_name: the name of the shared block to put the result in.
+    :return: (name, specs, columns) of the shared block holding the result.
+    """
+    import pandas as pd
+    from ml_dash.process_pool import attach, share
+
+    shm, arrays = attach(name, specs)
+    try:
+        arrays = iter(arrays)
+        # note: building the frames copies the columns out of the shared block.
+        dataframes = [pd.DataFrame({c: next(arrays) for c in columns}, index=next(arrays).copy())
+                      for columns in layout]
+    finally:
+        del arrays
+        shm.close()
+
+    df = aggregate_series(dataframes, x_key, y_keys, k, x_edge)
+    columns = [c for c in df.columns if c[0] in y_keys]
+    result, result_specs = share([df['__x'].to_numpy(), *[df[c].to_numpy() for c in columns]], result_name)
+    result.close()
+    return result.name, result_specs, columns
+
+
+def share_series(dataframes):
+    """puts the runs into shared memory. Returns None when they should be aggregated inline."""
+    from ml_dash.config import PoolArgs
+    from ml_dash.process_pool import enabled, share
+
+    if not enabled() or sum(len(df) for df in dataframes) < PoolArgs.pool_min_rows:
+        return None
+    if any(dtype.kind == 'O' for df in dataframes for dtype in [df.index.dtype, *df.dtypes]):
+        return None
+    arrays, layout = [], []
+    for df in dataframes:
+        # note: the index goes after the columns, in the order `aggregate_shared` reads them.
+        arrays.extend([*[df[c].to_numpy() for c in df.columns], df.index.to_numpy()])
+        layout.append(list(df.columns))
+    shm, specs = share(arrays)
+    return shm, specs, layout
+
+
+def unshare_series(name, specs, columns):
+    import pandas as pd
+    from ml_dash.process_pool import attach, release
+    shm, arrays = attach(name, specs)
+    try:
+        df = pd.DataFrame({('__x', ''): arrays[0].copy(), **{c: a.copy() for c, a in zip(columns, arrays[1:])}})
+    finally:
+        del arrays
+        release(shm)
+    return df
+
+
+def charge_pooled(dataframes):
+    """charges the request for the copy of the runs that `aggregate_series` or the pool makes."""
+    from ml_dash import memory_budget
+    memory_budget.charge(sum(memory_budget.frame_bytes(df) for df in dataframes), "the pooled runs")
+
+
+def aggregate(dataframes, x_key=None, y_keys=None, k=None, x_edge=None):
+    """aggregates the series in the process pool when it is on, and inline otherwise."""
+    from ml_dash.process_pool import run, release, block_name
+    charge_pooled(dataframes)
+    shared = share_series(dataframes)
+    if shared is None:
+        return aggregate_series(dataframes, x_key, y_keys, k, x_edge)
+    shm, specs, layout = shared
+    result = block_name()
+    try:
+        return unshare_series(*run(aggregate_shared, shm.name, specs, layout, x_key, y_keys, k, x_edge, result,
+                                   result=result))
+    finally:
+        release(shm)
+
+
+async def aggregate_async(dataframes, x_key=None, y_keys=None, k=None, x_edge=None):
+    """same as `aggregate`, but awaits the pool instead of blocking the event loop."""
+    from ml_dash.process_pool import run_async, release, block_name
+    charge_pooled(dataframes)
+    shared = share_series(dataframes)
+    if shared is None:
+        return aggregate_series(dataframes, x_key, y_keys, k, x_edge)
+    shm, specs, layout = shared
+    result = block_name()
+    try:
+        return unshare_series(*await run_async(aggregate_shared, shm.name, specs, layout, x_key, y_keys, k, x_edge,
+                                               result, result=result))
+    finally:
+        release(shm)
+
+
+def get_series(metrics_files=tuple(),
+               prefix=None,
+               head=None,
+               tail=None,
+               x_low=None,
+               x_high=None,
+               x_edge=None,  # OneOf('start', 'after', 'mid', 'mode')
+               k=None,
+               x_align=None,  # OneOf(int, 'left', 'right')
+               x_key=None,
+               y_key=None,
+               y_keys=None,
+               label=None,
+               smoothing=None,
+               interpolation=None,  # OneOf('linear', 'previous')
+               approximate=False):
+    from ml_dash import memory_budget
+    y_keys = check_series_args(head, tail, k, y_key, y_keys, smoothing, interpolation, approximate)
+    # note: the runs are only held while the series is made.
+    with memory_budget.scope():
+        paths, k, approximate, warning = plan_series(metrics_paths(metrics_files, prefix), k, interpolation,
+                                                     approximate)
+        if approximate:
+            df = sketch_series(paths, head, tail, x_low, x_high, x_edge, k, x_align, x_key, y_keys, smoothing)
+        else:
+            dataframes, k = prepare_series(paths, head, tail, x_low, x_high, k, x_align,
+                                           x_key, y_keys, smoothing, interpolation)
+            df = dataframes and aggregate(dataframes, x_key, y_keys, k, x_edge)
+    if df is None or not len(df):  # No dataframe, return `null`.
+        return None
+    return make_series(df, metrics_files, prefix, x_key, y_key, y_keys, label, smoothing, warning)
+
+
+async def get_series_async(metrics_files=tuple(),
+                           prefix=None,
+                           head=None,
+                           tail=None,
+                           x_low=None,
+                           x_high=None,
+                           x_edge=None,
+                           k=None,
+                           x_align=None,
+                           x_key=None,
+                           y_key=None,
+                           y_keys=None,
+                           label=None,
+                           smoothing=None,
+                           interpolation=None,
+                           approximate=False):
+    """same as `get_series`, but awaits the aggregation when it runs in the process pool."""
+    from ml_dash import memory_budget
+    y_keys = check_series_args(head, tail, k, y_key, y_keys, smoothing, interpolation, approximate)
+    # note: the runs are only held while the series is made.
+    with memory_budget.scope():
+        paths, k, approximate, warning = plan_series(metrics_paths(metrics_files, prefix), k, interpolation,
+                                                     approximate)
+        if approximate:
+            df = sketch_series(paths, head, tail, x_low, x_high, x_edge, k, x_align, x_key, y_keys, smoothing)
+        else:
+            dataframes, k = prepare_series(paths, head, tail, x_low, x_high, k, x_align,
+                                           x_key, y_keys, smoothing, interpolation)
+            df = dataframes and await aggregate_async(dataframes, x_key, y_keys, k, x_edge)
+    if df is None or not len(df):  # No dataframe, return `null`.
+        return None
+    return make_series(df, metrics_files, prefix, x_key, y_key, y_keys, label, smoothing, warning)
+
+
+def make_series(df, metrics_files, prefix, x_key, y_key, y_keys, label, smoothing, warning=None):
     return Series(metrics_files,
-                  _df=df.sort_values(by="__x"),
+                  _df=df,
                   metrics_files=metrics_files,
                   prefix=prefix,
                   x_key=x_key or "index",
                   y_key=y_key,
                   y_keys=y_keys,
                   label=label,
+                  window=(smoothing or {}).get('window'),
                   warning=warning)
 
 
+def check_series_args(head, tail, k, y_key, y_keys, smoothing, interpolation, approximate):
+    """checks the arguments of `get_series`, and returns the y keys."""
+    assert not y_key or not y_keys, "yKey and yKeys can not be trueful at the same time"
+    assert y_key or y_keys, "yKey and yKeys can not be both falseful."
+    assert head is None or tail is None, "head and tail can not be trueful at the same time"
+    assert interpolation in [None, "linear", "previous"], \
+        f"interpolation {interpolation} should be OneOf['linear', 'previous']"
+    assert not approximate or k, "approximate needs the number of bins `k`."
+    assert not approximate or not interpolation, "approximate and interpolation can not be used together."
+    check_smoothing(smoothing)
+    return y_keys or [y_key]
+
+
+def plan_series(paths, k, interpolation, approximate):
+    """
+    degrades a series that would take the request over its memory limits, see `memory_budget`.
+    Over the soft limit, the series is approximated, or downsampled when it is interpolated.
+    Pooled runs that don't fit under the hard limit are left out.
+
+    :return: (paths, k, approximate, warning). The warning is None when nothing changed.
+    """
+    from ml_dash import memory_budget
+    from ml_dash.config import MemoryArgs
+    if not memory_budget.active():
+        return paths, k, approximate, None
+
+    sizes = [memory_budget.file_bytes(path) for path in paths]
+    warnings = []
+    if not approximate and memory_budget.degraded(sum(sizes)):
+        if not interpolation:
+            k, approximate = k or MemoryArgs.degraded_k, True
+            warnings.append(f"Approximated from per-run sketches in {k} bins, to stay under the memory limit.")
+        elif not k:
+            k = MemoryArgs.degraded_k
+            warnings.append(f"Downsampled to {k} points, to stay under the memory limit.")
+    if not approximate:
+        n = memory_budget.fitting(sizes, paths[0] if paths else None)
+        if n < len(paths):
+            warnings.append(f"Only the first {n} of {len(paths)} runs, to stay under the memory limit.")
+            paths = paths[:n]
+    return paths, k, approximate, " ".join(warnings) or None
+
+
+def prepare_series(paths, head, tail, x_low, x_high, k, x_align, x_key, y_keys, smoothing, interpolation):
+    """
+    reads the runs that go into the series.
+
+    :return: (dataframes, k). k is None when the runs are already on a shared grid.
+    """
+    dataframes = load_runs(paths, head, tail, x_low, x_high, x_align, x_key, y_keys, smoothing)
+    if dataframes and interpolation:
+        # note: the grid has k points already, so the runs are aggregated point by point.
+        dataframes, k = interpolate(dataframes, x_key, y_keys, k, interpolation), None
+    return dataframes, k
+
+
+def sketch_series(paths, head, tail, x_low, x_high, x_edge, k, x_align, x_key, y_keys, smoothing):
+    """
+    the approximate version of `aggregate_series`. Reads one run at a time, summarizes
+    it into a sketch, and merges the sketches, without ever pooling the runs.
+
+    The bins have equal widths over the x range of all runs, instead of holding equal
+    numbers of points.
+
+    :return: a DataFrame in the layout of `aggregate_series`, or None when there are no runs.
+    """
+    import numpy as np
+    import pandas as pd
+    from ml_dash import memory_budget, sketches
+    from ml_dash.config import SketchArgs
+    from ml_dash.response_cache import cache_key, stat_signature
+
+    cache = get_sketch_cache()
+    runs, x_dtype = [], None
+    for path in paths:
+        check_deadline()
+        key = cache_key(path, head, tail, x_low, x_high, x_align, x_key, y_keys, smoothing,
+                        SketchArgs.sketch_bins, SketchArgs.sketch_points)
+        entry = cache.get(key)
+        if entry is None:
+            signature = stat_signature(path)
+            # note: only one run is held at a time.
+            with memory_budget.scope():
+                df = read_dataframe(path)
+                if df is None:
+                    continue
+                df = prepare_run(df, head, tail, x_low, x_high, x_align, x_key, y_keys, smoothing)
+                x = (df[x_key] if x_key else df.index).to_numpy()
+                entry = x.dtype, {y: sketches.sketch_run(x.view('i8').astype(float) if x.dtype.kind in "mM" else
+                                                         x.astype(float), df[y].to_numpy(dtype=float),
+                                                         SketchArgs.sketch_bins, SketchArgs.sketch_points)
+                                  for y in y_keys}
+                del df
+            cache.put(key, entry, {path: signature})
+        x_dtype, run = entry
+        runs.append(run)
+
+    if not runs:
+        return None
+
+    centers = [run[y].centers for run in runs for y in y_keys if len(run[y].centers)]
+    if not centers:
+        return None
+    low, high = min(c.min() for c in centers), max(c.max() for c in centers)
+    edges = np.linspace(low, high, k + 1)
+
+    stats = {y: sketches.merge([run[y] for run in runs], edges) for y in y_keys}
+    filled = np.any([stats[y]['count'] > 0 for y in y_keys], axis=0)
+
+    if x_edge == "right" or x_edge is None:
+        x = edges[1:]
+    elif x_edge == "left":
+        x = edges[:-1]
+    elif x_edge == "mean":
+        x = 0.5 * (edges[:-1] + edges[1:])
+    else:
+        raise KeyError(f"x_edge {[x_edge]} should be OneOf['start', 'after', 'mid', 'mode']")
+    if x_dtype.kind in "mM":
+        x = x.astype('i8').view(x_dtype)
+
+    columns = {('__x', ''): x[filled]}
+    for y in y_keys:
+        for stat in sketches.STATS:
+            columns[(y, stat)] = stats[y][stat][filled]
+    return pd.DataFrame(columns)
+
+
+def get_sketch_cache():
+    global _sketch_cache
+    from ml_dash.config import SketchArgs
+    from ml_dash.response_cache import ResponseCache
+    if _sketch_cache is None:
+        _sketch_cache = ResponseCache(SketchArgs.sketch_cache_size)
+    return _sketch_cache
+
+
+_sketch_cache = None
+
+
+def interpolate(dataframes, x_key, y_keys, k=None, kind="linear"):
+    """
+    resamples every run onto the same grid of x values, so that each point of the
+    series aggregates all of the runs that cover it.
+
+    The grid spans the x range of all runs. Runs are not extrapolated: outside of
+    its own x range, a run has no value.
+
+    :param k: the number of points in the grid. Defaults to the length of the longest run.
+    :param kind: `linear`, or `previous` to hold the last logged value.
+    """
+    import numpy as np
+    import pandas as pd
+
+    xs = [(df[x_key] if x_key else df.index).to_numpy() for df in dataframes]
+    # note: interpolate datetimes as integers.
+    x_dtype = next((x.dtype for x in xs if len(x)), np.dtype(float))
+    as_number = x_dtype.kind in "mM"
+    xs = [x.view('i8') if as_number else x.astype(float) for x in xs]
+
+    non_empty = [x for x in xs if len(x)]
+    if not non_empty:
+        return dataframes
+    low = min(np.nanmin(x) for x in non_empty)
+    high = max(np.nanmax(x) for x in non_empty)
+    grid = np.linspace(low, high, k or max(len(x) for x in xs))
+
+    resampled = []
+    for df, x in zip(dataframes, xs):
+        order = np.argsort(x, kind='stable')
+        columns = {}
+        for key in y_keys:
+            y = df[key].to_numpy(dtype=float)[order]
+            _x = x[order]
+            valid = ~np.isnan(y) & ~np.isnan(_x)
+            columns[key] = resample(grid, _x[valid], y[valid], kind)
+        _grid = grid.astype('i8').view(x_dtype) if as_number else grid
+        if x_key:
+            resampled.append(pd.DataFrame({x_key: _grid, **columns}))
+        else:
+            resampled.append(pd.DataFrame(columns, index=_grid))
+    return resampled
+
+
+def resample(grid, x, y, kind="linear"):
+    """samples y(x) at the grid points, with NaN outside of the range of x. x has to be sorted."""
+    import numpy as np
+    if not len(x):
+        return np.full(len(grid), np.nan)
+    if kind == "linear":
+        return np.interp(grid, x, y, left=np.nan, right=np.nan)
+    inds = np.searchsorted(x, grid, side='right') - 1
+    values = y[np.clip(inds, 0, None)]
+    values[(inds < 0) | (grid > x[-1])] = np.nan
+    return values
+
+
+def resolve_series(_, info, **kwargs):
+    """
+    awaits the process pool when there is an event loop to return to, as in the
+    server. Blocks on it otherwise.
+    """
+    from asyncio import get_running_loop
+    from ml_dash.process_pool import enabled
+    if enabled():
+        try:
+            get_running_loop()
+            return get_series_async(**kwargs)
+        except RuntimeError:
+            pass
+    return get_series(**kwargs)
+
+
+# maps the stat names of the binary format to the columns of `describe()`.
+SERIES_STATS = dict(mean='mean', median='50%', min='min', max='max',
+                    pc25='25%', pc75='75%', pc05='5%', pc95='95%', count='count')
+SERIES_MAGIC = b"MLDS"
+SERIES_VERSION = 1
+
+
+def _align(n, to=8):
+    return (n + to - 1) // to * to
+
+
+def pack_series(series, stats=("mean",), dtype="float64"):
+    """
+    packs a series into a compact binary layout, for typed-array clients.
+
+    Layout (all integers little-endian)::
+
+        b"MLDS" | uint16 version | uint16 reserved | uint32 header length | json header | buffers
+
+    The json header lists the buffers as `{key, stat, offset, length}`. The offsets are
+    absolute and 8-byte aligned, so that `new Float64Array(payload, offset, length)` works
+    directly. The x data has `key: "__x"` and `stat: null`.
+
+    :param series: the Series returned by `get_series`
+    :param stats: keys of SERIES_STATS to include
+    :param dtype: "float32" or "float64"
+    :return: bytes
+    """
+    import json, struct
+    import numpy as np
+    assert dtype in ["float32", "float64"], f"dtype {dtype} should be OneOf['float32', 'float64']"
+    le_dtype = np.dtype(dtype).newbyteorder('<')
+
+    columns = [("__x", None, x_array(series._df))]
+    for y_key in series.y_keys:
+        for stat in stats:
+            try:
+                _ = series._df[y_key][SERIES_STATS[stat]].to_numpy()
+            except KeyError:
+                _ = np.empty(0)
+            columns.append((y_key, stat, _))
+
+    buffers = [np.ascontiguousarray(column, dtype=le_dtype) for *_, column in columns]
+
+    def make_header(start):
+        offset, entries = start, []
+        for (key, stat, _), buffer in zip(columns, buffers):
+            entries.append(dict(key=key, stat=stat, offset=offset, length=len(buffer)))
+            offset = _align(offset + buffer.nbytes)
+        return dict(xKey=series.x_key, yKeys=series.y_keys, label=series.label, warning=series.warning,
+                    dtype=dtype, buffers=entries)
+
+    # note: the offsets depend on the length of the header, so grow the start
+    #  until the header fits in front of it. The header is padded with spaces.
+    prelude = 12
+    start = _align(prelude)
+    header = json.dumps(make_header(start)).encode()
+    while prelude + len(header) > start:
+        start = _align(prelude + len(header))
+        header = json.dumps(make_header(start)).encode()
+    header = header.ljust(start - prelude)
+
+    chunks = [SERIES_MAGIC, struct.pack('<HHI', SERIES_VERSION, 0, len(header)), header]
+    for buffer in buffers:
+        chunks.append(buffer.tobytes())
+        chunks.append(b"\0" * (_align(buffer.nbytes) - buffer.nbytes))
+    return b"".join(chunks)
+
+
 SeriesArguments = dict(
     metrics_files=List(String, required=True),
     prefix=String(description="prefix to the metricFiles.", required=False),
@@ -258,6 +765,11 @@ SeriesArguments = dict(
     y_keys=List(String, description="Alternatively you can pass a list of keys to yKey*s*."),
     label=String(),
     warning=String(),
+    smoothing=GenericScalar(description="{ema: alpha} or {window: n}, applied to each run before aggregating them"),
+    interpolation=String(description="'linear' or 'previous': resample each run onto a shared grid of k points, "
+                                     "so that every point aggregates all runs that cover it"),
+    approximate=Boolean(description="estimate the quantiles from per-run sketches, instead of pooling the runs. "
+                                    "Needs k."),
 )
 
 # if __name__ == "__main__":
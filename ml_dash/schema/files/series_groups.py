@@ -0,0 +1,114 @@
+import json
+from functools import reduce
+from os.path import join, isabs, dirname
+
+from graphene import ObjectType, String, List, Field, Int
+from graphene.types.generic import GenericScalar
+from ml_dash import mounts
+from ml_dash.schema.files.file_helpers import read_pikle
+from ml_dash.schema.files.series import Series, get_series, SeriesArguments
+from ml_dash.schema.helpers import assign, dot_flatten
+
+
+class SeriesGroup(ObjectType):
+    key = GenericScalar(description="the values of the groupBy parameters that this group shares")
+    label = String(description="the key as `Args.lr=0.001, Args.seed=100`")
+    experiments = List(String, description="the experiments in this group")
+    series = Field(Series, description="the series aggregated over the experiments in this group")
+
+
+def read_flat_parameters(path):
+    # note: not `read_pickle_for_json`, which turns every repeated set of parameters into an error.
+    return dot_flatten(reduce(assign, read_pikle(path) or [{}]))
+
+
+def json_value(v):
+    return v if v is None or isinstance(v, (bool, int, float, str, list, dict)) else str(v)
+
+
+def matches(flat, filter):
+    """
+    :param filter: {key: value}, or {key: [values]} to accept any of them.
+    """
+    for k, v in (filter or {}).items():
+        if flat.get(k) not in (v if isinstance(v, list) else [v]):
+            return False
+    return True
+
+
+def sort_key(values):
+    # note: None last, and never compare numbers with strings.
+    return [(v is None, isinstance(v, str), v if isinstance(v, (int, float, str)) else json.dumps(v))
+            for v in values]
+
+
+def parallel_map(fn, items, threads):
+    """maps fn over items in threads, with the context of the request in each of them."""
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+    if threads < 2 or len(items) < 2:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(copy_context().run, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+
+def get_series_groups(cwd, group_by, filter=None, metrics_file="metrics.pkl", stop=None, **series_args):
+    """
+    groups the experiments under cwd by their (flattened) parameters, and aggregates
+    one series for each group.
+
+    :param cwd: the directory to look for experiments in
+    :param group_by: list of flattened parameter keys, e.g. ["Args.lr"]
+    :param filter: only include experiments whose parameters match, see `matches`
+    :param metrics_file: path of the metrics file, relative to the experiment
+    :param stop: the max number of experiments to include
+    :param series_args: the arguments of `get_series`
+    :return: list of SeriesGroup, sorted by key
+    """
+    from ml_dash.config import DiscoveryArgs
+    assert isabs(cwd), "the current work directory need to be an absolute path."
+    assert group_by, "groupBy needs at least one key."
+    threads = DiscoveryArgs.discovery_threads
+    parameter_files = [p['path'] for p in mounts.find_files(cwd, "**/parameters.pkl", stop=stop, threads=threads)]
+    flats = parallel_map(lambda p: read_flat_parameters(mounts.resolve(join(cwd, p))), parameter_files, threads)
+
+    groups = {}
+    for path, flat in zip(parameter_files, flats):
+        if not matches(flat, filter):
+            continue
+        values = [json_value(flat.get(k)) for k in group_by]
+        # note: parameter values can be lists, which are not hashable.
+        _, experiments = groups.setdefault(json.dumps(values, default=str), (values, []))
+        experiments.append(join(cwd, dirname(path)))
+
+    groups = sorted(groups.values(), key=lambda g: sort_key(g[0]))
+
+    def aggregate(group):
+        values, experiments = group
+        label = ", ".join(f"{k}={v}" for k, v in zip(group_by, values))
+        series = get_series(metrics_files=[join(e, metrics_file) for e in experiments], label=label, **series_args)
+        return SeriesGroup(key=dict(zip(group_by, values)), label=label, experiments=experiments, series=series)
+
+    return parallel_map(aggregate, groups, threads)
+
+
+def resolve_series_groups(_, info, **kwargs):
+    """runs in the default executor when there is an event loop, so that the groups don't block it."""
+    from asyncio import get_running_loop
+    from contextvars import copy_context
+    try:
+        loop = get_running_loop()
+    except RuntimeError:
+        return get_series_groups(**kwargs)
+    return loop.run_in_executor(None, copy_context().run, lambda: get_series_groups(**kwargs))
+
+
+SeriesGroupsArguments = dict(
+    cwd=String(required=True, description="the directory to look for experiments in"),
+    group_by=List(String, required=True, description="flattened parameter keys to group the experiments by"),
+    filter=GenericScalar(description="{key: value} or {key: [values]}, to only include matching experiments"),
+    metrics_file=String(description="the metrics file, relative to each experiment. Defaults to metrics.pkl"),
+    stop=Int(description="the max number of experiments to include"),
+    **{k: v for k, v in SeriesArguments.items() if k not in ['metrics_files', 'prefix', 'label', 'warning']},
+)
@@ -1,5 +1,4 @@
-from os import listdir
-from os.path import isfile, join, split
+from os.path import join, split
 
 from graphene import ObjectType, relay, String, List
 from ml_dash import schema
@@ -25,18 +24,16 @@ class Project(ObjectType):
     directories = relay.ConnectionField(lambda: schema.directories.DirectoryConnection)
 
     def resolve_directories(self, info, before=None, after=None, first=None, last=None):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [schema.Directory(id=join(self.id, _), name=_)
-                for _ in listdir(root_dir) if not isfile(join(root_dir, _))]
+        from ml_dash import mounts
+        dirs, files = mounts.list_dir(self.id)
+        return [schema.Directory(id=join(self.id, _), name=_) for _ in dirs]
 
     files = relay.ConnectionField(lambda: schema.files.FileConnection)
 
     def resolve_files(self, info, before=None, after=None, first=None, last=None):
-        from ml_dash.config import Args
-        root_dir = join(Args.logdir, self.id[1:])
-        return [schema.Directory(id=join(self.id, _), name=_)
-                for _ in listdir(root_dir) if isfile(join(root_dir, _))]
+        from ml_dash import mounts
+        dirs, files = mounts.list_dir(self.id)
+        return [schema.Directory(id=join(self.id, _), name=_) for _ in files]
 
     @classmethod
     def get_node(cls, info, id):
@@ -49,14 +46,12 @@ class ProjectConnection(relay.Connection):
 
 
 def get_projects(username):
-    import os
-    from ml_dash.config import Args
-    user_root = join(Args.logdir, username)
-    return [Project(name=_, id=join('/', username, _))
-            for _ in os.listdir(user_root) if not isfile(_)]
+    from ml_dash import mounts
+    dirs, files = mounts.list_dir(join('/', username))
+    return [Project(name=_, id=join('/', username, _)) for _ in dirs]
 
 
 def get_project(id):
-    from ml_dash.config import Args
-    path = join(Args.logdir, id[1:])
+    from ml_dash import mounts
+    path = mounts.resolve(id)
     return Project(id=id, name=split(id[1:])[1], _path=path)
@@ -0,0 +1,133 @@
+import heapq
+from os.path import join, isabs, dirname, basename
+
+from graphene import ObjectType, String, List, Field, Int, Float, Boolean
+from graphene.types.generic import GenericScalar
+from ml_dash import schema, mounts
+from ml_dash.schema.files.file_helpers import read_dataframe
+from ml_dash.schema.files.series_groups import read_flat_parameters, matches, parallel_map
+
+AGGREGATES = ["last", "max", "min", "mean_last_n"]
+# the number of (file, key, n) tails that each worker keeps in memory.
+TAIL_CACHE_SIZE = 4096
+
+
+class TopExperiment(ObjectType):
+    rank = Int(description="the rank of the experiment, starting at 1")
+    path = String(description="path to the experiment")
+    value = Float(description="the aggregated value of the key that the experiment is ranked by")
+    experiment = Field(lambda: schema.experiments.Experiment)
+
+    def resolve_experiment(self, info):
+        return schema.experiments.Experiment(id=self.path, name=basename(self.path) or ".", path=self.path)
+
+
+def get_tail_cache():
+    global _tail_cache
+    from ml_dash.response_cache import ResponseCache
+    if _tail_cache is None:
+        _tail_cache = ResponseCache(TAIL_CACHE_SIZE)
+    return _tail_cache
+
+
+_tail_cache = None
+
+
+def mean_last_n(path, key, n):
+    """the mean of the last n values of the key. Reads the series, so the result is cached."""
+    from ml_dash import memory_budget
+    from ml_dash.response_cache import cache_key, stat_signature
+    cache = get_tail_cache()
+    _key = cache_key(path, key, n)
+    entry = cache.get(_key)
+    if entry is None:
+        signature = stat_signature(path)
+        with memory_budget.scope():
+            df = read_dataframe(path)
+            if df is None or key not in df:
+                return None
+            column = df[key].dropna().tail(n)
+            entry = float(column.mean()) if len(column) else None
+        cache.put(_key, entry, {path: signature})
+    return entry
+
+
+def score(path, key, agg, n):
+    """the value to rank a metrics file by, from its summary. None when the file does not have the key."""
+    from ml_dash import metrics_index
+    if agg == "mean_last_n":
+        return mean_last_n(path, key, n)
+    summary = metrics_index.get_summary(path, [key])
+    if not summary:
+        return None
+    value = summary[key][agg]
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def get_top_experiments(cwd, key, agg="last", k=20, n=10, ascending=False, filter=None,
+                        metrics_file="metrics.pkl", stop=None):
+    """
+    ranks the experiments under cwd by a metric.
+
+    Scores come from the summary in the key index of each metrics file, which only decodes
+    what was appended since the last query. Files are scored in parallel, and a heap of
+    size k keeps the best ones.
+
+    :param cwd: the directory to look for experiments in
+    :param key: the metric to rank by
+    :param agg: one of `last`, `max`, `min` or `mean_last_n`
+    :param k: the number of experiments to return
+    :param n: the number of values that `mean_last_n` averages over
+    :param ascending: rank the smallest values first, e.g. for a loss
+    :param filter: only include experiments whose parameters match, see `series_groups.matches`
+    :param metrics_file: path of the metrics file, relative to the experiment
+    :param stop: the max number of experiments to scan
+    :return: list of TopExperiment, best first. Experiments without the key are left out.
+    """
+    from ml_dash.config import DiscoveryArgs
+    assert isabs(cwd), "the current work directory need to be an absolute path."
+    assert agg in AGGREGATES, f"agg needs to be one of {AGGREGATES}."
+    assert k > 0, "k needs to be positive."
+    threads = DiscoveryArgs.discovery_threads
+    metrics_files = [p['path'] for p in mounts.find_files(cwd, "**/" + metrics_file, stop=stop, threads=threads)]
+
+    def rank(path):
+        if filter:
+            flat = read_flat_parameters(mounts.resolve(join(cwd, dirname(path), "parameters.pkl")))
+            if not matches(flat, filter):
+                return None
+        return score(mounts.resolve(join(cwd, path)), key, agg, n)
+
+    values = parallel_map(rank, metrics_files, threads)
+    # note: ties go to the experiment that comes first in the glob.
+    scored = ((v, i) for i, v in enumerate(values) if v is not None)
+    if ascending:
+        top = heapq.nsmallest(k, scored)
+    else:
+        top = heapq.nlargest(k, scored, key=lambda t: (t[0], -t[1]))
+    return [TopExperiment(rank=r + 1, path=join(cwd, dirname(metrics_files[i])), value=v)
+            for r, (v, i) in enumerate(top)]
+
+
+def resolve_top_experiments(_, info, **kwargs):
+    """runs in the default executor when there is an event loop, so that the scan doesn't block it."""
+    from asyncio import get_running_loop
+    from contextvars import copy_context
+    try:
+        loop = get_running_loop()
+    except RuntimeError:
+        return get_top_experiments(**kwargs)
+    return loop.run_in_executor(None, copy_context().run, lambda: get_top_experiments(**kwargs))
+
+
+TopExperimentsArguments = dict(
+    cwd=String(required=True, description="the directory to look for experiments in"),
+    key=String(required=True, description="the metric to rank the experiments by"),
+    agg=String(description="one of last, max, min or mean_last_n. Defaults to last"),
+    k=Int(description="the number of experiments to return. Defaults to 20"),
+    n=Int(description="the number of values that mean_last_n averages over. Defaults to 10"),
+    ascending=Boolean(description="rank the smallest values first, e.g. for a loss"),
+    filter=GenericScalar(description="{key: value} or {key: [values]}, to only include matching experiments"),
+    metrics_file=String(description="the metrics file, relative to each experiment. Defaults to metrics.pkl"),
+    stop=Int(description="the max number of experiments to scan"),
+)
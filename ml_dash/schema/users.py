@@ -1,4 +1,3 @@
-from os.path import isfile
 from graphene import ObjectType, relay, String
 from ml_dash import schema
 
@@ -26,9 +25,9 @@ class User(ObjectType):
 
 
 def get_users(ids=None):
-    import os
-    from ml_dash.config import Args
-    return [User(username=_, name="Ge Yang") for _ in os.listdir(Args.logdir) if not isfile(_)]
+    from ml_dash import mounts
+    dirs, files = mounts.list_dir("/")
+    return [User(username=_, name="Ge Yang") for _ in dirs]
 
 
 def get_user(username):
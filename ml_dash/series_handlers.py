@@ -0,0 +1,58 @@
+import re
+
+from sanic import response
+
+from ml_dash.admission import client_id, get_controller, AdmissionTimeoutError
+from ml_dash.memory_budget import memory_budget, MemoryLimitError
+from ml_dash.process_pool import PoolTimeoutError
+from ml_dash.query_budget import series_cost, deadline, QueryCostError, QueryDeadlineError
+
+
+def snake_case(key):
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()
+
+
+async def get_series_binary(request):
+    """
+    returns a series in the binary layout of `pack_series`, instead of JSON.
+
+    The body takes the same arguments as the `series` GraphQL query, in camelCase, plus
+
+    - stats: list of `mean`, `median`, `min`, `max`, `pc25`, `pc75`, `pc05`, `pc95`, `count`
+    - dtype: `float32` or `float64`
+    """
+    from ml_dash.config import MemoryArgs, QueryArgs
+    from ml_dash.schema.files.series import get_series_async, pack_series, SeriesArguments, SERIES_STATS
+
+    try:
+        data = dict(request.json or {})
+        stats = data.pop('stats', None) or ["mean"]
+        dtype = data.pop('dtype', None) or "float64"
+        kwargs = {snake_case(k): v for k, v in data.items()}
+        unknown = [k for k in kwargs if k not in SeriesArguments]
+        assert not unknown, f"{unknown} are not series arguments."
+        assert isinstance(stats, list), f"stats {stats} should be a list of {[*SERIES_STATS.keys()]}."
+        unknown = [s for s in stats if s not in SERIES_STATS]
+        assert not unknown, f"{unknown} are not stats. Use {[*SERIES_STATS.keys()]}."
+        assert dtype in ["float32", "float64"], f"dtype {dtype} should be OneOf['float32', 'float64']"
+        kwargs.pop('warning', None)
+
+        cost = series_cost(len(kwargs.get('metrics_files') or []), kwargs.get('k'))
+        if QueryArgs.max_query_cost and cost > QueryArgs.max_query_cost:
+            raise QueryCostError(f"The estimated query cost {cost} exceeds the budget of "
+                                 f"{QueryArgs.max_query_cost}. Pass `k` to reduce it.")
+
+        async with get_controller().admit(client_id(request), cost):
+            with deadline(QueryArgs.query_deadline), \
+                    memory_budget(MemoryArgs.soft_memory_limit, MemoryArgs.hard_memory_limit):
+                series = await get_series_async(**kwargs)
+        if series is None:
+            return response.text('Not found', status=404)
+        body = pack_series(series, stats, dtype)
+    except (AssertionError, KeyError, QueryCostError, MemoryLimitError) as e:
+        return response.json({'errors': [{'message': str(e)}]}, status=400)
+    except AdmissionTimeoutError as e:
+        return response.json({'errors': [{'message': str(e)}]}, status=503, headers={'Retry-After': '5'})
+    except (QueryDeadlineError, PoolTimeoutError) as e:
+        return response.json({'errors': [{'message': str(e)}]}, status=503)
+    return response.raw(body, content_type='application/octet-stream')
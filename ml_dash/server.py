@@ -1,8 +1,13 @@
 from sanic import Sanic, views
 from sanic_cors import CORS
-from sanic_graphql import GraphQLView
 
+from ml_dash.admission import get_metrics
+from ml_dash.compression import compress_response, serve_precompressed
+from ml_dash.file_handlers import deletion_job
+from ml_dash.graphql_view import DashGraphQLView
 from ml_dash.schema import schema
+from ml_dash.series_handlers import get_series_binary
+from ml_dash.startup import warm_up_after_start
 
 # to support HTTPS.
 views.HTTP_METHODS += ('FETCH', 'OPTIONS')
@@ -17,16 +22,26 @@ CORS(app, resources={r"/*": {"origins": "*"}}, automatic_options=True)
 #     app.add_route(GraphQLView.as_view(schema=schema, executor=AsyncioExecutor(loop=loop)), '/graphql')
 
 # new graphQL endpoints
-app.add_route(GraphQLView.as_view(schema=schema, graphiql=True), '/graphql',
+app.add_route(DashGraphQLView.as_view(schema=schema, graphiql=True), '/graphql',
               methods=['GET', 'POST', 'FETCH', 'OPTIONS'])
-app.add_route(GraphQLView.as_view(schema=schema, batch=True), '/graphql/batch',
+app.add_route(DashGraphQLView.as_view(schema=schema, batch=True), '/graphql/batch',
               methods=['GET', 'POST', 'FETCH', 'OPTIONS'])
+app.add_route(get_series_binary, '/series', methods=['POST', 'FETCH', 'OPTIONS'])
+app.add_route(get_metrics, '/metrics', methods=['GET'])
+app.add_route(deletion_job, '/deletions/<job_id>', methods=['GET', 'DELETE'])
+
+app.register_middleware(serve_precompressed, 'request')
+app.register_middleware(compress_response, 'response')
+app.register_listener(warm_up_after_start, 'after_server_start')
 
 
 @app.listener('before_server_start')
 def setup_static(app, loop):
     from ml_dash import config
     from os.path import expanduser
+    # note: the listener runs again each time the app is restarted, as in the test client.
+    if any(uri.startswith('/files') for uri in app.router.routes_all):
+        return
     app.static('/files', expanduser(config.Args.logdir),
                use_modified_since=True, use_content_range=True, stream_large_files=True)
 
@@ -0,0 +1,176 @@
+"""
+Cross-process cache of decoded metric columns.
+
+Sanic forks one process per worker, and each would otherwise decode and hold its
+own copy of the same hot metrics files. Instead, the first worker to decode a file
+publishes its columns as `.npy` files in `SharedCacheArgs.shared_cache_dir`
+(ideally on a tmpfs such as `/dev/shm`), and every worker memory-maps them.
+The page cache holds a single copy, however many workers there are.
+
+- The index is the cache directory itself: an entry is named after the hash of the
+  file's path, mtime and size, so appending to a metrics file makes a new entry.
+- Entries are written to a temporary directory and published with an atomic rename.
+- The kernel reference-counts the mappings: evicting an entry unlinks its files,
+  and workers that still map them keep reading valid pages until they let go.
+- Columns are mapped copy-on-write, so in-place edits stay private to a worker.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from os.path import join, isdir
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# column dtypes that can be stored as plain .npy files.
+SHAREABLE_KINDS = "biufcmM"
+
+
+def enabled():
+    from ml_dash.config import SharedCacheArgs
+    return bool(SharedCacheArgs.shared_cache_dir)
+
+
+def cache_dir():
+    from ml_dash.config import SharedCacheArgs
+    return SharedCacheArgs.shared_cache_dir
+
+
+def entry_key(path):
+    from ml_dash import storage
+    try:
+        s = storage.stat(path)
+    except OSError:
+        return None
+    return hashlib.sha1(f"{storage.realpath(path)}:{s.etag}".encode()).hexdigest()
+
+
+def load(path):
+    """
+    returns the cached DataFrame of the file, or None on a miss.
+
+    :param path: the absolute path to the metrics file
+    """
+    import pandas as pd
+    key = entry_key(path)
+    if key is None:
+        return None
+    entry = join(cache_dir(), key)
+    try:
+        with open(join(entry, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        columns = {c['name']: np.load(join(entry, c['file']), mmap_mode='c') for c in manifest['columns']}
+    except (OSError, ValueError):
+        return None
+    # note: touch the entry, for the LRU eviction.
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    # note: copy=False keeps each column as its own block over the mapped file.
+    return pd.DataFrame(columns, index=pd.RangeIndex(manifest['rows']), copy=False)
+
+
+def publish(path, df):
+    """
+    writes the columns of the DataFrame into the cache, for the other workers.
+
+    Skips frames with columns that don't have a fixed-size dtype (strings, objects).
+    This only fills the cache: errors such as a full disk are logged, and return False.
+    """
+    key = entry_key(path)
+    if key is None or df is None:
+        return False
+    if not all(dtype.kind in SHAREABLE_KINDS for dtype in df.dtypes):
+        return False
+
+    root = cache_dir()
+    entry = join(root, key)
+    if isdir(entry):
+        return True
+
+    # note: threads of the same worker can publish the same entry at once.
+    tmp = join(root, f"{key}.tmp-{os.getpid()}-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(tmp)
+        columns, nbytes = [], 0
+        for i, (name, column) in enumerate(df.items()):
+            values = np.ascontiguousarray(column.to_numpy())
+            np.save(join(tmp, f"{i}.npy"), values)
+            columns.append(dict(name=name, file=f"{i}.npy", dtype=str(values.dtype)))
+            nbytes += values.nbytes
+        with open(join(tmp, MANIFEST), 'w') as f:
+            json.dump(dict(path=path, rows=len(df), nbytes=nbytes, columns=columns), f)
+    except OSError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        logger.warning("could not publish %s to the shared cache: %s", path, e)
+        return False
+
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # note: another worker published the same entry first.
+        shutil.rmtree(tmp, ignore_errors=True)
+        return True
+
+    try:
+        evict()
+    except OSError as e:
+        logger.warning("could not evict from the shared cache: %s", e)
+    return True
+
+
+@contextmanager
+def index_lock():
+    os.makedirs(cache_dir(), exist_ok=True)
+    with open(join(cache_dir(), ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def entries():
+    """returns (mtime, nbytes, path) of the published entries."""
+    root = cache_dir()
+    _ = []
+    for name in os.listdir(root):
+        entry = join(root, name)
+        if name.startswith('.') or '.tmp-' in name:
+            continue
+        try:
+            with open(join(entry, MANIFEST), 'r') as f:
+                nbytes = json.load(f)['nbytes']
+            _.append((os.stat(entry).st_mtime, nbytes, entry))
+        except (OSError, ValueError):
+            continue
+    return _
+
+
+def evict(max_bytes=None):
+    """removes the least recently used entries, until the cache fits in max_bytes."""
+    from ml_dash.config import SharedCacheArgs
+    max_bytes = SharedCacheArgs.shared_cache_size if max_bytes is None else max_bytes
+    with index_lock():
+        lru = sorted(entries())
+        total = sum(nbytes for mtime, nbytes, entry in lru)
+        for mtime, nbytes, entry in lru:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= nbytes
+
+        # note: clean up after workers that died while publishing.
+        for name in os.listdir(cache_dir()):
+            tmp = join(cache_dir(), name)
+            if '.tmp-' in name and time.time() - os.stat(tmp).st_mtime > 3600:
+                shutil.rmtree(tmp, ignore_errors=True)
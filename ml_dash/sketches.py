@@ -0,0 +1,119 @@
+"""
+Mergeable quantile sketches, for approximate series over many long runs.
+
+The exact series pools every run into one frame, and sorts each bin to find its
+percentiles. Instead, `sketch_run` summarizes one run at a time into a fixed
+number of fine x-bins. Each bin keeps its count, sum, sum of squares, min, max
+and `points` evenly spaced quantiles. `merge` then pools these summaries into
+the k bins of the series. It treats the quantile points of a fine bin as a
+weighted sample of that bin.
+
+The memory is O(runs × bins × points) instead of O(runs × steps). A sketch does
+not depend on the other runs or on k, so it can be cached per file. The rank
+error of a quantile is about 1 / points for each fine bin.
+"""
+import numpy as np
+
+STATS = ["count", "mean", "std", "min", "5%", "25%", "50%", "75%", "95%", "max"]
+PERCENTILES = {"5%": .05, "25%": .25, "50%": .5, "75%": .75, "95%": .95}
+
+
+class Sketch:
+    """the summary of one y key of one run, in fine x-bins."""
+
+    def __init__(self, centers, counts, sums, sumsqs, mins, maxs, points):
+        self.centers = centers
+        self.counts = counts
+        self.sums = sums
+        self.sumsqs = sumsqs
+        self.mins = mins
+        self.maxs = maxs
+        # note: (bins, n_points), the evenly spaced quantiles of each bin.
+        self.points = points
+
+
+def sketch_run(x, y, bins=1024, points=16):
+    """
+    :param x: the x values of the run, as floats
+    :param y: the y values of the run. NaNs are skipped.
+    :param bins: the number of equal-width x-bins over the range of the run
+    :param points: the number of quantiles kept for each bin
+    :return: Sketch
+    """
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    if not len(x):
+        return Sketch(*[np.empty(0)] * 6, np.empty((0, points)))
+
+    low, high = x.min(), x.max()
+    edges = np.linspace(low, high, bins + 1)
+    ids = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, bins - 1)
+
+    counts = np.bincount(ids, minlength=bins)
+    sums = np.bincount(ids, weights=y, minlength=bins)
+    sumsqs = np.bincount(ids, weights=y * y, minlength=bins)
+
+    # note: sort by bin, then by value. The quantiles of a bin are then at
+    #  evenly spaced ranks within its slice.
+    order = np.lexsort((y, ids))
+    y_sorted = y[order]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.round(np.linspace(0, 1, points)[None, :] * (counts[:, None] - 1)).astype(int)
+    filled = counts > 0
+    inds = (starts[:, None] + np.clip(ranks, 0, None))[filled]
+
+    centers = (0.5 * (edges[:-1] + edges[1:]))[filled]
+    quantiles = y_sorted[inds]
+    return Sketch(centers, counts[filled].astype(float), sums[filled], sumsqs[filled],
+                  quantiles[:, 0], quantiles[:, -1], quantiles)
+
+
+def merge(sketches, edges):
+    """
+    pools the sketches of many runs into the bins of the series.
+
+    :param sketches: list of Sketch
+    :param edges: the k + 1 edges of the bins
+    :return: {stat: array} with the stats of `describe()` for each bin. Empty bins have a count of 0.
+    """
+    centers = np.concatenate([s.centers for s in sketches])
+    k = len(edges) - 1
+    ids = np.clip(np.searchsorted(edges, centers, side='right') - 1, 0, k - 1)
+
+    def total(attr):
+        return np.bincount(ids, weights=np.concatenate([getattr(s, attr) for s in sketches]), minlength=k)
+
+    counts, sums, sumsqs = total('counts'), total('sums'), total('sumsqs')
+    filled = counts > 0
+
+    mins, maxs = np.full(k, np.inf), np.full(k, -np.inf)
+    np.minimum.at(mins, ids, np.concatenate([s.mins for s in sketches]))
+    np.maximum.at(maxs, ids, np.concatenate([s.maxs for s in sketches]))
+
+    stats = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+        # note: the sample standard deviation, like pandas.
+        var = (sumsqs - counts * mean ** 2) / (counts - 1)
+    stats['count'], stats['mean'], stats['min'], stats['max'] = counts, mean, mins, maxs
+    stats['std'] = np.sqrt(np.clip(var, 0, None))
+
+    # note: weighted quantiles of all the points that fall into each bin. After sorting by
+    #  (bin, value), `bin + cumulative weight / weight of the bin` increases monotonically,
+    #  so one searchsorted finds the quantile of every bin at once.
+    n_points = sketches[0].points.shape[1] if sketches else 1
+    values = np.concatenate([s.points for s in sketches]).ravel()
+    weights = np.repeat(np.concatenate([s.counts for s in sketches]) / n_points, n_points)
+    groups = np.repeat(ids, n_points)
+    order = np.lexsort((values, groups))
+    values, weights, groups = values[order], weights[order], groups[order]
+    cumulative = np.cumsum(weights)
+    before = np.concatenate([[0], np.cumsum(counts)])[groups]
+    position = groups + (cumulative - before) / counts[groups]
+    for stat, q in PERCENTILES.items():
+        inds = np.searchsorted(position, np.arange(k) + q - 1e-12)
+        stats[stat] = values[np.clip(inds, 0, len(values) - 1)] if len(values) else np.full(k, np.nan)
+
+    for stat in STATS:
+        stats[stat] = np.where(filled, stats[stat], 0 if stat == "count" else np.nan)
+    return stats
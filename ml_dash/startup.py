@@ -0,0 +1,93 @@
+"""
+Cold-start helpers for `ml_dash.server`.
+
+The server defers pandas, numpy, ruamel.yaml, ml_logger and tqdm until a
+resolver needs them, so that workers bind and accept traffic quickly.
+`warm_up` imports them in the background after the server has started, so
+that the first request does not pay for them either.
+
+To see what importing the server costs, run
+
+    python -m ml_dash.startup --top 20
+"""
+import subprocess
+import sys
+import time
+
+# imported in this order by `warm_up`. Anything that fails to import is skipped.
+WARM_UP_MODULES = [
+    "numpy",
+    "pandas",
+    "ruamel.yaml",
+    "ml_logger.helpers",
+]
+
+
+def warm_up(modules=None):
+    """
+    imports the heavy modules that the resolvers use.
+
+    :param modules: the modules to import. Defaults to WARM_UP_MODULES
+    :return: dict of module name to seconds it took to import, None when missing
+    """
+    from importlib import import_module
+    timings = {}
+    for name in modules or WARM_UP_MODULES:
+        t0 = time.perf_counter()
+        try:
+            import_module(name)
+            timings[name] = time.perf_counter() - t0
+        except ImportError:
+            timings[name] = None
+    return timings
+
+
+async def warm_up_after_start(app, loop):
+    from ml_dash.config import StartupArgs
+    if StartupArgs.warm_up:
+        # note: run in a thread, so that the worker accepts requests right away.
+        loop.run_in_executor(None, warm_up)
+
+
+def import_times(module="ml_dash.server", python=sys.executable):
+    """
+    imports the module in a fresh interpreter with `-X importtime`.
+
+    :return: list of (module, self_us, cumulative_us), in import order
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def import_report(module="ml_dash.server", top=15):
+    timings = import_times(module)
+    total = next((c for name, _, c in timings if name == module), None)
+    lines = [f"importing {module} took {total / 1000:.1f} ms" if total else f"could not import {module}", ""]
+
+    # note: the top-level packages, by cumulative time.
+    packages = {}
+    for name, _, cumulative in timings:
+        if "." not in name and name != module:
+            packages[name] = max(packages.get(name, 0), cumulative)
+    lines.append(f"{'package':<40} {'cumulative (ms)':>16}")
+    for name, cumulative in sorted(packages.items(), key=lambda t: -t[1])[:top]:
+        lines.append(f"{name:<40} {cumulative / 1000:>16.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from params_proto import ParamsProto, Proto
+
+
+    class ReportArgs(ParamsProto):
+        top = Proto(15, help="the number of packages to show in the import-time report")
+
+
+    print(import_report(top=ReportArgs.top))
@@ -0,0 +1,665 @@
+"""
+Storage drivers, so that the logs can live on an object store as well as on disk.
+
+A physical path is either a local path or a url, as in `s3://bucket/prefix/run/metrics.pkl`.
+The roots of the mount table can be urls (see `mounts`). The readers go through `open`,
+`stat`, `list_dir`, `glob`, `read`, `write` and `delete` here, which pick the driver from
+the scheme of the path, and `register` adds drivers for other schemes.
+
+The S3 driver works with any S3 API, such as MinIO, through `StorageArgs.s3_endpoint`.
+It needs boto3, which is only imported once a url is used. Its files are seekable, and
+read the object in ranged GETs of `StorageArgs.block_size` bytes. The blocks are kept in
+a bounded local cache, keyed by the ETag of the object, so a rewritten object never
+reads stale blocks. Object stores have no directories, so listings of a prefix are never
+cached, and `stat` results are kept for `StorageArgs.stat_ttl` seconds.
+"""
+import hashlib
+import io
+import os
+import pathlib
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+Stat = namedtuple("Stat", ["size", "mtime", "ctime", "is_dir", "etag"])
+# an event that stops the local globs of the context from listing more directories, see `stop_on`.
+_stopped = ContextVar("glob_stopped", default=None)
+
+
+def is_url(path):
+    return isinstance(path, str) and "://" in path
+
+
+def realpath(path):
+    return path if is_url(path) else os.path.realpath(path)
+
+
+def stopped():
+    """whether the walk of the context was stopped, see `stop_on`."""
+    event = _stopped.get()
+    return event is not None and event.is_set()
+
+
+def glob_regex(query):
+    """the regex of a glob query, with the semantics of `pathlib.Path.glob`."""
+    regex = ""
+    for segment in query.strip('/').split('/'):
+        if segment == '**':
+            regex += "(?:[^/]+/)*"
+            continue
+        # note: unlike in fnmatch, wildcards do not match across directories.
+        for part in re.split(r"(\*|\?|\[[^\]]*\])", segment):
+            if part == '*':
+                regex += "[^/]*"
+            elif part == '?':
+                regex += "[^/]"
+            elif part.startswith('[') and len(part) > 2:
+                regex += "[^" + part[2:] if part[1] == '!' else part
+            else:
+                regex += re.escape(part)
+        regex += '/'
+    return re.compile(regex.rstrip('/') + r'\Z')
+
+
+class LocalDriver:
+    def stat(self, path):
+        import stat
+        s = os.stat(path)
+        return Stat(s.st_size, s.st_mtime, s.st_ctime, stat.S_ISDIR(s.st_mode), f"{s.st_mtime_ns}-{s.st_size}")
+
+    def signature(self, path):
+        try:
+            s = os.stat(path)
+            return s.st_mtime_ns, s.st_size
+        except OSError:
+            return None
+
+    def open(self, path, mode='rb'):
+        return io.open(path, mode)
+
+    def read(self, path, start=0, stop=None):
+        with io.open(path, 'rb') as f:
+            f.seek(start)
+            return f.read() if stop is None else f.read(stop - start)
+
+    def list_dir(self, path):
+        dirs, files = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                (files if entry.is_file() else dirs).append(entry.name)
+        return dirs, files
+
+    def glob(self, root, query):
+        """
+        same as `pathlib.Path.glob`, in the same order, but tracks every directory it
+        lists. A new file then shows up as a change to a tracked directory, even in
+        directories that had no matches before.
+        """
+        segments = [s for s in query.split('/') if s]
+        if not segments:
+            raise ValueError(f"Unacceptable pattern: {query!r}")
+        yield from self.select(root, pathlib.PurePath(), segments)
+
+    def scandir(self, path):
+        from ml_dash.response_cache import track
+        if stopped():
+            return []
+        track(path)
+        try:
+            with os.scandir(path) as it:
+                return list(it)
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            return []
+
+    def subdirs(self, path):
+        """the entries of the directories in the directory. Does not follow symlinks, as in pathlib."""
+        dirs = []
+        for entry in self.scandir(path):
+            try:
+                if entry.is_dir() and not entry.is_symlink():
+                    dirs.append(entry)
+            except OSError:
+                continue
+        return dirs
+
+    def walk_dirs(self, path, rel):
+        """the directory and the directories under it, parents first."""
+        yield path, rel
+        for entry in self.subdirs(path):
+            if stopped():
+                return
+            yield from self.walk_dirs(entry.path, rel / entry.name)
+
+    def select(self, path, rel, segments):
+        from ml_dash.response_cache import track
+        segment, rest = segments[0], segments[1:]
+        if segment == '**':
+            # note: `**` at the end only matches directories.
+            seen = set()
+            for d, d_rel in self.walk_dirs(path, rel):
+                for file in self.select(d, d_rel, rest) if rest else [d_rel]:
+                    if file not in seen:
+                        seen.add(file)
+                        yield file
+        elif not re.search(r"[*?\[]", segment):
+            child = os.path.join(path, segment)
+            track(child)
+            if rest and os.path.isdir(child):
+                yield from self.select(child, rel / segment, rest)
+            elif not rest and os.path.lexists(child):
+                yield rel / segment
+        else:
+            pattern = glob_regex(segment)
+            for entry in self.scandir(path):
+                try:
+                    if rest and not entry.is_dir():
+                        continue
+                except OSError:
+                    continue
+                if pattern.match(entry.name):
+                    if rest:
+                        yield from self.select(entry.path, rel / entry.name, rest)
+                    else:
+                        yield rel / entry.name
+
+    def write(self, path, data):
+        with io.open(path, 'w' if isinstance(data, str) else 'wb') as f:
+            f.write(data)
+
+    def delete(self, path):
+        """removes a file. Directories are deleted by `deletion_jobs`."""
+        os.remove(path)
+
+
+def not_found(e):
+    code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+    return code in ['404', 'NoSuchKey', 'NotFound', 'NoSuchBucket']
+
+
+class S3Driver:
+    """
+    :param client: the S3 client. Defaults to a boto3 client for `StorageArgs.s3_endpoint`.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise ImportError("s3:// paths need boto3. Install it with `pip install boto3`.") from e
+            from ml_dash.config import StorageArgs
+            self._client = boto3.client("s3", endpoint_url=StorageArgs.s3_endpoint or None)
+        return self._client
+
+    @staticmethod
+    def split(url):
+        """:return: (bucket, key)"""
+        bucket, _, key = url.split("://", 1)[1].partition('/')
+        return bucket, key.strip('/')
+
+    def list_keys(self, url, delimiter=None):
+        """yields the pages of the listing of the prefix, as (keys, prefixes) relative to it."""
+        bucket, key = self.split(url)
+        prefix = key + '/' if key else ''
+        kwargs = dict(Bucket=bucket, Prefix=prefix)
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        while True:
+            r = self.client.list_objects_v2(**kwargs)
+            keys = [o['Key'][len(prefix):] for o in r.get('Contents', []) if o['Key'] != prefix]
+            prefixes = [p['Prefix'][len(prefix):].rstrip('/') for p in r.get('CommonPrefixes', [])]
+            yield keys, prefixes
+            if not r.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = r['NextContinuationToken']
+
+    def stat(self, url):
+        from ml_dash.config import StorageArgs
+        now = time.time()
+        with self._lock:
+            cached = self._stats.get(url)
+        if cached is not None and now - cached[0] < StorageArgs.stat_ttl:
+            if cached[1] is None:
+                raise FileNotFoundError(url)
+            return cached[1]
+
+        bucket, key = self.split(url)
+        s = None
+        if key:
+            try:
+                r = self.client.head_object(Bucket=bucket, Key=key)
+                mtime = r['LastModified'].timestamp()
+                s = Stat(r['ContentLength'], mtime, mtime, False, r['ETag'].strip('"'))
+            except Exception as e:
+                if not not_found(e):
+                    raise
+        if s is None:
+            r = self.client.list_objects_v2(Bucket=bucket, Prefix=key + '/' if key else '', MaxKeys=1)
+            if r.get('KeyCount') or r.get('Contents'):
+                s = Stat(0, None, None, True, None)
+
+        with self._lock:
+            if len(self._stats) > 4096:
+                self._stats.clear()
+            self._stats[url] = now, s
+        if s is None:
+            raise FileNotFoundError(url)
+        return s
+
+    def signature(self, url):
+        try:
+            s = self.stat(url)
+        except FileNotFoundError:
+            return None
+        # note: a prefix changes without a trace, so its signature never matches.
+        return (s.etag, s.size) if not s.is_dir else ("prefix", time.time_ns())
+
+    def forget(self, url):
+        with self._lock:
+            self._stats.pop(url, None)
+
+    def open(self, url, mode='rb'):
+        s = self.stat(url)
+        if s.is_dir:
+            raise IsADirectoryError(url)
+        from ml_dash.config import StorageArgs
+        f = io.BufferedReader(BlockReader(self, url, s), buffer_size=StorageArgs.block_size)
+        return io.TextIOWrapper(f, encoding='utf-8') if 'b' not in mode else f
+
+    def read_block(self, url, etag, index):
+        from ml_dash.config import StorageArgs
+        size = StorageArgs.block_size
+        key = f"{url}:{etag}:{size}:{index}"
+        block = get_block_cache().get(key)
+        if block is None:
+            block = self.read(url, index * size, (index + 1) * size)
+            get_block_cache().put(key, block)
+        return block
+
+    def read(self, url, start=0, stop=None):
+        bucket, key = self.split(url)
+        _range = f"bytes={start}-" if stop is None else f"bytes={start}-{stop - 1}"
+        try:
+            r = self.client.get_object(Bucket=bucket, Key=key, Range=_range)
+        except Exception as e:
+            if not_found(e):
+                raise FileNotFoundError(url) from e
+            # note: a range that starts at the end of the object.
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'InvalidRange':
+                return b""
+            raise
+        return r['Body'].read()
+
+    def list_dir(self, url):
+        dirs, files = [], []
+        for keys, prefixes in self.list_keys(url, delimiter='/'):
+            dirs.extend(prefixes)
+            files.extend(keys)
+        if not dirs and not files and not self.stat(url).is_dir:
+            raise NotADirectoryError(url)
+        return dirs, files
+
+    def glob(self, root, query):
+        # note: the literal directories at the start of the query narrow down the listing.
+        segments = query.strip('/').split('/')
+        literal = []
+        while len(segments) > 1 and not re.search(r"[*?\[]", segments[0]):
+            literal.append(segments.pop(0))
+        if literal:
+            root = root.rstrip('/') + '/' + '/'.join(literal)
+        pattern = glob_regex('/'.join(segments))
+        paths = set()
+        for keys, _ in self.list_keys(root):
+            for key in keys:
+                parts = key.split('/')
+                # note: the directories of an object store are the prefixes of its keys.
+                paths.update('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        for path in sorted(paths):
+            if pattern.match(path):
+                yield pathlib.PurePosixPath(*literal, path)
+
+    def write(self, url, data):
+        bucket, key = self.split(url)
+        self.client.put_object(Bucket=bucket, Key=key, Body=data.encode() if isinstance(data, str) else data)
+        self.forget(url)
+
+    def delete(self, url):
+        bucket, key = self.split(url)
+        self.client.delete_object(Bucket=bucket, Key=key)
+        self.forget(url)
+
+    def delete_prefix(self, url, job=None):
+        """deletes every object under the prefix, 1000 at a time, checking the job for cancellation."""
+        bucket, key = self.split(url)
+        while True:
+            if job is not None:
+                job.check()
+            # note: list from the start each time, instead of paging through keys that are gone.
+            keys, _ = next(self.list_keys(url))
+            if not keys:
+                break
+            objects = [dict(Key=f"{key}/{k}" if key else k) for k in keys]
+            r = self.client.delete_objects(Bucket=bucket, Delete=dict(Objects=objects, Quiet=True))
+            if r and r.get('Errors'):
+                raise OSError(f"could not delete {len(r['Errors'])} objects under {url}")
+            if job is not None:
+                job.count(len(keys))
+        self.forget(url)
+
+
+class BlockReader(io.RawIOBase):
+    """a seekable, read-only file over the blocks of an object."""
+
+    def __init__(self, driver, url, stat):
+        self.driver = driver
+        self.url = url
+        self.stat = stat
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.stat.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.pos = offset
+        return self.pos
+
+    def readinto(self, b):
+        from ml_dash.config import StorageArgs
+        if self.pos >= self.stat.size:
+            return 0
+        index, offset = divmod(self.pos, StorageArgs.block_size)
+        block = self.driver.read_block(self.url, self.stat.etag, index)
+        n = min(len(b), len(block) - offset)
+        if n <= 0:
+            return 0
+        b[:n] = block[offset:offset + n]
+        self.pos += n
+        return n
+
+
+class BlockCache:
+    """
+    LRU of the blocks read from object stores, bounded to `size` bytes.
+
+    :param directory: keeps the blocks in files here, which all of the workers share.
+        The limit then holds for the directory as a whole: after each write, the
+        oldest blocks are evicted under a file lock, as in `shared_cache.evict`.
+        The blocks stay in memory, per worker, when it is empty.
+    """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def file(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        if self.directory:
+            file = self.file(key)
+            try:
+                with io.open(file, 'rb') as f:
+                    block = f.read()
+                # note: touch the block, for the LRU eviction.
+                os.utime(file)
+            except OSError:
+                # note: another worker may have evicted the block.
+                block = None
+        else:
+            with self._lock:
+                block = self.entries.get(key)
+                if block is not None:
+                    self.entries.move_to_end(key)
+        with self._lock:
+            if block is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return block
+
+    def put(self, key, block):
+        if len(block) > self.size:
+            return
+        if not self.directory:
+            with self._lock:
+                self._drop(key)
+                self.entries[key] = block
+                self.nbytes += len(block)
+                while self.nbytes > self.size and self.entries:
+                    self._drop(next(iter(self.entries)))
+            return
+        file = self.file(key)
+        tmp = f"{file}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with io.open(tmp, 'wb') as f:
+                f.write(block)
+            os.replace(tmp, file)
+            self.evict()
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _drop(self, key):
+        block = self.entries.pop(key, None)
+        if block is not None:
+            self.nbytes -= len(block)
+
+    @contextmanager
+    def file_lock(self):
+        import fcntl
+        with io.open(os.path.join(self.directory, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def blocks(self):
+        """returns (mtime, nbytes, path) of the block files."""
+        _ = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.') or '.tmp-' in entry.name:
+                    continue
+                try:
+                    s = entry.stat()
+                except OSError:
+                    continue
+                _.append((s.st_mtime, s.st_size, entry.path))
+        return _
+
+    def evict(self, max_bytes=None):
+        """removes the least recently used blocks of all of the workers, until the directory fits in max_bytes."""
+        max_bytes = self.size if max_bytes is None else max_bytes
+        with self.file_lock():
+            lru = sorted(self.blocks())
+            total = sum(nbytes for mtime, nbytes, path in lru)
+            for mtime, nbytes, path in lru:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= nbytes
+
+            # note: clean up after workers that died while writing.
+            for name in os.listdir(self.directory):
+                tmp = os.path.join(self.directory, name)
+                try:
+                    if '.tmp-' in name and time.time() - os.stat(tmp).st_mtime > 3600:
+                        os.remove(tmp)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = 0
+        if self.directory and os.path.isdir(self.directory):
+            self.evict(0)
+
+
+_block_cache = None
+
+
+def get_block_cache():
+    global _block_cache
+    from ml_dash.config import StorageArgs
+    settings = StorageArgs.block_cache_dir, StorageArgs.block_cache_size
+    if _block_cache is None or (_block_cache.directory, _block_cache.size) != settings:
+        _block_cache = BlockCache(*settings)
+    return _block_cache
+
+
+_local = LocalDriver()
+_drivers = {}
+DRIVERS = dict(s3=S3Driver)
+
+
+def register(scheme, driver=None):
+    """uses the driver for the urls of the scheme. None goes back to the default driver."""
+    if driver is None:
+        _drivers.pop(scheme, None)
+    else:
+        _drivers[scheme] = driver
+
+
+def get_driver(path):
+    if not is_url(path):
+        return _local
+    scheme = path.split("://", 1)[0]
+    if scheme not in _drivers:
+        if scheme not in DRIVERS:
+            raise ValueError(f"there is no storage driver for {scheme}:// paths.")
+        _drivers[scheme] = DRIVERS[scheme]()
+    return _drivers[scheme]
+
+
+def stat(path):
+    """:raises FileNotFoundError: when there is no such file or directory."""
+    return get_driver(path).stat(path)
+
+
+def signature(path):
+    """what changes when the file changes, for the caches. None when it does not exist."""
+    return get_driver(path).signature(path)
+
+
+def exists(path):
+    try:
+        stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def isdir(path):
+    try:
+        return stat(path).is_dir
+    except OSError:
+        return False
+
+
+def isfile(path):
+    try:
+        return not stat(path).is_dir
+    except OSError:
+        return False
+
+
+def open(path, mode='rb'):
+    """opens a file for reading. Object stores are only read in binary or text mode."""
+    return get_driver(path).open(path, mode)
+
+
+def read(path, start=0, stop=None):
+    return get_driver(path).read(path, start, stop)
+
+
+def list_dir(path):
+    """:return: (directory names, file names)"""
+    return get_driver(path).list_dir(path)
+
+
+def glob(root, query):
+    """yields the paths under root that match the glob query, relative to root."""
+    return get_driver(root).glob(root, query)
+
+
+@contextmanager
+def stop_on(event):
+    """
+    within the block, local globs stop listing directories once the event is set, and
+    return what they have found so far. For walks whose results are no longer needed.
+    """
+    token = _stopped.set(event)
+    try:
+        yield
+    finally:
+        _stopped.reset(token)
+
+
+def write(path, data):
+    return get_driver(path).write(path, data)
+
+
+def delete(path):
+    return get_driver(path).delete(path)
+
+
+# the local directories that were checked by `private_dir`, and whether they passed.
+_private = {}
+
+
+def private_dir(path, what="shared state"):
+    """
+    creates the local directory with mode 0o700, for state that the workers share.
+
+    :param what: what the directory is for, for the warning.
+    :return: False when it belongs to another user, or is open to others, who could
+        plant files in it. The state should then stay in memory.
+    """
+    import logging
+    import stat
+    if path not in _private:
+        try:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            st = os.stat(path)
+            ok = stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+        except OSError:
+            ok = False
+        if not ok:
+            logging.getLogger(__name__).warning(f"not using %s for {what}: it must be a directory of this user, "
+                                                f"with mode 0o700. Keeping it in memory instead.", path)
+        _private[path] = ok
+    return _private[path]
@@ -53,4 +53,8 @@ setup(name="ml-dash",
           'Sanic-GraphQL',
           "termcolor",
           "typing"
-      ])
+      ],
+      extras_require={
+          "compression": ["brotli", "zstandard"],
+          "s3": ["boto3"],
+      })